@@ -0,0 +1,382 @@
+# app/admissao.py
+import asyncio
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .db import get_collection, marcar_falha
+from .respostas import RespostaJSON
+from .observabilidade import ADMISSAO_ESPERA, ADMISSAO_REJEITADAS, get_logger, log_limitado
+
+log = get_logger("admissao")
+
+# Controle de admissão para os endpoints que chamam o Gemini.
+#
+# Cada requisição passa por:
+# 1. token bucket do usuário naquela rota, por IP + usuário (usuario_id da
+#    query ou header X-Usuario-Id; os dois vêm do cliente);
+# 2. token bucket do IP naquela rota, ADMISSAO_USUARIOS_POR_IP vezes o do
+#    usuário: trocar de usuario_id a cada pedido não passa disso (0 desliga,
+#    ex.: atrás de um proxy sem --proxy-headers, onde todos têm o mesmo IP);
+# 3. token bucket da rota (protege a cota global do Gemini).
+# Se faltar ficha, a requisição espera na fila até ADMISSAO_PRAZO_SEG;
+# passou disso, responde 429 com Retry-After.
+#
+# O teto de chamadas simultâneas ao LLM (LLM_MAX_CONCORRENCIA) não é da
+# rota: é aplicado em cada chamada (vaga_llm, usado por app/llm.py), então
+# vale também para o agendador de resumos, os jobs e os grupos em paralelo
+# do lote de visão. Quem passa de LLM_ESPERA_VAGA_SEG esperando vaga
+# recebe 429; as threads de fundo esperam mais (prazo_vaga_llm).
+#
+# Estado compartilhado entre workers (ADMISSAO_BACKEND):
+# - "memoria": só o processo atual;
+# - "arquivo": buckets num arquivo JSON com lock (fcntl) e vagas de
+#   concorrência como arquivos com flock: vale para todos os workers da máquina;
+# - "mongo": buckets atualizados atomicamente no Mongo (vários hosts);
+#   as vagas de concorrência continuam por arquivo (por máquina).
+
+ADMISSAO_ATIVA = os.getenv("ADMISSAO_ATIVA", "1") != "0"
+ADMISSAO_BACKEND = os.getenv("ADMISSAO_BACKEND", "memoria")
+ADMISSAO_PRAZO_SEG = float(os.getenv("ADMISSAO_PRAZO_SEG", "2"))
+ADMISSAO_DIR = os.getenv("ADMISSAO_DIR", os.path.join(tempfile.gettempdir(), "gs_admissao"))
+ADMISSAO_USUARIOS_POR_IP = float(os.getenv("ADMISSAO_USUARIOS_POR_IP", "20"))
+LLM_MAX_CONCORRENCIA = int(os.getenv("LLM_MAX_CONCORRENCIA", "8"))
+LLM_ESPERA_VAGA_SEG = float(os.getenv("LLM_ESPERA_VAGA_SEG", str(ADMISSAO_PRAZO_SEG)))
+LLM_ESPERA_VAGA_FUNDO_SEG = float(os.getenv("LLM_ESPERA_VAGA_FUNDO_SEG", "60"))
+
+# rota -> (fichas/min por usuário, rajada do usuário, fichas/s da rota, rajada da rota)
+LIMITES: Dict[str, Tuple[float, float, float, float]] = {
+    "/mentor/explicar-tarefa": (10, 5, 5, 10),
+    "/mentor/plano-estudo": (4, 2, 2, 5),
+    "/mentor/refinar-resultado": (10, 5, 5, 10),
+    "/mentor/resumo-uso-ia": (30, 10, 20, 40),
+    "/visao/ambiente-trabalho": (6, 3, 3, 6),
+    "/visao/ambiente-trabalho/lote": (3, 2, 1, 3),
+    # jobs assíncronos: mesma cota; a concorrência é o pool de app/jobs.py
+    "/jobs/visao": (6, 3, 3, 6),
+    "/jobs/plano-estudo": (4, 2, 2, 5),
+}
+
+try:
+    import fcntl  # type: ignore
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+
+# ---------- TOKEN BUCKETS ----------
+
+def _reabastecer(fichas: float, ts: float, agora: float, taxa: float, capacidade: float) -> float:
+    return min(capacidade, fichas + max(0.0, agora - ts) * taxa)
+
+
+class BucketsMemoria:
+    # consumir() não faz I/O: pode rodar direto no event loop
+    bloqueante = False
+
+    def __init__(self):
+        # chave -> (fichas, ts, cheio_em), em ordem de último uso
+        self._estado: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _podar(self, agora: float) -> None:
+        # bucket que já voltou a encher é igual a um novo: pode sair.
+        # Olha só o começo (os menos usados), então custa O(1) amortizado.
+        while self._estado:
+            chave, (_, _, cheio_em) = next(iter(self._estado.items()))
+            if cheio_em > agora:
+                break
+            del self._estado[chave]
+
+    def consumir(self, chave: str, taxa: float, capacidade: float) -> float:
+        """
+        Tenta gastar uma ficha. Retorna 0 se conseguiu, senão os segundos até a próxima ficha.
+        """
+        agora = time.time()
+        with self._lock:
+            self._podar(agora)
+            fichas, ts, _ = self._estado.get(chave, (capacidade, agora, agora))
+            fichas = _reabastecer(fichas, ts, agora, taxa, capacidade)
+            espera = 0.0
+            if fichas >= 1:
+                fichas -= 1
+            else:
+                espera = (1 - fichas) / taxa
+            self._estado[chave] = (fichas, agora, agora + (capacidade - fichas) / taxa)
+            self._estado.move_to_end(chave)
+            return espera
+
+    def __len__(self) -> int:
+        return len(self._estado)
+
+
+class BucketsArquivo:
+    """
+    Buckets num único arquivo JSON, lido/escrito sob flock exclusivo.
+    """
+
+    bloqueante = True
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self._lock = threading.Lock()
+
+    def consumir(self, chave: str, taxa: float, capacidade: float) -> float:
+        agora = time.time()
+        with self._lock, open(self.caminho, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                conteudo = f.read()
+                estado = json.loads(conteudo) if conteudo else {}
+                fichas, ts = estado.get(chave, (capacidade, agora))
+                fichas = _reabastecer(fichas, ts, agora, taxa, capacidade)
+                espera = 0.0
+                if fichas >= 1:
+                    fichas -= 1
+                else:
+                    espera = (1 - fichas) / taxa
+                estado[chave] = (fichas, agora)
+                # descarta buckets cheios há muito tempo para o arquivo não crescer
+                estado = {k: v for k, v in estado.items() if agora - v[1] < 3600}
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(estado))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return espera
+
+
+class BucketsMongo:
+    """
+    Um documento por bucket, atualizado num único find_one_and_update
+    (pipeline): reabastece, tenta gastar e devolve o saldo, tudo atômico.
+    Se o Mongo cair, usa buckets em memória.
+    """
+
+    bloqueante = True
+
+    def __init__(self, colecao: str = "limites_admissao"):
+        self.colecao = colecao
+        self._fallback = BucketsMemoria()
+
+    def consumir(self, chave: str, taxa: float, capacidade: float) -> float:
+        col = get_collection(self.colecao)
+        if col is None:
+            return self._fallback.consumir(chave, taxa, capacidade)
+
+        from pymongo import ReturnDocument  # type: ignore
+
+        agora = time.time()
+        fichas = {
+            "$min": [
+                capacidade,
+                {"$add": [
+                    {"$ifNull": ["$fichas", capacidade]},
+                    {"$multiply": [{"$max": [0, {"$subtract": [agora, {"$ifNull": ["$ts", agora]}]}]}, taxa]},
+                ]},
+            ]
+        }
+        pipeline = [
+            {"$set": {"fichas": fichas, "ts": agora}},
+            {"$set": {"ok": {"$gte": ["$fichas", 1]}}},
+            {"$set": {"fichas": {"$cond": ["$ok", {"$subtract": ["$fichas", 1]}, "$fichas"]}}},
+        ]
+        try:
+            doc = col.find_one_and_update(
+                {"_id": chave}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            marcar_falha()
+            log_limitado(log, "admissao.mongo", "erro no bucket do Mongo, usando memória", erro=repr(e))
+            return self._fallback.consumir(chave, taxa, capacidade)
+        return 0.0 if doc["ok"] else (1 - doc["fichas"]) / taxa
+
+
+# ---------- CONCORRÊNCIA DO LLM ----------
+
+class VagasMemoria:
+    def __init__(self, total: int):
+        self._sem = threading.BoundedSemaphore(total)
+
+    def adquirir(self, prazo: float) -> Optional[object]:
+        return self._sem if self._sem.acquire(timeout=max(0.0, prazo)) else None
+
+    def liberar(self, vaga: object) -> None:
+        self._sem.release()
+
+
+class VagasArquivo:
+    """
+    N arquivos de vaga; quem segura o flock de um deles está usando o LLM.
+    Se o worker morrer, o sistema operacional solta o lock sozinho.
+    """
+
+    def __init__(self, total: int, pasta: str):
+        os.makedirs(pasta, exist_ok=True)
+        self._caminhos = [os.path.join(pasta, f"vaga_llm_{i}.lock") for i in range(total)]
+
+    def _tentar(self):
+        for caminho in self._caminhos:
+            f = open(caminho, "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except OSError:
+                f.close()
+        return None
+
+    def adquirir(self, prazo: float) -> Optional[object]:
+        limite = time.monotonic() + prazo
+        while True:
+            vaga = self._tentar()
+            if vaga is not None or time.monotonic() >= limite:
+                return vaga
+            time.sleep(0.02)
+
+    def liberar(self, vaga) -> None:
+        fcntl.flock(vaga, fcntl.LOCK_UN)
+        vaga.close()
+
+
+def _criar_backends():
+    backend = ADMISSAO_BACKEND
+    if backend in ("arquivo", "mongo") and fcntl is None:
+        log.warning("fcntl indisponível; controle de admissão só por processo")
+        backend = "memoria"
+
+    if backend == "mongo":
+        return BucketsMongo(), VagasArquivo(LLM_MAX_CONCORRENCIA, ADMISSAO_DIR)
+    if backend == "arquivo":
+        return (
+            BucketsArquivo(os.path.join(ADMISSAO_DIR, "buckets.json")),
+            VagasArquivo(LLM_MAX_CONCORRENCIA, ADMISSAO_DIR),
+        )
+    return BucketsMemoria(), VagasMemoria(LLM_MAX_CONCORRENCIA)
+
+
+_buckets = None
+_vagas = None
+
+
+def _backends():
+    global _buckets, _vagas
+    if _buckets is None:
+        _buckets, _vagas = _criar_backends()
+    return _buckets, _vagas
+
+
+# quanto a chamada atual espera por uma vaga do LLM antes do 429; as threads
+# de fundo (jobs, resumos) fazem prazo_vaga_llm.set(LLM_ESPERA_VAGA_FUNDO_SEG)
+prazo_vaga_llm: ContextVar[float] = ContextVar("prazo_vaga_llm", default=LLM_ESPERA_VAGA_SEG)
+
+
+@contextmanager
+def vaga_llm() -> Iterator[None]:
+    """
+    Segura uma das LLM_MAX_CONCORRENCIA vagas durante uma chamada ao LLM.
+    Sem vaga no prazo, HTTPException 429 com Retry-After.
+    """
+    if not ADMISSAO_ATIVA:
+        yield
+        return
+    _, vagas = _backends()
+    inicio = time.monotonic()
+    vaga = vagas.adquirir(prazo_vaga_llm.get())
+    ADMISSAO_ESPERA.observar(time.monotonic() - inicio, "llm")
+    if vaga is None:
+        ADMISSAO_REJEITADAS.inc("llm", "concorrencia")
+        log_limitado(log, "admissao.llm", "teto de chamadas simultâneas ao LLM atingido", nivel=logging.WARNING)
+        raise HTTPException(
+            status_code=429,
+            detail="Serviço ocupado, tente novamente em instantes.",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        yield
+    finally:
+        vagas.liberar(vaga)
+
+
+# ---------- MIDDLEWARE ----------
+
+def _identificar(request) -> Tuple[str, str]:
+    """
+    (IP, usuário). O usuário é o que o cliente diz ser; o IP não.
+    """
+    ip = request.client.host if request.client else "desconhecido"
+    usuario = request.query_params.get("usuario_id") or request.headers.get("x-usuario-id") or ""
+    return ip, usuario
+
+
+def _rejeitar(rota: str, motivo: str, mensagem: str, espera: float) -> RespostaJSON:
+    ADMISSAO_REJEITADAS.inc(rota, motivo)
+    return RespostaJSON(
+        status_code=429,
+        content={"detail": mensagem},
+        headers={"Retry-After": str(max(1, math.ceil(espera)))},
+    )
+
+
+async def _esperar_ficha(buckets, chave: str, taxa: float, capacidade: float, limite: float) -> float:
+    """
+    Fila com prazo: espera a próxima ficha enquanto couber no prazo.
+    Retorna 0 se conseguiu, senão a espera que ainda faltaria (para o Retry-After).
+    """
+    while True:
+        if buckets.bloqueante:
+            espera = await asyncio.to_thread(buckets.consumir, chave, taxa, capacidade)
+        else:
+            espera = buckets.consumir(chave, taxa, capacidade)
+        if espera == 0.0:
+            return 0.0
+        if time.monotonic() + espera > limite:
+            return espera
+        await asyncio.sleep(espera)
+
+
+async def middleware_admissao(request, call_next):
+    rota = request.url.path
+    limites = LIMITES.get(rota)
+    if not ADMISSAO_ATIVA or limites is None:
+        return await call_next(request)
+
+    buckets, _ = _backends()
+    por_min_usuario, rajada_usuario, por_seg_rota, rajada_rota = limites
+    inicio = time.monotonic()
+    limite = inicio + ADMISSAO_PRAZO_SEG
+    ip, usuario = _identificar(request)
+
+    espera = await _esperar_ficha(buckets, f"u:{ip}|{usuario}:{rota}", por_min_usuario / 60.0, rajada_usuario, limite)
+    if espera:
+        log_limitado(log, f"admissao.usuario.{rota}", "limite por usuário atingido",
+                     nivel=logging.WARNING, rota=rota, usuario_id=usuario, ip=ip)
+        return _rejeitar(rota, "usuario", "Limite de requisições por usuário atingido.", espera)
+
+    if ADMISSAO_USUARIOS_POR_IP > 0 and usuario:
+        # sem usuario_id o bucket acima já é o do IP
+        fator = ADMISSAO_USUARIOS_POR_IP
+        espera = await _esperar_ficha(buckets, f"ip:{ip}:{rota}", fator * por_min_usuario / 60.0,
+                                      fator * rajada_usuario, limite)
+        if espera:
+            log_limitado(log, f"admissao.ip.{rota}", "limite por IP atingido", nivel=logging.WARNING, rota=rota, ip=ip)
+            return _rejeitar(rota, "ip", "Limite de requisições por usuário atingido.", espera)
+
+    espera = await _esperar_ficha(buckets, f"r:{rota}", por_seg_rota, rajada_rota, limite)
+    if espera:
+        log_limitado(log, f"admissao.rota.{rota}", "limite da rota atingido", nivel=logging.WARNING, rota=rota)
+        return _rejeitar(rota, "rota", "Serviço ocupado, tente novamente em instantes.", espera)
+
+    ADMISSAO_ESPERA.observar(time.monotonic() - inicio, rota)
+    return await call_next(request)
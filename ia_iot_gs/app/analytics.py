@@ -2,10 +2,13 @@
 from typing import Any, Dict, List
 from collections import Counter
 
+from .carbono import consumo_usuario
+from .observabilidade import cronometrar
 from .telemetry import list_events
 from .store import IAS
 
 
+@cronometrar("ias_mais_usadas")
 def ias_mais_usadas(top_n: int = 5) -> List[Dict[str, Any]]:
     """
     Calcula as IAs mais usadas com base nos eventos de telemetria.
@@ -61,6 +64,7 @@ def ias_mais_usadas(top_n: int = 5) -> List[Dict[str, Any]]:
     return ranking
 
 
+@cronometrar("uso_por_categoria")
 def uso_por_categoria() -> List[Dict[str, Any]]:
     """
     Agrupa os eventos de telemetria pela chave 'categoria'
@@ -91,62 +95,18 @@ def uso_por_categoria() -> List[Dict[str, Any]]:
     ]
 
 
+@cronometrar("consumo_eco_estimado_por_usuario")
 def consumo_eco_estimado_por_usuario(usuario_id: str) -> Dict[str, Any]:
     """
-    Lê os eventos de telemetria e calcula uma estimativa de:
+    Estimativa de consumo do usuário:
     - total de chamadas de IA
-    - kWh consumido (aprox)
-    - CO2 emitido (aprox)
+    - kWh consumido e CO2 emitido, com o consumo_wh de cada IA e o mesmo
+      fator de emissão do /eco/simular-impacto
     - IA mais utilizada
     - nível de consumo (baixo / moderado / alto)
 
-    Esse formato é compatível com o que o mobile (Insights) espera.
+    Esse formato é compatível com o que o mobile (Insights) espera. Os
+    totais são mantidos na ingestão (app/carbono.py): a consulta não relê
+    a telemetria.
     """
-
-    eventos = list_events(limit=5000)
-
-    eventos_usuario = [
-        e
-        for e in eventos
-        if e.get("usuario_id") == usuario_id
-        and e.get("evento") in ("mentor_resposta", "visao_ambiente")
-    ]
-
-    total_chamadas = len(eventos_usuario)
-
-    # Estimativa didática:
-    # 1 chamada de IA ~ 0.003 kWh
-    kwh_estimado = total_chamadas * 0.003
-    # 1 kWh ~ 0.4 kg CO2 (aprox)
-    co2_estimado_kg = kwh_estimado * 0.4
-
-    # Conta IA mais utilizada
-    contagem_por_ia: Counter[str] = Counter()
-    for e in eventos_usuario:
-        ia = e.get("ia_indicada")
-        if not ia and isinstance(e.get("payload"), dict):
-            ia = e["payload"].get("ia_indicada")
-        if not ia:
-            continue
-        contagem_por_ia[ia] += 1
-
-    ia_mais_utilizada = None
-    if contagem_por_ia:
-        ia_mais_utilizada = contagem_por_ia.most_common(1)[0][0]
-
-    # Classifica o nível de consumo
-    if total_chamadas <= 10:
-        nivel = "baixo"
-    elif total_chamadas <= 40:
-        nivel = "moderado"
-    else:
-        nivel = "alto"
-
-    return {
-        "usuario_id": usuario_id,
-        "total_chamadas": total_chamadas,
-        "kwh_estimado": kwh_estimado,
-        "co2_estimado_kg": co2_estimado_kg,
-        "ia_mais_utilizada": ia_mais_utilizada,
-        "nivel_consumo": nivel,
-    }
+    return consumo_usuario(usuario_id)
@@ -0,0 +1,440 @@
+# app/carbono.py
+import os
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import eco
+from .db import concluir_historico, get_collection, marcar_falha, reservar_historico
+from .observabilidade import cronometrar, get_logger, log_limitado, medir
+from .store import IAS
+
+log = get_logger("carbono")
+
+# Contabilidade de energia e CO2 por evento, com os mesmos fatores do
+# /eco/simular-impacto: consumo_wh de cada IA (app/store.py) e
+# EMISSAO_CO2_G_POR_WH (app/eco.py).
+#
+# Cada chamada de IA (EVENTOS_IA) soma 1 uso da IA indicada no evento ao
+# usuário e ao dia (UTC, últimos CARBONO_DIAS dias). Sem IA reconhecida, o
+# uso vai para SEM_IA, que consome como CARBONO_IA_PADRAO (o modelo que
+# de fato respondeu). Os contadores de uso são a fonte da verdade e o
+# consumo materializado de cada usuário/dia é Σ usos[ia] * consumo_wh[ia]:
+# o mesmo produto do simular_impacto, então N usos de uma IA dão
+# exatamente o consumo_wh/emissao_co2_g que ele mostra para N.
+#
+# Com Mongo, os totais vêm da coleção "carbono", compartilhada pelos
+# workers: um documento por usuário ("u:<id>") e por dia ("d:AAAA-MM-DD",
+# expira por TTL depois de CARBONO_DIAS) com os usos por IA. Cada worker
+# junta os usos que registra e manda um $inc em lote a cada
+# CARBONO_PUBLICAR_SEG; a consulta soma o que ele ainda não mandou. O
+# consumo sai dos usos na hora da consulta, com os fatores do momento.
+#
+# A telemetria anterior aos contadores entra uma vez só: cada worker marca
+# o próprio boot ($min em "_historico".inicio) e um deles soma os eventos
+# anteriores a esse instante no campo "hist" de cada documento, com $set
+# (refazer não conta duas vezes). Se ele morrer no meio, outro refaz
+# depois de CARBONO_HISTORICO_PRAZO_SEG. Roda na thread de fundo iniciada
+# no lifespan (iniciar_carbono), fora das requisições.
+#
+# Sem Mongo, vale a contabilidade do processo (CONTABILIDADE), com o
+# histórico do diário local carregado pela mesma thread. Se os fatores
+# mudarem (IAS ou EMISSAO_CO2_G_POR_WH), recalcular() refaz os totais
+# dela numa passada; a consulta percebe a mudança sozinha.
+
+CARBONO_DIAS = int(os.getenv("CARBONO_DIAS", "35"))
+CARBONO_IA_PADRAO = os.getenv("CARBONO_IA_PADRAO", "gemini")
+CARBONO_PUBLICAR_SEG = float(os.getenv("CARBONO_PUBLICAR_SEG", "5"))
+CARBONO_HISTORICO_PRAZO_SEG = float(os.getenv("CARBONO_HISTORICO_PRAZO_SEG", "600"))
+
+EVENTOS_IA = ("mentor_resposta", "visao_ambiente")
+SEM_IA = "_sem_ia"
+
+
+class _Fatores:
+    def __init__(self):
+        self.wh: Dict[str, float] = {i: float(cfg["consumo_wh"]) for i, cfg in IAS.items()}
+        self.wh[SEM_IA] = self.wh.get(CARBONO_IA_PADRAO, 0.0)
+        self.co2_g_por_wh = eco.EMISSAO_CO2_G_POR_WH
+        self.chave = (tuple(self.wh.items()), self.co2_g_por_wh)
+        # id e nome (minúsculo) -> id
+        self.ids = {i: i for i in IAS}
+        self.ids.update({cfg["nome"].lower(): i for i, cfg in IAS.items() if cfg.get("nome")})
+
+    def consumo(self, usos: Dict[str, int]) -> float:
+        return sum(n * self.wh.get(ia, self.wh[SEM_IA]) for ia, n in usos.items())
+
+
+class _Conta:
+    __slots__ = ("usos", "chamadas", "wh")
+
+    def __init__(self):
+        self.usos: Dict[str, int] = {}
+        self.chamadas = 0
+        self.wh = 0.0
+
+    def somar(self, ia: str, n: int, fatores: _Fatores) -> None:
+        self.usos[ia] = self.usos.get(ia, 0) + n
+        self.chamadas += n
+        self.wh = fatores.consumo(self.usos)
+
+
+def _ia_do_evento(evento: Dict[str, Any], fatores: _Fatores) -> str:
+    ia = evento.get("ia_indicada")
+    if not ia and isinstance(evento.get("payload"), dict):
+        ia = evento["payload"].get("ia_indicada")
+    if not isinstance(ia, str):
+        return SEM_IA
+    return fatores.ids.get(ia, fatores.ids.get(ia.lower(), SEM_IA))
+
+
+class ContabilidadeCarbono:
+    def __init__(self, dias: int = CARBONO_DIAS):
+        self.dias = dias
+        self.fatores = _Fatores()
+        self.usuarios: Dict[str, _Conta] = {}
+        self.por_dia: Dict[date, _Conta] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, evento: Dict[str, Any], n: int = 1) -> None:
+        if evento.get("evento") not in EVENTOS_IA:
+            return
+        usuario_id = evento.get("usuario_id") or "anon"
+        dia = (evento.get("timestamp") or datetime.utcnow()).date()
+        with self._lock:
+            ia = _ia_do_evento(evento, self.fatores)
+            conta = self.usuarios.get(usuario_id)
+            if conta is None:
+                conta = self.usuarios[usuario_id] = _Conta()
+            conta.somar(ia, n, self.fatores)
+            conta = self.por_dia.get(dia)
+            if conta is None:
+                conta = self.por_dia[dia] = _Conta()
+                self._podar_dias(dia)
+            conta.somar(ia, n, self.fatores)
+
+    def _podar_dias(self, novo: date) -> None:
+        limite = novo - timedelta(days=self.dias)
+        for dia in [d for d in self.por_dia if d <= limite]:
+            del self.por_dia[dia]
+
+    def recalcular(self) -> None:
+        """
+        Relê os fatores e refaz o consumo de todos os usuários e dias de uma
+        vez (wh = usos · consumo_wh, uma passada pelas contas).
+
+        Sem numpy de propósito: com ~6 IAs, montar a matriz contas x IAs
+        custa o mesmo que a passada inteira (bench/bench_carbono.py).
+        """
+        with self._lock:
+            fatores = _Fatores()
+            self.fatores = fatores
+            for conta in list(self.usuarios.values()) + list(self.por_dia.values()):
+                conta.wh = fatores.consumo(conta.usos)
+
+    def _conferir_fatores(self) -> None:
+        # O(nº de IAs): só recalcula se alguém mudou IAS ou o fator de emissão
+        if _Fatores().chave != self.fatores.chave:
+            self.recalcular()
+
+    def conta_usuario(self, usuario_id: str) -> Tuple[Optional[_Conta], _Fatores]:
+        self._conferir_fatores()
+        with self._lock:
+            conta = self.usuarios.get(usuario_id)
+            if conta is not None:
+                copia = _Conta()
+                copia.usos, copia.chamadas, copia.wh = dict(conta.usos), conta.chamadas, conta.wh
+                conta = copia
+            return conta, self.fatores
+
+    def contas_dias(
+        self, dias: int, hoje: Optional[date] = None
+    ) -> Tuple[List[Tuple[date, Optional[Tuple[int, float]]]], _Fatores]:
+        """
+        [(dia, (chamadas, wh) ou None)] dos últimos `dias` dias.
+        """
+        self._conferir_fatores()
+        hoje = hoje or datetime.utcnow().date()
+        inicio = hoje - timedelta(days=dias - 1)
+        with self._lock:
+            serie = [(d, self.por_dia.get(d)) for d in (inicio + timedelta(days=i) for i in range(dias))]
+            return [(d, (c.chamadas, c.wh) if c else None) for d, c in serie], self.fatores
+
+
+CONTABILIDADE = ContabilidadeCarbono()
+# eventos registrados a partir daqui são contados por registrar(); os anteriores, pelo histórico
+_INICIO = datetime.utcnow()
+_HISTORICO_ID = "_historico"
+
+# usos ainda não mandados para o Mongo: _id do documento -> {ia: n}
+_pendentes: Dict[str, Dict[str, int]] = {}
+_pendentes_lock = threading.Lock()
+_parar = threading.Event()
+_thread: Optional[threading.Thread] = None
+_indice_ok = False
+
+
+def registrar(evento: Dict[str, Any], n: int = 1) -> None:
+    if evento.get("evento") not in EVENTOS_IA:
+        return
+    CONTABILIDADE.registrar(evento, n)
+    usuario_id = evento.get("usuario_id") or "anon"
+    dia = (evento.get("timestamp") or datetime.utcnow()).date()
+    ia = _ia_do_evento(evento, CONTABILIDADE.fatores)
+    with _pendentes_lock:
+        for chave in (f"u:{usuario_id}", f"d:{dia.isoformat()}"):
+            usos = _pendentes.setdefault(chave, {})
+            usos[ia] = usos.get(ia, 0) + n
+
+
+# ---------- MONGO ----------
+
+def _carbono_col():
+    global _indice_ok
+    col = get_collection("carbono")
+    if col is not None and not _indice_ok:
+        _indice_ok = True
+        try:
+            with medir("mongo"):
+                col.create_index("expira_em", expireAfterSeconds=0)
+        except Exception as e:
+            log_limitado(log, "carbono.indice", "não foi possível criar o índice TTL do carbono", erro=repr(e))
+    return col
+
+
+def _devolver(lote: Dict[str, Dict[str, int]]) -> None:
+    with _pendentes_lock:
+        for chave, usos in lote.items():
+            destino = _pendentes.setdefault(chave, {})
+            for ia, n in usos.items():
+                destino[ia] = destino.get(ia, 0) + n
+
+
+def _expira_em(chave: str) -> Optional[datetime]:
+    if not chave.startswith("d:"):
+        return None
+    return datetime.combine(date.fromisoformat(chave[2:]), datetime.min.time()) + timedelta(days=CARBONO_DIAS + 1)
+
+
+def publicar() -> None:
+    """
+    Manda os usos pendentes para o Mongo ($inc em lote). Sem Mongo, ou se
+    a escrita falhar, eles ficam para a próxima vez.
+    """
+    global _pendentes
+    col = _carbono_col()
+    if col is None:
+        return
+    with _pendentes_lock:
+        lote, _pendentes = _pendentes, {}
+    if not lote:
+        return
+
+    from pymongo import UpdateOne  # type: ignore
+
+    operacoes = []
+    for chave, usos in lote.items():
+        atualizacao: Dict[str, Any] = {"$inc": {f"usos.{ia}": n for ia, n in usos.items()}}
+        expira_em = _expira_em(chave)
+        if expira_em is not None:
+            atualizacao["$setOnInsert"] = {"expira_em": expira_em}
+        operacoes.append(UpdateOne({"_id": chave}, atualizacao, upsert=True))
+    try:
+        with medir("mongo"):
+            col.bulk_write(operacoes, ordered=False)
+    except Exception as e:
+        marcar_falha()
+        log_limitado(log, "carbono.publicar", "erro ao publicar usos no Mongo", erro=repr(e))
+        _devolver(lote)
+
+
+def _usos_compartilhados(chaves: List[str]) -> Optional[Dict[str, Dict[str, int]]]:
+    """
+    {chave: {ia: usos}} do Mongo (contadores + histórico) mais o que este
+    worker ainda não publicou. None sem Mongo.
+    """
+    col = _carbono_col()
+    if col is None:
+        return None
+    try:
+        with medir("mongo"):
+            docs = list(col.find({"_id": {"$in": chaves}}, {"usos": 1, "hist": 1}))
+    except Exception as e:
+        marcar_falha()
+        log_limitado(log, "carbono.ler", "erro ao ler o carbono do Mongo, usando o do processo", erro=repr(e))
+        return None
+    usos: Dict[str, Dict[str, int]] = {chave: {} for chave in chaves}
+    with _pendentes_lock:
+        fontes = [(doc["_id"], doc.get(campo) or {}) for doc in docs for campo in ("usos", "hist")]
+        fontes += [(chave, _pendentes[chave]) for chave in chaves if chave in _pendentes]
+        for chave, parcial in fontes:
+            destino = usos[chave]
+            for ia, n in parcial.items():
+                destino[ia] = destino.get(ia, 0) + n
+    return usos
+
+
+# ---------- HISTÓRICO ----------
+
+def _somar_historico(ate: datetime) -> Dict[str, Dict[str, int]]:
+    from .telemetry import iterar_eventos
+
+    fatores = _Fatores()
+    usos: Dict[str, Dict[str, int]] = {}
+    for e in iterar_eventos():
+        if e["timestamp"] >= ate:
+            break
+        if e.get("evento") not in EVENTOS_IA:
+            continue
+        ia = _ia_do_evento(e, fatores)
+        for chave in (f"u:{e.get('usuario_id') or 'anon'}", f"d:{e['timestamp'].date().isoformat()}"):
+            destino = usos.setdefault(chave, {})
+            destino[ia] = destino.get(ia, 0) + 1
+    return usos
+
+
+def _historico_compartilhado(col) -> bool:
+    """
+    Garante que a telemetria anterior aos contadores está em "hist".
+    True quando já está (feito aqui ou por outro worker).
+    """
+    from pymongo import UpdateOne  # type: ignore
+
+    with medir("mongo"):
+        ate, pronto = reservar_historico(col, _INICIO, CARBONO_HISTORICO_PRAZO_SEG, _HISTORICO_ID)
+    if ate is None:
+        return pronto
+
+    usos = _somar_historico(ate)
+    operacoes = []
+    for chave, hist in usos.items():
+        atualizacao: Dict[str, Any] = {"$set": {"hist": hist}}
+        expira_em = _expira_em(chave)
+        if expira_em is not None:
+            atualizacao["$setOnInsert"] = {"expira_em": expira_em}
+        operacoes.append(UpdateOne({"_id": chave}, atualizacao, upsert=True))
+    with medir("mongo"):
+        if operacoes:
+            col.bulk_write(operacoes, ordered=False)
+        concluir_historico(col, ate, doc_id=_HISTORICO_ID)
+    log.info("histórico do carbono carregado", extra={"documentos": len(usos)})
+    return True
+
+
+def _historico_local() -> None:
+    # sem Mongo: a telemetria do diário local entra na contabilidade do processo
+    from .telemetry import iterar_eventos
+
+    for e in iterar_eventos():
+        if e["timestamp"] >= _INICIO:
+            break
+        CONTABILIDADE.registrar(e)
+    CONTABILIDADE.recalcular()
+
+
+def _loop() -> None:
+    compartilhado, local = False, False
+    while True:
+        col = _carbono_col()
+        try:
+            if col is not None and not compartilhado:
+                compartilhado = _historico_compartilhado(col)
+            elif col is None and not local:
+                _historico_local()
+                local = True
+        except Exception as e:
+            marcar_falha()
+            log_limitado(log, "carbono.historico", "erro ao carregar o histórico do carbono", erro=repr(e))
+        publicar()
+        if _parar.wait(CARBONO_PUBLICAR_SEG):
+            return
+
+
+def iniciar_carbono() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _parar.clear()
+    _thread = threading.Thread(target=_loop, name="carbono", daemon=True)
+    _thread.start()
+
+
+def parar_carbono() -> None:
+    global _thread
+    _parar.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        publicar()
+    _thread = None
+
+
+# ---------- CONSULTAS ----------
+
+def _nivel(chamadas: int) -> str:
+    if chamadas <= 10:
+        return "baixo"
+    if chamadas <= 40:
+        return "moderado"
+    return "alto"
+
+
+def _fatores_atuais() -> _Fatores:
+    CONTABILIDADE._conferir_fatores()
+    return CONTABILIDADE.fatores
+
+
+@cronometrar("consumo_usuario")
+def consumo_usuario(usuario_id: str) -> Dict[str, Any]:
+    """
+    Totais do usuário (formato da tela de Insights + consumo_wh e
+    emissao_co2_g, arredondados como no simular_impacto).
+    """
+    compartilhados = _usos_compartilhados([f"u:{usuario_id}"])
+    if compartilhados is not None:
+        fatores = _fatores_atuais()
+        usos = compartilhados[f"u:{usuario_id}"]
+        chamadas, wh = sum(usos.values()), fatores.consumo(usos)
+    else:
+        conta, fatores = CONTABILIDADE.conta_usuario(usuario_id)
+        conta = conta or _Conta()
+        usos, chamadas, wh = conta.usos, conta.chamadas, conta.wh
+    co2_g = wh * fatores.co2_g_por_wh
+    por_ia = {ia: n for ia, n in usos.items() if ia != SEM_IA}
+    return {
+        "usuario_id": usuario_id,
+        "total_chamadas": chamadas,
+        "kwh_estimado": round(wh / 1000, 5),
+        "co2_estimado_kg": round(co2_g / 1000, 5),
+        "consumo_wh": round(wh, 2),
+        "emissao_co2_g": round(co2_g, 2),
+        "ia_mais_utilizada": max(por_ia, key=lambda ia: (por_ia[ia], ia)) if por_ia else None,
+        "nivel_consumo": _nivel(chamadas),
+    }
+
+
+@cronometrar("consumo_por_dia")
+def consumo_por_dia(dias: int = 7) -> Dict[str, Any]:
+    """
+    Chamadas, consumo e emissão de todos os usuários por dia (UTC).
+    """
+    hoje = datetime.utcnow().date()
+    serie_dias = [hoje - timedelta(days=dias - 1 - i) for i in range(dias)]
+    compartilhados = _usos_compartilhados([f"d:{d.isoformat()}" for d in serie_dias])
+    if compartilhados is not None:
+        fatores = _fatores_atuais()
+        serie = []
+        for d in serie_dias:
+            usos = compartilhados[f"d:{d.isoformat()}"]
+            serie.append((d, (sum(usos.values()), fatores.consumo(usos)) if usos else None))
+    else:
+        serie, fatores = CONTABILIDADE.contas_dias(dias, hoje)
+    pontos = []
+    for dia, valores in serie:
+        chamadas, wh = valores or (0, 0.0)
+        pontos.append({
+            "dia": dia.isoformat(),
+            "chamadas": chamadas,
+            "consumo_wh": round(wh, 2),
+            "emissao_co2_g": round(wh * fatores.co2_g_por_wh, 2),
+        })
+    return {"co2_g_por_wh": fatores.co2_g_por_wh, "por_dia": pontos}
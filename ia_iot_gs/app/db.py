@@ -0,0 +1,163 @@
+# app/db.py
+import importlib.util
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from .observabilidade import get_logger, log_limitado
+
+log = get_logger("db")
+
+# Conexão única com o MongoDB, compartilhada por telemetria, usuários e devices.
+# Nada acontece na importação: o pymongo só é importado e o cliente só é
+# criado no primeiro get_db(). A conexão passa por um "ping" periódico;
+# se cair, get_db() devolve None (todo mundo usa o fallback em memória)
+# e tenta reconectar a cada MONGO_RETRY_SEG, sem travar cada requisição
+# no timeout do Mongo.
+
+# Tenta usar MongoDB, mas não obriga
+PYMONGO_DISPONIVEL = importlib.util.find_spec("pymongo") is not None
+
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "2000"))
+MONGO_CHECK_SEG = float(os.getenv("MONGO_CHECK_SEG", "30"))
+MONGO_RETRY_SEG = float(os.getenv("MONGO_RETRY_SEG", "10"))
+
+_client = None
+_db = None
+_saudavel = False
+_ultimo_check = float("-inf")
+_lock = threading.Lock()
+
+
+def _conectar() -> None:
+    global _client, _db
+
+    # lido na hora: o .env é carregado no lifespan, depois das importações
+    url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+    nome_db = os.getenv("MONGO_DB", "gs_disruptive")
+    if _client is None:
+        from pymongo import MongoClient  # type: ignore
+
+        _client = MongoClient(url, serverSelectionTimeoutMS=MONGO_TIMEOUT_MS)
+    _client.admin.command("ping")
+    _db = _client[nome_db]
+
+
+def _testar_conexao() -> None:
+    global _saudavel
+    estava_saudavel = _saudavel
+    try:
+        _conectar()
+        _saudavel = True
+        if not estava_saudavel:
+            log.info("MongoDB conectado", extra={"db": _db.name})
+    except Exception as e:
+        _saudavel = False
+        log_limitado(log, "db.conectar", "Mongo indisponível, usando memória", erro=repr(e))
+
+
+def get_db():
+    """
+    Banco Mongo se estiver saudável; None se pymongo não existir ou o Mongo estiver fora.
+
+    A primeira conexão e o ping periódico rodam na própria chamada; as
+    tentativas de reconexão depois de uma queda rodam numa thread, para
+    nenhuma requisição esperar o timeout de um Mongo fora do ar.
+    """
+    global _ultimo_check
+    if not PYMONGO_DISPONIVEL:
+        return None
+
+    intervalo = MONGO_CHECK_SEG if _saudavel else MONGO_RETRY_SEG
+    if time.monotonic() - _ultimo_check < intervalo:
+        return _db if _saudavel else None
+
+    with _lock:
+        if time.monotonic() - _ultimo_check < intervalo:
+            return _db if _saudavel else None
+        _ultimo_check = time.monotonic()
+        primeira = _client is None
+
+    if primeira or _saudavel:
+        _testar_conexao()
+    else:
+        threading.Thread(target=_testar_conexao, name="mongo-reconectar", daemon=True).start()
+
+    return _db if _saudavel else None
+
+
+def marcar_falha() -> None:
+    """
+    Chamado quando uma operação no Mongo falha: as próximas requisições
+    vão direto para o fallback até o próximo teste de reconexão.
+    """
+    global _saudavel, _ultimo_check
+    with _lock:
+        _saudavel = False
+        _ultimo_check = time.monotonic()
+
+
+def get_collection(nome: str):
+    """
+    Retorna a coleção do Mongo ou None se o Mongo não estiver disponível.
+    """
+    db = get_db()
+    if db is None:
+        return None
+    return db[nome]
+
+
+def reservar_historico(col, inicio: datetime, prazo_seg: float, doc_id: str = "_historico") -> Tuple[Optional[datetime], bool]:
+    """
+    Carga única da telemetria anterior aos contadores compartilhados de
+    `col`: cada worker marca o próprio boot ($min em inicio) e a vez de
+    carregar é de quem achar o documento pendente, ou "carregando" com o
+    prazo do dono vencido (ele morreu no meio).
+
+    Retorna (ate, pronto): `ate` é até onde este worker deve carregar antes
+    de chamar concluir_historico (None se a vez não é dele); `pronto` diz
+    se a carga já terminou.
+    """
+    from pymongo import ReturnDocument  # type: ignore
+
+    agora = datetime.utcnow()
+    col.update_one({"_id": doc_id}, {"$min": {"inicio": inicio}, "$setOnInsert": {"status": "pendente"}}, upsert=True)
+    for filtro in ({"_id": doc_id, "status": "pendente"},
+                   {"_id": doc_id, "status": "carregando", "prazo": {"$lt": agora}}):
+        doc = col.find_one_and_update(
+            filtro,
+            {"$set": {"status": "carregando", "prazo": agora + timedelta(seconds=prazo_seg)}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is not None:
+            return doc["inicio"], False
+    atual = col.find_one({"_id": doc_id}, {"status": 1}) or {}
+    return None, atual.get("status") == "pronto"
+
+
+def concluir_historico(col, ate: datetime, campos: Optional[Dict[str, Any]] = None, doc_id: str = "_historico") -> None:
+    col.update_one({"_id": doc_id}, {"$set": {"status": "pronto", "ate": ate, **(campos or {})}})
+
+
+def usar_cliente(cliente) -> None:
+    """
+    Usa um cliente já criado (ex.: o Mongo em processo de bench/fakes.py)
+    em vez de conectar no MONGO_URL.
+    """
+    global PYMONGO_DISPONIVEL, _client, _db, _saudavel, _ultimo_check
+    with _lock:
+        PYMONGO_DISPONIVEL = True
+        _client = cliente
+        _db = cliente[os.getenv("MONGO_DB", "gs_disruptive")]
+        _saudavel = True
+        _ultimo_check = time.monotonic()
+
+
+def fechar() -> None:
+    global _client, _db, _saudavel, _ultimo_check
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client, _db, _saudavel, _ultimo_check = None, None, False, float("-inf")
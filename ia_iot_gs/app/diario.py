@@ -0,0 +1,602 @@
+# app/diario.py
+import fcntl
+import heapq
+import itertools
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .observabilidade import get_logger, log_limitado
+
+log = get_logger("diario")
+
+# Diário local da telemetria: log append-only em disco, usado quando o
+# Mongo não está disponível (eventos sobrevivem ao restart) e reenviado
+# para o Mongo quando ele volta.
+#
+# Cada processo (worker do uvicorn) escreve na sua própria pasta dentro de
+# TELEMETRIA_LOG_DIR (w-000, w-001, ...), presa com flock enquanto ele
+# vive: recuperação, retenção e a posição de reenvio (replicado.pos) só
+# são mexidas pelo dono, e um worker reiniciado reaproveita a primeira
+# pasta livre. Pasta livre com eventos pendentes (worker que não voltou)
+# é reenviada por quem estiver replicando, a cada TELEMETRIA_ORFAOS_SEG.
+# A leitura (ultimos, percorrer) junta as pastas de todos os processos.
+#
+# Arquivos em cada pasta: seg-000000000001.log, seg-...2.log, ...
+# Cada registro:
+#   [u32 tamanho][u32 crc32][formato (1 byte) + corpo][u32 tamanho]
+# O tamanho repetido no fim permite ler de trás para frente ("últimos N")
+# direto do mmap. formato: b"M" msgpack, b"J" JSON (sem msgpack instalado).
+#
+# Durabilidade (TELEMETRIA_FSYNC):
+# - "grupo" (padrão): anexar() só retorna depois do fsync; quem chega
+#   enquanto um fsync roda espera o próximo, que cobre todo mundo junto
+#   (group commit: um fsync por rajada, não por evento);
+# - "nunca": fica no page cache e o sistema operacional grava quando quiser.
+
+TELEMETRIA_LOG_DIR = os.getenv("TELEMETRIA_LOG_DIR", os.path.join("dados", "telemetria"))
+TELEMETRIA_FSYNC = os.getenv("TELEMETRIA_FSYNC", "grupo")
+TELEMETRIA_SEGMENTO_MB = float(os.getenv("TELEMETRIA_SEGMENTO_MB", "8"))
+TELEMETRIA_RETENCAO_SEGMENTOS = int(os.getenv("TELEMETRIA_RETENCAO_SEGMENTOS", "64"))
+TELEMETRIA_ORFAOS_SEG = float(os.getenv("TELEMETRIA_ORFAOS_SEG", "300"))
+
+try:
+    import msgpack  # type: ignore
+except ImportError:
+    msgpack = None  # type: ignore
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+_CABECALHO = struct.Struct("<II")
+_RODAPE = struct.Struct("<I")
+_EXTRA = _CABECALHO.size + _RODAPE.size
+_NOME_SEGMENTO = re.compile(r"^seg-(\d{12})\.log$")
+_NOME_ESCRITOR = re.compile(r"^w-(\d{3,})$")
+
+
+# ---------- CODIFICAÇÃO ----------
+
+def _padrao(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return str(obj)
+
+
+def _codificar(doc: Dict[str, Any]) -> bytes:
+    if msgpack is not None:
+        corpo = b"M" + msgpack.packb(doc, default=_padrao, use_bin_type=True)
+    elif orjson is not None:
+        corpo = b"J" + orjson.dumps(doc, default=_padrao, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        import json
+
+        corpo = b"J" + json.dumps(doc, default=_padrao, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _CABECALHO.pack(len(corpo), zlib.crc32(corpo)) + corpo + _RODAPE.pack(len(corpo))
+
+
+def _decodificar(corpo: bytes) -> Dict[str, Any]:
+    formato, dados = corpo[:1], corpo[1:]
+    if formato == b"M":
+        if msgpack is None:
+            raise ValueError("registro em msgpack, mas o msgpack não está instalado")
+        doc = msgpack.unpackb(dados, raw=False)
+    elif orjson is not None:
+        doc = orjson.loads(dados)
+    else:
+        import json
+
+        doc = json.loads(dados)
+    ts = doc.get("timestamp")
+    if isinstance(ts, str):
+        doc["timestamp"] = datetime.fromisoformat(ts)
+    return doc
+
+
+def _registro_valido(buf, inicio: int, fim: int) -> Optional[int]:
+    """
+    Se há um registro íntegro começando em `inicio` (sem passar de `fim`),
+    retorna a posição logo depois dele; senão None.
+    """
+    if inicio + _EXTRA > fim:
+        return None
+    tamanho, crc = _CABECALHO.unpack_from(buf, inicio)
+    depois = inicio + _CABECALHO.size + tamanho + _RODAPE.size
+    if depois > fim or _RODAPE.unpack_from(buf, depois - _RODAPE.size)[0] != tamanho:
+        return None
+    if zlib.crc32(buf[inicio + _CABECALHO.size:depois - _RODAPE.size]) != crc:
+        return None
+    return depois
+
+
+def _fim_valido(buf, tamanho: int) -> int:
+    # posição logo depois do último registro íntegro, varrendo do início
+    pos = 0
+    while True:
+        depois = _registro_valido(buf, pos, tamanho)
+        if depois is None:
+            return pos
+        pos = depois
+
+
+class DiarioOcupado(Exception):
+    """A pasta já tem um processo dono (flock em dono.lock)."""
+
+
+def _travar(pasta: str) -> int:
+    fd = os.open(os.path.join(pasta, "dono.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        raise DiarioOcupado(pasta)
+    return fd
+
+
+# ---------- DIÁRIO ----------
+
+class Diario:
+    """
+    Diário de uma pasta. Para escrever, o processo precisa ser o dono da
+    pasta (DiarioOcupado se outro processo vivo já for); somente_leitura
+    só lê, sem trava, e aguenta o dono escrevendo e apagando ao mesmo tempo.
+    """
+
+    def __init__(self, pasta: str, fsync: str = "grupo", segmento_bytes: int = 8 << 20, retencao: int = 64,
+                 somente_leitura: bool = False):
+        self.pasta = pasta
+        self.fsync = fsync
+        self.segmento_bytes = segmento_bytes
+        self.retencao = max(1, retencao)
+        self.somente_leitura = somente_leitura
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._seq = 0               # registros escritos
+        self._duravel = 0           # registros com fsync feito
+        self._sincronizando = False
+        self._replicando = threading.Lock()
+        self._fd: Optional[int] = None
+        self._trava: Optional[int] = None
+        # segmentos fechados com final corrompido -> tamanho válido
+        self._limites: Dict[int, int] = {}
+
+        if somente_leitura:
+            self._segmentos: List[int] = self._listar_segmentos() if os.path.isdir(pasta) else []
+            self._atual, self._tamanho = (self._segmentos[-1] if self._segmentos else 1), 0
+            return
+
+        os.makedirs(pasta, exist_ok=True)
+        self._trava = _travar(pasta)
+        self._segmentos = self._listar_segmentos()
+        if not self._segmentos:
+            self._segmentos = [1]
+        self._atual = self._segmentos[-1]
+        self._tamanho = self._recuperar(self._atual)
+        if self._atual in self._limites:
+            # sem truncar: um leitor de outro processo pode estar com o arquivo no
+            # mmap (encolher o arquivo debaixo dele dá SIGBUS); segue em outro segmento
+            self._atual += 1
+            self._segmentos.append(self._atual)
+            self._tamanho = 0
+        # posição de reenvio: só o dono muda, então fica em memória (o arquivo é para o restart)
+        self._posicao = self._ler_posicao()
+        self._fd = os.open(self._caminho(self._atual), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    # -- arquivos --
+
+    def _caminho(self, segmento: int) -> str:
+        return os.path.join(self.pasta, f"seg-{segmento:012d}.log")
+
+    def _listar_segmentos(self) -> List[int]:
+        return sorted(int(m.group(1)) for m in map(_NOME_SEGMENTO.match, os.listdir(self.pasta)) if m)
+
+    def _recuperar(self, segmento: int) -> int:
+        """
+        Varre o segmento ativo atrás de um registro final incompleto
+        (processo morto no meio da escrita). Retorna o tamanho válido;
+        com final corrompido, o segmento entra em _limites.
+        """
+        caminho = self._caminho(segmento)
+        if not os.path.exists(caminho):
+            return 0
+        with open(caminho, "rb") as f:
+            dados = f.read()
+        pos = _fim_valido(dados, len(dados))
+        if pos < len(dados):
+            log.warning("diário: ignorando final corrompido", extra={"segmento": segmento, "bytes": len(dados) - pos})
+            self._limites[segmento] = pos
+        return pos
+
+    def _rotacionar(self) -> None:
+        # chamado com o lock e sem fsync em andamento no fd atual
+        if self.fsync != "nunca":
+            os.fsync(self._fd)
+        os.close(self._fd)
+        self._duravel = self._seq
+        self._atual += 1
+        self._segmentos.append(self._atual)
+        self._fd = os.open(self._caminho(self._atual), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._tamanho = 0
+
+        while len(self._segmentos) > self.retencao:
+            antigo = self._segmentos.pop(0)
+            self._limites.pop(antigo, None)
+            pos_seg, _ = self._posicao
+            if pos_seg <= antigo:
+                log_limitado(log, "diario.retencao", "diário: segmento removido antes de ir para o Mongo",
+                             segmento=antigo)
+                self._gravar_posicao(antigo + 1, 0)
+            try:
+                os.remove(self._caminho(antigo))
+            except FileNotFoundError:
+                pass
+
+    # -- escrita --
+
+    def anexar(self, doc: Dict[str, Any]) -> None:
+        if self.somente_leitura:
+            raise RuntimeError("diário aberto só para leitura")
+        registro = _codificar(doc)
+        with self._lock:
+            while self._tamanho and self._tamanho + len(registro) > self.segmento_bytes:
+                if self._sincronizando:
+                    # o líder do fsync ainda usa o fd deste segmento
+                    self._cond.wait()
+                    continue
+                self._rotacionar()
+            os.write(self._fd, registro)
+            self._tamanho += len(registro)
+            self._seq += 1
+            seq = self._seq
+        if self.fsync != "nunca":
+            self._esperar_duravel(seq)
+
+    def _esperar_duravel(self, seq: int) -> None:
+        with self._cond:
+            while self._duravel < seq:
+                if self._sincronizando:
+                    self._cond.wait()
+                    continue
+                # vira o "líder": um fsync cobre tudo que foi escrito até agora
+                self._sincronizando = True
+                alvo, fd = self._seq, self._fd
+                self._lock.release()
+                try:
+                    os.fsync(fd)
+                finally:
+                    self._lock.acquire()
+                    self._sincronizando = False
+                    self._duravel = max(self._duravel, alvo)
+                    self._cond.notify_all()
+
+    def fechar(self) -> None:
+        with self._cond:
+            while self._sincronizando:
+                self._cond.wait()
+            if self._fd is not None:
+                os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+            if self._trava is not None:
+                os.close(self._trava)  # solta o flock: a pasta fica livre para outro processo
+                self._trava = None
+
+    # -- leitura --
+
+    def _fotografia(self) -> List[Tuple[int, int]]:
+        # (segmento, tamanho válido) do mais novo para o mais antigo
+        if self.somente_leitura:
+            # o dono rotaciona e apaga por conta própria: lista de novo a cada leitura
+            atual, tamanho = None, 0
+            segmentos = self._listar_segmentos() if os.path.isdir(self.pasta) else []
+        else:
+            with self._lock:
+                atual, tamanho, segmentos = self._atual, self._tamanho, list(self._segmentos)
+        fotos = []
+        for seg in reversed(segmentos):
+            if seg == atual:
+                fotos.append((seg, tamanho))
+            elif seg in self._limites:
+                fotos.append((seg, self._limites[seg]))
+            else:
+                try:
+                    fotos.append((seg, os.path.getsize(self._caminho(seg))))
+                except FileNotFoundError:
+                    pass
+        return fotos
+
+    def _abrir(self, segmento: int):
+        # None se o dono já apagou o segmento (retenção)
+        try:
+            return open(self._caminho(segmento), "rb")
+        except FileNotFoundError:
+            return None
+
+    def _de_tras_para_frente(self, segmento: int, tamanho: int) -> Iterator[Dict[str, Any]]:
+        f = self._abrir(segmento) if tamanho > 0 else None
+        if f is None:
+            return
+        with f, mmap.mmap(f.fileno(), tamanho, access=mmap.ACCESS_READ) as mm:
+            fim = tamanho
+            no_final = True
+            while fim > 0:
+                (n,) = _RODAPE.unpack_from(mm, fim - _RODAPE.size)
+                inicio = fim - n - _EXTRA
+                if inicio < 0 or _registro_valido(mm, inicio, fim) != fim:
+                    if no_final:
+                        # final incompleto (o dono no meio de uma escrita, ou morto
+                        # nela): acha o último registro íntegro a partir do início
+                        no_final = False
+                        fim = _fim_valido(mm, tamanho)
+                        continue
+                    log_limitado(log, "diario.ler", "diário: registro inválido, parando a leitura",
+                                 segmento=segmento, posicao=fim)
+                    return
+                no_final = False
+                yield _decodificar(mm[inicio + _CABECALHO.size:fim - _RODAPE.size])
+                fim = inicio
+
+    def ultimos(self, n: int) -> List[Dict[str, Any]]:
+        """
+        Os n eventos mais recentes, do mais novo para o mais antigo
+        (mesma ordem do find().sort("timestamp", -1) do Mongo).
+        """
+        eventos: List[Dict[str, Any]] = []
+        for segmento, tamanho in self._fotografia():
+            for doc in self._de_tras_para_frente(segmento, tamanho):
+                eventos.append(doc)
+                if len(eventos) >= n:
+                    return eventos
+        return eventos
+
+    def _para_frente(self, segmento: int, tamanho: int, pos: int = 0) -> Iterator[Tuple[int, int, Dict[str, Any]]]:
+        # (posição, posição seguinte, evento) do início do segmento para o fim
+        f = self._abrir(segmento) if tamanho > pos else None
+        if f is None:
+            return
+        with f, mmap.mmap(f.fileno(), tamanho, access=mmap.ACCESS_READ) as mm:
+            while pos < tamanho:
+                depois = _registro_valido(mm, pos, tamanho)
+                if depois is None:
+                    log_limitado(log, "diario.ler", "diário: registro inválido, parando a leitura",
+                                 segmento=segmento, posicao=pos)
+                    return
+                yield pos, depois, _decodificar(mm[pos + _CABECALHO.size:depois - _RODAPE.size])
+                pos = depois
+
+    def percorrer(self) -> Iterator[Dict[str, Any]]:
+        """
+        Todos os eventos retidos, do mais antigo para o mais novo.
+        """
+        for segmento, tamanho in reversed(self._fotografia()):
+            for _, _, doc in self._para_frente(segmento, tamanho):
+                yield doc
+
+    # -- reenvio para o Mongo --
+
+    def _caminho_posicao(self) -> str:
+        return os.path.join(self.pasta, "replicado.pos")
+
+    def _ler_posicao(self) -> Tuple[int, int]:
+        try:
+            with open(self._caminho_posicao(), encoding="utf-8") as f:
+                seg, pos = f.read().split()
+            return int(seg), int(pos)
+        except (FileNotFoundError, ValueError):
+            return (self._segmentos[0] if self._segmentos else 1), 0
+
+    def _gravar_posicao(self, segmento: int, posicao: int) -> None:
+        temp = self._caminho_posicao() + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            f.write(f"{segmento} {posicao}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self._caminho_posicao())
+        self._posicao = (segmento, posicao)
+
+    def pendente(self) -> bool:
+        """
+        Há eventos no diário que ainda não foram para o Mongo? Sem I/O.
+        """
+        if self.somente_leitura:
+            return False
+        with self._lock:
+            return self._posicao < (self._atual, self._tamanho)
+
+    def replicar(self, inserir: Callable[[List[Dict[str, Any]]], None], lote: int = 500) -> int:
+        """
+        Reenvia, em ordem, tudo depois da última posição confirmada.
+        Cada evento leva _id = "<pasta>:<segmento>:<posição>" (a pasta
+        separa os workers, que numeram segmentos do mesmo jeito), então
+        reenviar o mesmo trecho depois de uma queda não duplica nada no
+        Mongo (`inserir` deve ignorar erro de chave duplicada).
+        Retorna quantos eventos foram enviados.
+        """
+        if self.somente_leitura or not self._replicando.acquire(blocking=False):
+            return 0
+        try:
+            enviados = 0
+            prefixo = os.path.basename(os.path.normpath(self.pasta))
+            seg_inicio, pos_inicio = self._posicao
+            for segmento, tamanho in reversed(self._fotografia()):
+                if segmento < seg_inicio:
+                    continue
+                pos = pos_inicio if segmento == seg_inicio else 0
+                if tamanho <= pos:
+                    if (segmento, pos) > self._posicao:
+                        # segmento novo ainda vazio: senão pendente() seguiria True
+                        self._gravar_posicao(segmento, pos)
+                    continue
+                docs: List[Dict[str, Any]] = []
+                for posicao, pos, doc in self._para_frente(segmento, tamanho, pos):
+                    doc["_id"] = f"{prefixo}:{segmento:012d}:{posicao:012d}"
+                    docs.append(doc)
+                    if len(docs) >= lote:
+                        inserir(docs)
+                        enviados += len(docs)
+                        docs = []
+                        self._gravar_posicao(segmento, pos)
+                if docs:
+                    inserir(docs)
+                    enviados += len(docs)
+                self._gravar_posicao(segmento, pos)
+            return enviados
+        finally:
+            self._replicando.release()
+
+
+_diario: Optional[Diario] = None
+_diario_lock = threading.Lock()
+_orfaos_em: Optional[float] = None  # monotonic da última passada pelas pastas sem dono
+_somente_leitura = False
+
+
+def _opcoes() -> Dict[str, Any]:
+    return {
+        "fsync": TELEMETRIA_FSYNC,
+        "segmento_bytes": int(TELEMETRIA_SEGMENTO_MB * (1 << 20)),
+        "retencao": TELEMETRIA_RETENCAO_SEGMENTOS,
+    }
+
+
+def _pastas() -> List[str]:
+    # pastas de escritor (w-000, w-001, ...) em ordem
+    try:
+        nomes = os.listdir(TELEMETRIA_LOG_DIR)
+    except FileNotFoundError:
+        return []
+    numeros = sorted(int(m.group(1)) for m in map(_NOME_ESCRITOR.match, nomes) if m)
+    return [os.path.join(TELEMETRIA_LOG_DIR, f"w-{n:03d}") for n in numeros]
+
+
+def _abrir_proprio() -> Diario:
+    """
+    Fica dono da primeira pasta livre (a de um worker que morreu ou
+    reiniciou) ou cria a próxima.
+    """
+    os.makedirs(TELEMETRIA_LOG_DIR, exist_ok=True)
+    pastas = _pastas()
+    for pasta in pastas:
+        try:
+            return Diario(pasta, **_opcoes())
+        except DiarioOcupado:
+            continue
+    proximo = int(os.path.basename(pastas[-1])[2:]) + 1 if pastas else 0
+    while True:
+        # outro processo pode criar a mesma pasta ao mesmo tempo: quem perde o flock tenta a seguinte
+        try:
+            return Diario(os.path.join(TELEMETRIA_LOG_DIR, f"w-{proximo:03d}"), **_opcoes())
+        except DiarioOcupado:
+            proximo += 1
+
+
+def somente_leitura() -> None:
+    """
+    Para ferramentas de linha de comando que só leem (app/exportacao.py):
+    o processo não fica dono de pasta nenhuma nem mexe nos segmentos dos
+    workers do servidor; todas as pastas são lidas só para leitura.
+    """
+    global _somente_leitura
+    _somente_leitura = True
+
+
+def get_diario() -> Optional[Diario]:
+    """
+    Diário deste processo, aberto no primeiro uso.
+    None se TELEMETRIA_LOG_DIR estiver vazio (diário desligado) ou o
+    processo for só de leitura.
+    """
+    global _diario
+    if not TELEMETRIA_LOG_DIR or _somente_leitura:
+        return None
+    if _diario is None:
+        with _diario_lock:
+            if _diario is None:
+                _diario = _abrir_proprio()
+    return _diario
+
+
+def _leitores() -> List[Diario]:
+    # o diário deste processo + as pastas dos outros, só para leitura
+    if not TELEMETRIA_LOG_DIR:
+        return []
+    proprio = get_diario()
+    outros = [Diario(pasta, somente_leitura=True) for pasta in _pastas()
+              if proprio is None or pasta != proprio.pasta]
+    return ([proprio] if proprio is not None else []) + outros
+
+
+def _timestamp(evento: Dict[str, Any]) -> datetime:
+    return evento["timestamp"]
+
+
+def ultimos(n: int) -> List[Dict[str, Any]]:
+    """
+    Os n eventos mais recentes de todos os processos, do mais novo para o mais antigo.
+    """
+    por_pasta: List[Iterable[Dict[str, Any]]] = [d.ultimos(n) for d in _leitores()]
+    return list(itertools.islice(heapq.merge(*por_pasta, key=_timestamp, reverse=True), n))
+
+
+def percorrer() -> Iterator[Dict[str, Any]]:
+    """
+    Todos os eventos retidos de todos os processos, do mais antigo para o mais novo.
+    """
+    return heapq.merge(*(d.percorrer() for d in _leitores()), key=_timestamp)
+
+
+def _hora_dos_orfaos() -> bool:
+    return _orfaos_em is None or time.monotonic() - _orfaos_em >= TELEMETRIA_ORFAOS_SEG
+
+
+def pendente() -> bool:
+    """
+    Há algo para reenviar? O diário deste processo (sem I/O) ou, de tempos
+    em tempos, as pastas sem dono.
+    """
+    diario = get_diario()
+    return diario is not None and (diario.pendente() or _hora_dos_orfaos())
+
+
+def replicar(inserir: Callable[[List[Dict[str, Any]]], None], lote: int = 500) -> int:
+    """
+    Diario.replicar do diário deste processo e, a cada TELEMETRIA_ORFAOS_SEG,
+    das pastas sem dono (worker que não voltou): o flock de dono é tomado só
+    durante o reenvio. Retorna quantos eventos foram enviados.
+    """
+    global _orfaos_em
+    diario = get_diario()
+    if diario is None:
+        return 0
+    enviados = diario.replicar(inserir, lote)
+    if _hora_dos_orfaos():
+        for pasta in _pastas():
+            if pasta == diario.pasta:
+                continue
+            try:
+                orfao = Diario(pasta, **_opcoes())
+            except DiarioOcupado:
+                continue  # tem dono vivo, que reenvia a própria pasta
+            try:
+                enviados += orfao.replicar(inserir, lote)
+            finally:
+                orfao.fechar()
+        _orfaos_em = time.monotonic()
+    return enviados
+
+
+def fechar() -> None:
+    global _diario
+    with _diario_lock:
+        if _diario is not None:
+            _diario.fechar()
+            _diario = None
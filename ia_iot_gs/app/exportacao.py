@@ -0,0 +1,286 @@
+# app/exportacao.py
+"""
+Exportação colunar da telemetria e dos eventos IoT para análise offline.
+
+Os eventos são lidos em ordem de timestamp, em lotes (EXPORT_LOTE), e cada
+lote vira um RecordBatch do Arrow: os campos conhecidos viram colunas
+(categoria, ia_indicada, dificuldade, device...) e `payload`/`contexto`
+continuam inteiros como JSON (string).
+
+- exportar_parquet(): Parquet particionado por dia
+  (<destino>/<fonte>/dia=AAAA-MM-DD/parte-<execução>.parquet). Com
+  incremental=True só exporta o que veio depois da marca d'água salva na
+  execução anterior (<destino>/<fonte>/_watermark.json).
+- stream_arrow(): o mesmo conteúdo como stream IPC do Arrow (endpoint
+  /export/{fonte}.arrow), lote a lote.
+
+pyarrow é opcional e só é importado na primeira exportação (ele puxa o
+numpy, que não precisa entrar no boot do servidor): sem ele, a exportação
+levanta ExportacaoIndisponivel.
+
+Linha de comando (dentro de ia_iot_gs):
+    python -m app.exportacao telemetria --destino dados/exportacao --incremental
+
+A linha de comando só exporta a telemetria, que ela lê do Mongo ou do
+diário local (só leitura: não mexe nos segmentos dos workers do servidor).
+Os eventos IoT sem Mongo vivem na memória do servidor, então só saem
+pelo /export/iot.arrow.
+"""
+import argparse
+import json
+import os
+import uuid
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import diario
+from .iot import iterar_eventos_iot
+from .observabilidade import get_logger
+from .respostas import dumps
+from .telemetry import iterar_eventos
+
+log = get_logger("exportacao")
+
+EXPORT_LOTE = int(os.getenv("EXPORT_LOTE", "10000"))
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join("dados", "exportacao"))
+
+# fontes que a linha de comando consegue ler de outro processo
+FONTES_CLI = ("telemetria",)
+
+# fim do stream IPC: marcador de continuação + tamanho 0
+_FIM_STREAM = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+
+class ExportacaoIndisponivel(RuntimeError):
+    pass
+
+
+# ---------- COLUNAS ----------
+
+def _payload(e: Dict[str, Any]) -> Dict[str, Any]:
+    return e.get("payload") if isinstance(e.get("payload"), dict) else {}
+
+
+def _contexto(e: Dict[str, Any]) -> Dict[str, Any]:
+    return e.get("contexto") if isinstance(e.get("contexto"), dict) else {}
+
+
+def _json(valor: Any) -> Optional[str]:
+    return dumps(valor).decode("utf-8") if valor else None
+
+
+def _inteiro(valor: Any) -> Optional[int]:
+    # campos vindos do Gemini podem chegar como "30" ou 30.0
+    try:
+        return int(valor) if valor is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _real(valor: Any) -> Optional[float]:
+    try:
+        return float(valor) if valor is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+# (coluna, tipo, extrator)
+Coluna = Tuple[str, str, Callable[[Dict[str, Any]], Any]]
+
+COLUNAS: Dict[str, List[Coluna]] = {
+    "telemetria": [
+        ("timestamp", "timestamp", lambda e: e["timestamp"]),
+        ("usuario_id", "string", lambda e: e.get("usuario_id")),
+        ("evento", "string", lambda e: e.get("evento")),
+        # mesma regra dos analytics: o campo do evento, senão o do payload
+        ("categoria", "string", lambda e: e.get("categoria") or _payload(e).get("categoria")),
+        ("ia_indicada", "string", lambda e: e.get("ia_indicada") or _payload(e).get("ia_indicada")),
+        ("sucesso", "bool", lambda e: e.get("sucesso")),
+        ("duracao_seg", "float", lambda e: _real(e.get("duracao_seg"))),
+        ("dificuldade", "string", lambda e: _payload(e).get("dificuldade")),
+        ("tempo_estimado_min", "int", lambda e: _inteiro(_payload(e).get("tempo_estimado_min"))),
+        ("device", "string", lambda e: _contexto(e).get("device")),
+        ("plataforma", "string", lambda e: _contexto(e).get("plataforma")),
+        ("payload", "string", lambda e: _json(e.get("payload"))),
+        ("contexto", "string", lambda e: _json(e.get("contexto"))),
+    ],
+    "iot": [
+        ("timestamp", "timestamp", lambda e: e["timestamp"]),
+        ("device_id", "string", lambda e: e.get("device_id")),
+        ("usuario_id", "string", lambda e: e.get("usuario_id")),
+        ("evento", "string", lambda e: e.get("evento")),
+        ("metadata", "string", lambda e: _json(e.get("metadata"))),
+    ],
+}
+
+FONTES: Dict[str, Callable[[Optional[datetime]], Iterator[Dict[str, Any]]]] = {
+    "telemetria": lambda desde: iterar_eventos(desde, lote=EXPORT_LOTE),
+    "iot": iterar_eventos_iot,
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow  # type: ignore
+    except ImportError:
+        raise ExportacaoIndisponivel("pyarrow não está instalado (pip install pyarrow)") from None
+    return pyarrow
+
+
+def esquema(fonte: str):
+    pa = _pyarrow()
+    tipos = {
+        "string": pa.string(),
+        "bool": pa.bool_(),
+        "float": pa.float64(),
+        "int": pa.int64(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([(nome, tipos[tipo]) for nome, tipo, _ in COLUNAS[fonte]])
+
+
+def lotes(fonte: str, desde: Optional[datetime] = None, tamanho: int = EXPORT_LOTE) -> Iterator[Tuple[Any, List[date]]]:
+    """
+    RecordBatches de até `tamanho` eventos (+ o dia de cada linha),
+    sem carregar a fonte inteira na memória.
+    """
+    pa = _pyarrow()
+    schema = esquema(fonte)
+    colunas = COLUNAS[fonte]
+    valores: List[List[Any]] = [[] for _ in colunas]
+    dias: List[date] = []
+
+    def fechar_lote():
+        arrays = [pa.array(vals, type=campo.type) for vals, campo in zip(valores, schema)]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema), dias
+
+    for evento in FONTES[fonte](desde):
+        for i, (_, _, extrair) in enumerate(colunas):
+            valores[i].append(extrair(evento))
+        dias.append(evento["timestamp"].date())
+        if len(dias) >= tamanho:
+            yield fechar_lote()
+            valores = [[] for _ in colunas]
+            dias = []
+    if dias:
+        yield fechar_lote()
+
+
+def stream_arrow(fonte: str, desde: Optional[datetime] = None) -> Iterator[bytes]:
+    """
+    Stream IPC do Arrow: esquema, um RecordBatch por lote e o marcador de fim.
+    """
+    yield esquema(fonte).serialize().to_pybytes()
+    for batch, _ in lotes(fonte, desde):
+        yield batch.serialize().to_pybytes()
+    yield _FIM_STREAM
+
+
+# ---------- PARQUET ----------
+
+def _caminho_watermark(destino: str, fonte: str) -> str:
+    return os.path.join(destino, fonte, "_watermark.json")
+
+
+def ler_watermark(destino: str, fonte: str) -> Optional[datetime]:
+    try:
+        with open(_caminho_watermark(destino, fonte), encoding="utf-8") as f:
+            return datetime.fromisoformat(json.load(f)["timestamp"])
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+
+def _gravar_watermark(destino: str, fonte: str, timestamp: datetime, eventos: int) -> None:
+    caminho = _caminho_watermark(destino, fonte)
+    temp = caminho + ".tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump({"timestamp": timestamp.isoformat(), "eventos": eventos,
+                   "exportado_em": datetime.utcnow().isoformat()}, f)
+    os.replace(temp, caminho)
+
+
+def exportar_parquet(fonte: str, destino: str = EXPORT_DIR, incremental: bool = False) -> Dict[str, Any]:
+    """
+    Exporta `fonte` ("telemetria" ou "iot") para Parquet particionado por dia.
+
+    Cada execução cria um arquivo novo por dia tocado (nunca reescreve os
+    anteriores). Os arquivos são gravados como .tmp e renomeados no fim;
+    a marca d'água só avança depois disso, então uma execução que falhar
+    no meio é simplesmente refeita na próxima.
+
+    Obs.: a marca d'água é o maior timestamp exportado; eventos que chegam
+    depois com timestamp mais antigo (ex.: diário reenviado ao Mongo) ficam
+    para uma exportação completa.
+    """
+    _pyarrow()
+    import pyarrow.parquet as pq  # type: ignore
+
+    schema = esquema(fonte)
+    desde = ler_watermark(destino, fonte) if incremental else None
+    execucao = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+    escritores: Dict[date, Any] = {}
+    caminhos: Dict[date, str] = {}
+    eventos = 0
+    maior: Optional[datetime] = desde
+
+    try:
+        for batch, dias in lotes(fonte, desde):
+            # os eventos vêm em ordem de timestamp: cada dia é um trecho contínuo
+            inicio = 0
+            for i in range(1, len(dias) + 1):
+                if i < len(dias) and dias[i] == dias[inicio]:
+                    continue
+                dia = dias[inicio]
+                if dia not in escritores:
+                    pasta = os.path.join(destino, fonte, f"dia={dia.isoformat()}")
+                    os.makedirs(pasta, exist_ok=True)
+                    caminhos[dia] = os.path.join(pasta, f"parte-{execucao}.parquet")
+                    escritores[dia] = pq.ParquetWriter(caminhos[dia] + ".tmp", schema, compression="zstd")
+                escritores[dia].write_batch(batch.slice(inicio, i - inicio))
+                inicio = i
+
+            eventos += batch.num_rows
+            ultimo = batch.column(0)[-1].as_py().replace(tzinfo=None)
+            maior = ultimo if maior is None or ultimo > maior else maior
+    except BaseException:
+        for dia, escritor in escritores.items():
+            escritor.close()
+            os.remove(caminhos[dia] + ".tmp")
+        raise
+
+    for dia, escritor in escritores.items():
+        escritor.close()
+        os.replace(caminhos[dia] + ".tmp", caminhos[dia])
+
+    if maior is not None and eventos:
+        os.makedirs(os.path.join(destino, fonte), exist_ok=True)
+        _gravar_watermark(destino, fonte, maior, eventos)
+
+    resumo = {
+        "fonte": fonte,
+        "eventos": eventos,
+        "arquivos": sorted(caminhos.values()),
+        "watermark": maior.isoformat() if maior else None,
+    }
+    log.info("exportação concluída", extra={k: v for k, v in resumo.items() if k != "arquivos"})
+    return resumo
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Exporta telemetria/IoT para Parquet particionado por dia.")
+    parser.add_argument("fonte", choices=FONTES_CLI)
+    parser.add_argument("--destino", default=EXPORT_DIR)
+    parser.add_argument("--incremental", action="store_true", help="só o que veio depois da última marca d'água")
+    args = parser.parse_args()
+    diario.somente_leitura()
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    resumo = exportar_parquet(args.fonte, args.destino, args.incremental)
+    print(json.dumps(resumo, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
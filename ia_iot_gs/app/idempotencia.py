@@ -0,0 +1,51 @@
+# app/idempotencia.py
+import os
+import threading
+from collections import OrderedDict
+
+# Descarte de eventos repetidos (retries do app) antes de qualquer I/O.
+#
+# O cliente manda um evento_id opcional. Cada processo guarda os últimos
+# IDEMPOTENCIA_LRU ids num conjunto LRU exato: está lá -> duplicado,
+# descarta; não está -> segue adiante e o índice único do Mongo
+# (evento_id) dá a palavra final (retry que caiu em outro worker, ou id
+# que já saiu do LRU). Exato: nunca descarta evento válido.
+
+IDEMPOTENCIA_LRU = int(os.getenv("IDEMPOTENCIA_LRU", "200000"))
+
+
+class FiltroDuplicados:
+    def __init__(self, lru: int = IDEMPOTENCIA_LRU):
+        self.lru_max = lru
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        # contadores para /metrics e para o benchmark
+        self.novos = 0
+        self.duplicados = 0
+
+    def duplicado(self, chave: str) -> bool:
+        """
+        True se `chave` está entre as últimas vistas.
+        Caso contrário registra a chave e retorna False.
+        """
+        with self._lock:
+            if chave in self._lru:
+                self._lru.move_to_end(chave)
+                self.duplicados += 1
+                return True
+            self._lru[chave] = None
+            if len(self._lru) > self.lru_max:
+                self._lru.popitem(last=False)
+            self.novos += 1
+            return False
+
+
+TELEMETRIA = FiltroDuplicados()
+IOT = FiltroDuplicados()
+
+
+def eh_chave_duplicada(erro: Exception) -> bool:
+    """
+    DuplicateKeyError (11000) do pymongo, sem importar o pymongo.
+    """
+    return getattr(erro, "code", None) == 11000
@@ -1,37 +1,92 @@
 # app/iot.py
-from typing import Dict, List
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+from . import idempotencia
 from .models import Device, IotEvent
+from .observabilidade import EVENTOS_DUPLICADOS, cronometrar
+from .repositorios import criar_repositorio
+from .sessoes import Sessionizador
 
-DEVICES: Dict[str, Device] = {}
+# Mongo (coleção "devices") quando disponível, senão memória do processo
+DEVICES = criar_repositorio("devices", Device, indices=("tipo", "local", "capacidade"))
 IOT_EVENTS: List[Dict] = []
 
 
+def _local_do_device(device_id: str) -> Optional[str]:
+    device = DEVICES.get(device_id)
+    return device.local if device is not None else None
+
+
+# sessões de estudo por (usuário, device), alimentadas por save_iot_event
+SESSOES = Sessionizador(local_do_device=_local_do_device)
+
+
 def upsert_device(device: Device) -> Device:
-    DEVICES[device.id] = device
-    return device
+    return DEVICES.upsert(device)
 
 
 def list_devices() -> List[Device]:
-    return list(DEVICES.values())
+    return DEVICES.listar()
+
+
+def list_devices_pagina(
+    apos: Optional[str] = None,
+    limite: int = 100,
+    tipo: Optional[str] = None,
+    local: Optional[str] = None,
+    capacidade: Optional[str] = None,
+) -> Dict:
+    """
+    Página de devices ordenada por id (keyset): passe o "proximo" da
+    resposta anterior em `apos` para continuar. Filtros usam os índices.
+    """
+    devices = DEVICES.pagina(apos=apos, limite=limite, tipo=tipo, local=local, capacidade=capacidade)
+    proximo = devices[-1].id if len(devices) == limite else None
+    return {"devices": devices, "proximo": proximo}
 
 
 def save_iot_event(evt: IotEvent) -> Dict:
+    # retry do device com o mesmo evento_id: descarta antes de gravar
+    if evt.evento_id and idempotencia.IOT.duplicado(evt.evento_id):
+        EVENTOS_DUPLICADOS.inc("iot", "filtro")
+        return {"ok": True, "total_events": len(IOT_EVENTS), "duplicado": True}
     data = evt.model_dump()
+    data["timestamp"] = datetime.utcnow()
     IOT_EVENTS.append(data)
+    SESSOES.registrar(data)
     return {"ok": True, "total_events": len(IOT_EVENTS)}
 
 
-def current_context_for_user(usuario_id: str) -> Dict:
+def iterar_eventos_iot(desde: Optional[datetime] = None) -> Iterator[Dict]:
     """
-    Contexto bem simples: último evento IoT + últimos eventos de telemetria.
+    Eventos IoT em ordem de chegada (só os posteriores a `desde`).
     """
-    from .telemetry import EVENTS
+    # lista só cresce: fixa o tamanho atual em vez de copiar
+    for e in islice(IOT_EVENTS, len(IOT_EVENTS)):
+        if desde is None or e["timestamp"] > desde:
+            yield e
 
-    last_iot = next((e for e in reversed(IOT_EVENTS) if e.get("usuario_id") == usuario_id), None)
-    last_mentor = next((e for e in reversed(EVENTS) if e.get("usuario_id") == usuario_id), None)
 
+@cronometrar("current_context_for_user")
+def current_context_for_user(usuario_id: str) -> Dict:
+    """
+    Contexto do usuário: sessão de estudo em andamento, último evento IoT,
+    minutos estudados hoje e a última interação registrada na telemetria.
+    Tudo vem de estado mantido na escrita; nada varre IOT_EVENTS.
+    """
+    from .telemetry import ultimo_evento_usuario
+
+    contexto = SESSOES.contexto(usuario_id)
     return {
         "usuario_id": usuario_id,
-        "ultimo_iot": last_iot,
-        "ultima_interacao_mentor": last_mentor,
+        "ultimo_iot": contexto["ultimo_iot"],
+        "ultima_interacao_mentor": ultimo_evento_usuario(usuario_id),
+        "sessao_atual": contexto["sessao_atual"],
+        "minutos_estudo_hoje": contexto["minutos_estudo_hoje"],
     }
+
+
+@cronometrar("resumo_estudo")
+def resumo_estudo(usuario_id: str, dias: int = 7) -> Dict:
+    return SESSOES.resumo(usuario_id, dias=dias)
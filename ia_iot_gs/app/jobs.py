@@ -0,0 +1,379 @@
+# app/jobs.py
+import asyncio
+import hashlib
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .admissao import LLM_ESPERA_VAGA_FUNDO_SEG, prazo_vaga_llm
+from .db import get_collection, marcar_falha
+from .mentor import gerar_plano_estudo
+from .observabilidade import JOBS_ESPERA, JOBS_FINALIZADOS, get_logger, log_limitado, medir
+from .telemetry import save_event
+from .vision import analisar_imagem
+
+log = get_logger("jobs")
+
+# Jobs assíncronos para as chamadas longas ao Gemini (visão e plano de
+# estudo): o POST devolve um job_id na hora e o cliente consulta depois
+# (GET /jobs/{id}, com long-poll opcional), sem segurar a conexão
+# durante a chamada ao modelo. O long-poll espera no event loop (uma
+# future acordada quando o job termina), sem ocupar thread do threadpool.
+#
+# - Pool fixo de JOBS_WORKERS threads consumindo uma fila de prioridade
+#   (alta / normal / baixa; FIFO dentro da mesma prioridade), limitada a
+#   JOBS_FILA_MAX jobs pendentes (cheia -> FilaCheia, 503 no endpoint).
+# - Deduplicação: um job idêntico (mesmo tipo, parâmetros e usuário) ainda
+#   pendente ou rodando é reaproveitado em vez de enfileirar outro; é o
+#   caso do app que reenvia depois de um timeout.
+# - Cancelamento: cada reenvio deduplicado conta como mais um interessado;
+#   o job só é cancelado quando todos cancelam. Um job já rodando não é
+#   interrompido (a chamada ao Gemini segue), mas o resultado é descartado.
+# - Resultados ficam JOBS_TTL_SEG na memória do processo e, com Mongo, na
+#   coleção "jobs" (índice TTL em expira_em), onde qualquer worker consulta;
+#   cada mudança de status (pendente, executando, fim) é gravada lá.
+#   Cancelar só funciona no processo que recebeu o job.
+
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "4"))
+JOBS_FILA_MAX = int(os.getenv("JOBS_FILA_MAX", "500"))
+JOBS_TTL_SEG = float(os.getenv("JOBS_TTL_SEG", "900"))
+JOBS_ESPERA_MAX_SEG = float(os.getenv("JOBS_ESPERA_MAX_SEG", "30"))
+JOBS_IMAGEM_MAX_MB = float(os.getenv("JOBS_IMAGEM_MAX_MB", "10"))
+
+PRIORIDADES = {"alta": 0, "normal": 1, "baixa": 2}
+FINALIZADOS = {"concluido", "erro", "cancelado"}
+
+
+class FilaCheia(RuntimeError):
+    pass
+
+
+class Job:
+    __slots__ = (
+        "id", "tipo", "params", "chave", "prioridade", "status", "resultado", "erro",
+        "criado_em", "iniciado_em", "finalizado_em", "interessados", "enfileirado", "esperando", "gravando",
+    )
+
+    def __init__(self, tipo: str, params: Dict[str, Any], chave: str, prioridade: str):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.params = params
+        self.chave = chave
+        self.prioridade = prioridade
+        self.status = "pendente"
+        self.resultado: Any = None
+        self.erro: Optional[str] = None
+        self.criado_em = datetime.utcnow()
+        self.iniciado_em: Optional[datetime] = None
+        self.finalizado_em: Optional[datetime] = None
+        self.interessados = 1
+        self.enfileirado = time.monotonic()
+        # long-polls esperando o fim: (event loop, future)
+        self.esperando: List[Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]] = []
+        # serializa as gravações no Mongo: a última gravada é o estado mais novo
+        self.gravando = threading.Lock()
+
+    def publico(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "tipo": self.tipo,
+            "status": self.status,
+            "prioridade": self.prioridade,
+            "criado_em": self.criado_em,
+            "iniciado_em": self.iniciado_em,
+            "finalizado_em": self.finalizado_em,
+            "resultado": self.resultado,
+            "erro": self.erro,
+        }
+
+
+# ---------- EXECUTORES ----------
+
+def _executar_visao(params: Dict[str, Any]) -> Any:
+    data = analisar_imagem(params["imagem"], params["mime_type"])
+    # mesma telemetria do endpoint síncrono
+    save_event(usuario_id=params["usuario_id"], evento="visao_ambiente", payload=data)
+    return data
+
+
+def _executar_plano(params: Dict[str, Any]) -> Any:
+    return gerar_plano_estudo(params["objetivo"], params["horas_semana"])
+
+
+EXECUTORES: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "visao": _executar_visao,
+    "plano_estudo": _executar_plano,
+}
+
+
+# ---------- ESTADO ----------
+
+_JOBS: Dict[str, Job] = {}
+_ATIVOS: Dict[str, str] = {}                    # chave de dedup -> job pendente/rodando
+_fila: List[Tuple[int, int, str]] = []          # (prioridade, ordem, job_id)
+_expiracao: Deque[Tuple[float, str]] = deque()  # (monotonic, job_id), em ordem: TTL é fixo
+_pendentes = 0
+_seq = itertools.count()
+_cond = threading.Condition()
+_parar = threading.Event()
+_workers: List[threading.Thread] = []
+_indice_ok = False
+
+
+def _chave(tipo: str, *partes: Any) -> str:
+    h = hashlib.sha256(tipo.encode("utf-8"))
+    for parte in partes:
+        h.update(b"\x00")
+        h.update(parte if isinstance(parte, bytes) else str(parte).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _limpar_expirados() -> None:
+    # chamado com _cond
+    agora = time.monotonic()
+    while _expiracao and _expiracao[0][0] <= agora:
+        _, job_id = _expiracao.popleft()
+        _JOBS.pop(job_id, None)
+
+
+def _enfileirar(job: Job) -> None:
+    heapq.heappush(_fila, (PRIORIDADES[job.prioridade], next(_seq), job.id))
+
+
+def submeter(tipo: str, params: Dict[str, Any], chave: str, prioridade: str = "normal") -> Tuple[Job, bool]:
+    """
+    Enfileira um job (ou reaproveita um idêntico ainda pendente/rodando).
+    Retorna (job, deduplicado). Levanta FilaCheia se a fila estiver no limite.
+    """
+    global _pendentes
+    with _cond:
+        _limpar_expirados()
+        existente = _JOBS.get(_ATIVOS.get(chave, ""))
+        if existente is not None:
+            existente.interessados += 1
+            if existente.status == "pendente" and PRIORIDADES[prioridade] < PRIORIDADES[existente.prioridade]:
+                # sobe de prioridade: a entrada antiga na fila é ignorada pelos workers
+                existente.prioridade = prioridade
+                _enfileirar(existente)
+            return existente, True
+
+        if _pendentes >= JOBS_FILA_MAX:
+            raise FilaCheia(f"{_pendentes} jobs pendentes")
+        job = Job(tipo, params, chave, prioridade)
+        _JOBS[job.id] = job
+        _ATIVOS[chave] = job.id
+        _enfileirar(job)
+        _pendentes += 1
+        _cond.notify()
+
+    _persistir(job)
+    return job, False
+
+
+def submeter_visao(imagem: bytes, mime_type: str, usuario_id: str = "anon", prioridade: str = "normal") -> Tuple[Job, bool]:
+    params = {"imagem": imagem, "mime_type": mime_type, "usuario_id": usuario_id}
+    return submeter("visao", params, _chave("visao", imagem, mime_type, usuario_id), prioridade)
+
+
+def submeter_plano(objetivo: str, horas_semana: int, usuario_id: str = "anon", prioridade: str = "normal") -> Tuple[Job, bool]:
+    params = {"objetivo": objetivo, "horas_semana": horas_semana}
+    return submeter("plano_estudo", params, _chave("plano_estudo", objetivo, horas_semana, usuario_id), prioridade)
+
+
+def _finalizar(job: Job, status: str, resultado: Any = None, erro: Optional[str] = None) -> None:
+    # chamado com _cond
+    job.status = status
+    job.resultado = resultado
+    job.erro = erro
+    job.finalizado_em = datetime.utcnow()
+    job.params = {}  # solta a imagem
+    if _ATIVOS.get(job.chave) == job.id:
+        del _ATIVOS[job.chave]
+    _expiracao.append((time.monotonic() + JOBS_TTL_SEG, job.id))
+    for loop, futuro in job.esperando:
+        loop.call_soon_threadsafe(_acordar, futuro)
+    job.esperando = []
+
+
+def _acordar(futuro: "asyncio.Future[None]") -> None:
+    if not futuro.done():
+        futuro.set_result(None)
+
+
+def cancelar(job_id: str) -> Optional[Job]:
+    """
+    Retira um interessado do job; sem nenhum, cancela. None se o job não
+    está neste processo (ou já expirou).
+    """
+    global _pendentes
+    with _cond:
+        job = _JOBS.get(job_id)
+        if job is None or job.status in FINALIZADOS:
+            return job
+        job.interessados -= 1
+        if job.interessados > 0:
+            return job
+        if job.status == "pendente":
+            _pendentes -= 1
+        _finalizar(job, "cancelado")
+
+    JOBS_FINALIZADOS.inc(job.tipo, "cancelado")
+    _persistir(job)
+    return job
+
+
+async def obter(job_id: str, esperar: float = 0) -> Optional[Dict[str, Any]]:
+    """
+    Estado do job. Com esperar > 0 (long-poll), segura até o job terminar
+    ou o prazo (limitado a JOBS_ESPERA_MAX_SEG) acabar, sem bloquear thread.
+    """
+    with _cond:
+        _limpar_expirados()
+        job = _JOBS.get(job_id)
+        if job is not None and esperar > 0 and job.status not in FINALIZADOS:
+            loop = asyncio.get_running_loop()
+            espera = (loop, loop.create_future())
+            job.esperando.append(espera)
+        else:
+            espera = None
+    if job is None:
+        return await asyncio.to_thread(_carregar, job_id)
+    if espera is not None:
+        try:
+            await asyncio.wait_for(espera[1], min(esperar, JOBS_ESPERA_MAX_SEG))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with _cond:
+                if espera in job.esperando:
+                    job.esperando.remove(espera)
+    return job.publico()
+
+
+# ---------- WORKERS ----------
+
+def _proximo() -> Optional[Job]:
+    global _pendentes
+    with _cond:
+        while True:
+            while not _fila and not _parar.is_set():
+                _cond.wait()
+            if _parar.is_set():
+                return None
+            prioridade, _, job_id = heapq.heappop(_fila)
+            job = _JOBS.get(job_id)
+            # cancelado, ou entrada antiga de um job que subiu de prioridade
+            if job is None or job.status != "pendente" or PRIORIDADES[job.prioridade] != prioridade:
+                continue
+            job.status = "executando"
+            job.iniciado_em = datetime.utcnow()
+            _pendentes -= 1
+            return job
+
+
+def _loop() -> None:
+    # job não tem cliente esperando a resposta: aguarda mais por uma vaga do LLM
+    prazo_vaga_llm.set(LLM_ESPERA_VAGA_FUNDO_SEG)
+    while True:
+        job = _proximo()
+        if job is None:
+            return
+        JOBS_ESPERA.observar(time.monotonic() - job.enfileirado, job.tipo)
+        _persistir(job)  # "executando", visível para os outros workers
+        resultado, erro = None, None
+        try:
+            resultado = EXECUTORES[job.tipo](job.params)
+        except HTTPException as e:
+            erro = str(e.detail)
+        except Exception as e:
+            erro = repr(e)
+            log_limitado(log, f"jobs.{job.tipo}", "erro ao executar job", job_id=job.id, erro=erro)
+
+        with _cond:
+            if job.status == "cancelado":
+                # cancelado enquanto rodava: resultado descartado
+                continue
+            _finalizar(job, "erro" if erro is not None else "concluido", resultado, erro)
+        JOBS_FINALIZADOS.inc(job.tipo, job.status)
+        _persistir(job)
+
+
+def iniciar_jobs() -> None:
+    if any(t.is_alive() for t in _workers):
+        return
+    _parar.clear()
+    _workers.clear()
+    for i in range(JOBS_WORKERS):
+        t = threading.Thread(target=_loop, name=f"jobs-{i}", daemon=True)
+        t.start()
+        _workers.append(t)
+
+
+def parar_jobs() -> None:
+    """
+    Para os workers. Jobs ainda pendentes se perdem (o cliente reenvia).
+    """
+    _parar.set()
+    with _cond:
+        _cond.notify_all()
+    for t in _workers:
+        t.join(timeout=5)
+    _workers.clear()
+
+
+# ---------- MONGO ----------
+
+def _jobs_col():
+    global _indice_ok
+    col = get_collection("jobs")
+    if col is not None and not _indice_ok:
+        _indice_ok = True
+        try:
+            with medir("mongo"):
+                col.create_index("expira_em", expireAfterSeconds=0)
+        except Exception as e:
+            log_limitado(log, "jobs.indice", "não foi possível criar o índice TTL de jobs", erro=repr(e))
+    return col
+
+
+def _persistir(job: Job) -> None:
+    col = _jobs_col()
+    if col is None:
+        return
+    # submeter, o worker e cancelar gravam de threads diferentes: com o lock do
+    # job, a fotografia e a escrita andam juntas e a última escrita é a mais nova
+    with job.gravando:
+        doc = job.publico()
+        doc["_id"] = job.id
+        doc["expira_em"] = datetime.utcnow() + timedelta(seconds=JOBS_TTL_SEG)
+        try:
+            with medir("mongo"):
+                col.replace_one({"_id": job.id}, doc, upsert=True)
+        except Exception as e:
+            marcar_falha()
+            log_limitado(log, "jobs.salvar", "erro ao salvar job no Mongo", erro=repr(e))
+
+
+def _carregar(job_id: str) -> Optional[Dict[str, Any]]:
+    col = _jobs_col()
+    if col is None:
+        return None
+    try:
+        with medir("mongo"):
+            doc = col.find_one({"_id": job_id}, {"_id": 0})
+    except Exception as e:
+        marcar_falha()
+        log_limitado(log, "jobs.ler", "erro ao ler job do Mongo", erro=repr(e))
+        return None
+    # o monitor de TTL do Mongo roda a cada ~60 s: confere a expiração aqui
+    if doc is None or doc.pop("expira_em") <= datetime.utcnow():
+        return None
+    return doc
@@ -0,0 +1,75 @@
+# app/llm.py
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+
+from .admissao import vaga_llm
+
+# Cliente Gemini compartilhado por mentor e visão. O SDK (google.genai)
+# é pesado para importar, então só é carregado na primeira chamada,
+# e o cliente é reaproveitado enquanto a chave não mudar.
+#
+# O cliente entregue vem embrulhado em _ClienteComTeto: cada
+# models.generate_content ocupa uma vaga do teto LLM_MAX_CONCORRENCIA
+# (app/admissao.py), venha de uma rota, de um job ou do agendador.
+
+_clientes: Dict[str, Any] = {}
+_lock = threading.Lock()
+_cliente_fixo: Optional[Any] = None
+
+
+class _ModelosComTeto:
+    def __init__(self, modelos: Any):
+        self._modelos = modelos
+
+    def generate_content(self, *args, **kwargs):
+        with vaga_llm():
+            return self._modelos.generate_content(*args, **kwargs)
+
+    def generate_content_stream(self, *args, **kwargs):
+        with vaga_llm():
+            yield from self._modelos.generate_content_stream(*args, **kwargs)
+
+    def __getattr__(self, nome: str):
+        return getattr(self._modelos, nome)
+
+
+class _ClienteComTeto:
+    def __init__(self, cliente: Any):
+        self._cliente = cliente
+        self.models = _ModelosComTeto(cliente.models)
+
+    def __getattr__(self, nome: str):
+        return getattr(self._cliente, nome)
+
+
+def usar_cliente(cliente: Optional[Any]) -> None:
+    """
+    Troca o cliente Gemini por outro objeto com a mesma interface
+    (ex.: o falso de bench/fakes.py). None volta ao SDK real.
+    """
+    global _cliente_fixo
+    _cliente_fixo = _ClienteComTeto(cliente) if cliente is not None else None
+
+
+def get_gemini_client():
+    if _cliente_fixo is not None:
+        return _cliente_fixo
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise HTTPException(status_code=500, detail="GEMINI_API_KEY não configurada.")
+
+    cliente = _clientes.get(api_key)
+    if cliente is None:
+        with _lock:
+            cliente = _clientes.get(api_key)
+            if cliente is None:
+                import google.genai as genai
+
+                cliente = _ClienteComTeto(genai.Client(api_key=api_key))
+                _clientes.clear()
+                _clientes[api_key] = cliente
+    return cliente
@@ -1,28 +1,93 @@
-from fastapi import FastAPI, Query, UploadFile, File
+from contextlib import asynccontextmanager
+
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, HTTPException, Query, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import List, Literal, Optional
 
 from dotenv import load_dotenv
 import os
 
-from .models import MentorRequest, MentorResponse, TelemetriaEvent, UserProfile, Device, IotEvent
+from .observabilidade import configurar_logging, parar_logging, get_logger, middleware_tempos, exportar_metricas
+from .models import (
+    MentorRequest, MentorResponse, TelemetriaEvent, UserProfile, Device, IotEvent,
+    TelemetriaLista, DevicesPagina, IasMaisUsadas, UsoPorCategoria, ConsumoUsuario,
+)
 from .eco import eco_ranking, simular_impacto
-from .mentor import explain_task, gerar_resumo_uso_ia, gerar_plano_estudo, refinar_resultado
+from .mentor import explain_task, gerar_plano_estudo, refinar_resultado
 from .store import IAS
 from .telemetry import save_event, list_events
 from .analytics import ias_mais_usadas, uso_por_categoria, consumo_eco_estimado_por_usuario
 from .users import upsert_user, get_user, recomendar_ias_para_usuario
-from .iot import upsert_device, list_devices, save_iot_event, current_context_for_user
-from .vision import analisar_ambiente_trabalho
+from .iot import DEVICES, upsert_device, list_devices_pagina, save_iot_event, current_context_for_user, resumo_estudo
+from .vision import VISAO_LOTE_MAX_TOTAL, VISAO_LOTE_MAX_TOTAL_MB, analisar_ambiente_trabalho, analisar_imagens
+from .resumos import obter_resumo, iniciar_agendador, parar_agendador
+from .sketches import (
+    SKETCH_DIAS, iniciar_publicacao, parar_publicacao, ias_mais_usadas_aprox, uso_por_categoria_aprox,
+    usuarios_ativos_aprox,
+)
+from .sessoes import SESSAO_DIAS
+from .carbono import CARBONO_DIAS, consumo_por_dia, iniciar_carbono, parar_carbono
+from .recomendacao import iniciar_recomendacao, parar_recomendacao
+from .respostas import RespostaJSON, resposta_ndjson, percorrer_paginas
+from .exportacao import ExportacaoIndisponivel, esquema, stream_arrow
+from .db import fechar as fechar_db
+from .diario import fechar as fechar_diario
+from .admissao import middleware_admissao
+from .perfil import RotaPerfilada
+from .jobs import (
+    JOBS_IMAGEM_MAX_MB, FilaCheia, cancelar, iniciar_jobs, obter, parar_jobs, submeter_plano, submeter_visao,
+)
 from . import analytics  # se tiver router extra, você pode usar app.include_router(analytics.router) depois
 
 from pydantic import BaseModel
 
-load_dotenv()
+log = get_logger("main")
 
-print("DEBUG_GEMINI_KEY_PRESENT:", bool(os.getenv("GEMINI_API_KEY")))
 
-app = FastAPI(title="GS – Disruptive Architectures API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Tudo que não precisa acontecer na importação fica aqui: .env, logging
+    e o agendador de resumos. Mongo e o SDK do Gemini continuam lazy
+    (conectam/importam no primeiro uso), então o boot não depende deles.
+    """
+    load_dotenv()
+    configurar_logging()
+    log.info("configuração carregada", extra={"gemini_key_presente": bool(os.getenv("GEMINI_API_KEY"))})
+    iniciar_agendador()
+    iniciar_publicacao()
+    iniciar_jobs()
+    iniciar_carbono()
+    iniciar_recomendacao()
+    try:
+        yield
+    finally:
+        parar_recomendacao()
+        parar_carbono()
+        parar_jobs()
+        parar_publicacao()
+        parar_agendador()
+        fechar_diario()
+        fechar_db()
+        parar_logging()
+
+
+# orjson como resposta padrão. Endpoints com payload grande devolvem
+# RespostaJSON direto: o response_model fica só para a documentação e
+# o FastAPI pula a validação + jsonable_encoder.
+app = FastAPI(
+    title="GS – Disruptive Architectures API",
+    version="0.1.0",
+    default_response_class=RespostaJSON,
+    lifespan=lifespan,
+)
+
+# perfil sob demanda (header X-Perfil ou amostragem, ver app/perfil.py);
+# precisa vir antes das rotas
+app.router.route_class = RotaPerfilada
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,12 +97,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# cotas das rotas que chamam o Gemini (ver app/admissao.py; o teto de concorrência é em app/llm.py);
+# registrado antes do de tempos para os 429 também aparecerem em /metrics
+app.middleware("http")(middleware_admissao)
+
+# tempo por requisição (handler / mongo / llm) -> /metrics
+app.middleware("http")(middleware_tempos)
+
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    """
+    Métricas no formato texto do Prometheus.
+    """
+    return PlainTextResponse(exportar_metricas(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/tarefas/analisar")
 def tarefas_analisar(payload: dict):
     texto = (payload.get("descricao") or "").lower()
@@ -84,12 +164,33 @@ def telemetria(evt: TelemetriaEvent):
         sucesso=evt.sucesso,
         duracao_seg=evt.duracao_seg,
         contexto=evt.contexto,
+        evento_id=evt.evento_id,
     )
 
 
-@app.get("/events/telemetria")
+@app.get("/events/telemetria", response_model=TelemetriaLista)
 def listar_telemetria():
-    return {"eventos": list_events()}
+    # registros já são dicts (datetime incluso): orjson serializa direto
+    return RespostaJSON({"eventos": list_events()})
+
+
+@app.get("/export/{fonte}.arrow")
+def exportar_arrow(fonte: Literal["telemetria", "iot"], desde: Optional[datetime] = None):
+    """
+    Telemetria ou eventos IoT em formato colunar (stream IPC do Arrow),
+    em ordem de timestamp e gerado lote a lote. `desde` filtra os
+    posteriores a esse instante (UTC). Para Parquet particionado por dia
+    (só a telemetria), use `python -m app.exportacao`.
+
+    Leitura no pandas: pyarrow.ipc.open_stream(resp.content).read_pandas()
+    """
+    try:
+        esquema(fonte)
+    except ExportacaoIndisponivel as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    if desde is not None and desde.tzinfo is not None:
+        desde = desde.astimezone(timezone.utc).replace(tzinfo=None)
+    return StreamingResponse(stream_arrow(fonte, desde), media_type="application/vnd.apache.arrow.stream")
 
 
 @app.get("/debug/llm")
@@ -105,7 +206,7 @@ def debug_llm():
 
 # ---------- ANALYTICS / INSIGHTS ----------
 
-@app.get("/analytics/ias-mais-usadas")
+@app.get("/analytics/ias-mais-usadas", response_model=IasMaisUsadas)
 def analytics_ias_mais_usadas(top: int = 5):
     """
     Retorna as IAs mais usadas em formato compatível com o app mobile:
@@ -116,15 +217,49 @@ def analytics_ias_mais_usadas(top: int = 5):
       ]
     }
     """
-    return {"ias": ias_mais_usadas(top_n=top)}
+    return RespostaJSON({"ias": ias_mais_usadas(top_n=top)})
 
 
-@app.get("/analytics/uso-por-categoria")
+@app.get("/analytics/uso-por-categoria", response_model=UsoPorCategoria)
 def analytics_uso_por_categoria():
-    return {"categorias": uso_por_categoria()}
+    return RespostaJSON({"categorias": uso_por_categoria()})
+
+
+@app.get("/analytics/aprox/ias-mais-usadas")
+def analytics_aprox_ias_mais_usadas(top: int = Query(5, ge=1)):
+    """
+    Versão aproximada (Space-Saving) de /analytics/ias-mais-usadas, sobre
+    toda a telemetria e não só os últimos 5000 eventos (a anterior ao boot
+    entra pela thread de publicação, ver app/sketches.py). Para cada IA:
+    usos_min <= usos reais <= usos (erro_max = usos - usos_min); qualquer
+    IA com mais de `erro_garantido` usos está na lista.
+    """
+    return RespostaJSON(ias_mais_usadas_aprox(top_n=top))
+
+
+@app.get("/analytics/aprox/uso-por-categoria")
+def analytics_aprox_uso_por_categoria(top: Optional[int] = Query(None, ge=1)):
+    """
+    Versão aproximada (Space-Saving) de /analytics/uso-por-categoria,
+    com os mesmos limites de erro do endpoint de IAs.
+    """
+    return RespostaJSON(uso_por_categoria_aprox(top_n=top))
+
+
+@app.get("/analytics/aprox/usuarios-ativos")
+def analytics_aprox_usuarios_ativos(
+    dias: int = Query(1, ge=1, le=SKETCH_DIAS),
+    categoria: Optional[str] = None,
+):
+    """
+    Usuários distintos (HyperLogLog) nos últimos `dias` dias, ou que já
+    usaram a `categoria`. Resposta:
+    {"estimativa": int, "erro_relativo": float, "intervalo_95": [min, max], ...}
+    """
+    return RespostaJSON(usuarios_ativos_aprox(dias=dias, categoria=categoria))
 
 
-@app.get("/analytics/eco/consumo-usuario/{usuario_id}")
+@app.get("/analytics/eco/consumo-usuario/{usuario_id}", response_model=ConsumoUsuario)
 def analytics_consumo_usuario(usuario_id: str):
     """
     Compatível com a tela de Insights:
@@ -137,36 +272,62 @@ def analytics_consumo_usuario(usuario_id: str):
       "nivel_consumo": "baixo" | "moderado" | "alto"
     }
     """
-    return consumo_eco_estimado_por_usuario(usuario_id)
+    return RespostaJSON(consumo_eco_estimado_por_usuario(usuario_id))
+
+
+@app.get("/analytics/eco/consumo-diario")
+def analytics_consumo_diario(dias: int = Query(7, ge=1, le=CARBONO_DIAS)):
+    """
+    Chamadas de IA, consumo (Wh) e emissão (gCO2) de todos os usuários por dia.
+    """
+    return RespostaJSON(consumo_por_dia(dias=dias))
 
 
 # ---------- USERS / PERFIL ----------
 
 @app.post("/usuarios", response_model=UserProfile)
 def criar_atualizar_usuario(profile: UserProfile):
-    return upsert_user(profile)
+    return RespostaJSON(upsert_user(profile))
 
 
 @app.get("/usuarios/{user_id}", response_model=UserProfile | None)
 def obter_usuario(user_id: str):
-    return get_user(user_id)
+    return RespostaJSON(get_user(user_id))
 
 
 @app.get("/ias/recomendadas")
 def ias_recomendadas(usuario_id: str):
-    return recomendar_ias_para_usuario(usuario_id)
+    return RespostaJSON(recomendar_ias_para_usuario(usuario_id))
 
 
 # ---------- IoT / CONTEXTO ----------
 
 @app.post("/iot/devices", response_model=Device)
 def criar_atualizar_device(device: Device):
-    return upsert_device(device)
+    return RespostaJSON(upsert_device(device))
+
+
+@app.get("/iot/devices", response_model=DevicesPagina)
+def listar_devices(
+    tipo: Optional[str] = None,
+    local: Optional[str] = None,
+    capacidade: Optional[str] = None,
+    apos: Optional[str] = Query(None, description="cursor: 'proximo' da página anterior"),
+    limite: int = Query(100, ge=1, le=1000),
+    formato: Literal["json", "ndjson"] = "json",
+):
+    """
+    Lista devices paginando por id (keyset) e filtrando por tipo/local/capacidade.
 
+    formato=json   -> {"devices": [...], "proximo": "<id>" | null}
+    formato=ndjson -> streaming de todos os devices filtrados, um por linha
+                      (a partir de `apos`, ignorando `limite`)
+    """
+    filtros = {"tipo": tipo, "local": local, "capacidade": capacidade}
+    if formato == "ndjson":
+        return resposta_ndjson(percorrer_paginas(DEVICES.pagina, apos=apos, **filtros))
 
-@app.get("/iot/devices")
-def listar_devices():
-    return {"devices": list_devices()}
+    return RespostaJSON(list_devices_pagina(apos=apos, limite=limite, **filtros))
 
 
 @app.post("/iot/events")
@@ -179,13 +340,24 @@ def contexto_atual(usuario_id: str):
     return current_context_for_user(usuario_id)
 
 
+@app.get("/contexto/estudo")
+def contexto_estudo(usuario_id: str, dias: int = Query(7, ge=1, le=SESSAO_DIAS)):
+    """
+    Minutos de estudo (sessões IoT) por dia, device e local.
+    """
+    return RespostaJSON(resumo_estudo(usuario_id, dias=dias))
+
+
 # ---------- MENTOR – RESUMO, PLANO, REFINO ----------
 
 @app.get("/mentor/resumo-uso-ia")
-def mentor_resumo_uso_ia(usuario_id: str = "anon"):
+def mentor_resumo_uso_ia(
+    usuario_id: str = "anon",
+    modo: Literal["swr", "cache", "sincrono"] = "swr",
+):
     """
-    Usa Gemini + analytics (função gerar_resumo_uso_ia) para gerar
-    um texto amigável explicando como o usuário está usando IA e sugerindo melhorias.
+    Serve o resumo de uso de IA pré-calculado (função gerar_resumo_uso_ia),
+    regenerado em background quando a telemetria do usuário muda.
 
     A tela de Insights espera um JSON no formato:
     {
@@ -193,24 +365,12 @@ def mentor_resumo_uso_ia(usuario_id: str = "anon"):
       "texto_resumo": "...",
       "recomendacoes": ["...", "..."]
     }
-    """
-    resumo = gerar_resumo_uso_ia(usuario_id)
+    (mais "versao", "gerado_em" e "desatualizado" do resumo salvo)
 
-    # Se gerar_resumo_uso_ia já retornar um dict com as chaves certas, só repassa
-    if isinstance(resumo, dict) and all(
-        k in resumo for k in ["destaque", "texto_resumo", "recomendacoes"]
-    ):
-        return resumo
-
-    # Se vier string ou outro formato, empacotamos num objeto padrão
-    return {
-        "destaque": f"Resumo de uso de IA para {usuario_id}",
-        "texto_resumo": resumo if isinstance(resumo, str) else str(resumo),
-        "recomendacoes": [
-            "Agrupe tarefas semelhantes para reduzir o número de chamadas às IAs.",
-            "Prefira modelos mais leves para pedidos simples e rápidos.",
-        ],
-    }
+    modo=swr (padrão) devolve o resumo salvo e agenda a atualização se estiver
+    desatualizado; modo=cache só devolve o salvo; modo=sincrono regenera agora.
+    """
+    return obter_resumo(usuario_id, modo=modo)
 
 
 class PlanoEstudoRequest(BaseModel):
@@ -244,9 +404,114 @@ def mentor_refinar_resultado(req: RefinarTextoRequest):
 
 # ---------- VISÃO COMPUTACIONAL ----------
 
+# def (não async): a chamada ao Gemini é bloqueante e roda no threadpool,
+# sem travar o event loop para as outras requisições
 @app.post("/visao/ambiente-trabalho")
-async def visao_ambiente_trabalho(imagem: UploadFile = File(...)):
+def visao_ambiente_trabalho(imagem: UploadFile = File(...)):
     data = analisar_ambiente_trabalho(imagem)
     # registra telemetria para Insights / eco
     save_event(usuario_id="anon", evento="visao_ambiente", payload=data)
     return data
+
+
+def _ler_imagem(imagem: UploadFile) -> bytes:
+    # lê no máximo o teto + 1 byte: imagem grande demais é 413 sem ir inteira para a memória
+    limite = int(JOBS_IMAGEM_MAX_MB * 1024 * 1024)
+    conteudo = imagem.file.read(limite + 1)
+    if len(conteudo) > limite:
+        raise HTTPException(status_code=413, detail=f"imagem acima de {JOBS_IMAGEM_MAX_MB:g} MB")
+    return conteudo
+
+
+@app.post("/visao/ambiente-trabalho/lote")
+def visao_ambiente_trabalho_lote(imagens: List[UploadFile] = File(...)):
+    """
+    Várias fotos do mesmo ambiente (ângulos diferentes) analisadas juntas,
+    com o prompt enviado uma vez por chamada em vez de uma vez por foto.
+    Resposta:
+    {
+      "imagens": [análise da foto 1, análise da foto 2, ...],
+      "combinada": {análise do ambiente, mesmo formato},
+      "chamadas": int
+    }
+    Mais de VISAO_LOTE_MAX_TOTAL fotos, foto acima de JOBS_IMAGEM_MAX_MB ou
+    lote acima de VISAO_LOTE_MAX_TOTAL_MB: 413.
+    """
+    if len(imagens) > VISAO_LOTE_MAX_TOTAL:
+        raise HTTPException(status_code=413, detail=f"máximo de {VISAO_LOTE_MAX_TOTAL} imagens por lote")
+    restante = int(VISAO_LOTE_MAX_TOTAL_MB * 1024 * 1024)
+    fotos = []
+    for imagem in imagens:
+        conteudo = _ler_imagem(imagem)
+        restante -= len(conteudo)
+        if restante < 0:
+            raise HTTPException(status_code=413, detail=f"lote acima de {VISAO_LOTE_MAX_TOTAL_MB:g} MB")
+        fotos.append((conteudo, imagem.content_type))
+    data = analisar_imagens(fotos)
+    # uma chamada ao modelo = um evento (total_chamadas / eco)
+    for _ in range(data["chamadas"]):
+        save_event(usuario_id="anon", evento="visao_ambiente", payload=data["combinada"])
+    return RespostaJSON(data)
+
+
+# ---------- JOBS ASSÍNCRONOS ----------
+
+Prioridade = Literal["alta", "normal", "baixa"]
+
+
+def _job_aceito(submissao) -> RespostaJSON:
+    try:
+        job, deduplicado = submissao()
+    except FilaCheia:
+        raise HTTPException(status_code=503, detail="fila de jobs cheia", headers={"Retry-After": "5"})
+    return RespostaJSON(
+        {"job_id": job.id, "status": job.status, "prioridade": job.prioridade, "deduplicado": deduplicado},
+        status_code=202,
+        headers={"Location": f"/jobs/{job.id}"},
+    )
+
+
+@app.post("/jobs/visao", status_code=202)
+def job_visao(imagem: UploadFile = File(...), usuario_id: str = "anon", prioridade: Prioridade = "normal"):
+    """
+    Versão assíncrona de /visao/ambiente-trabalho: devolve o job_id na hora;
+    o resultado sai em GET /jobs/{job_id}. Reenviar a mesma imagem enquanto
+    o job anterior não terminou devolve o mesmo job_id. Imagem acima de
+    JOBS_IMAGEM_MAX_MB: 413 (ela fica na memória até o job rodar).
+    """
+    conteudo = _ler_imagem(imagem)
+    return _job_aceito(lambda: submeter_visao(conteudo, imagem.content_type, usuario_id, prioridade))
+
+
+@app.post("/jobs/plano-estudo", status_code=202)
+def job_plano_estudo(req: PlanoEstudoRequest, usuario_id: str = "anon", prioridade: Prioridade = "normal"):
+    """
+    Versão assíncrona de /mentor/plano-estudo (mesmas regras de /jobs/visao).
+    """
+    return _job_aceito(lambda: submeter_plano(req.objetivo, req.horas_semana, usuario_id, prioridade))
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, esperar: float = Query(0, ge=0, le=30)):
+    """
+    Estado do job: pendente | executando | concluido | erro | cancelado,
+    com "resultado" (ou "erro") quando termina. esperar=N segura a resposta
+    até N segundos esperando o job terminar (long-poll). 404 depois que o
+    resultado expira (JOBS_TTL_SEG).
+    """
+    job = await obter(job_id, esperar=esperar)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job não encontrado ou expirado")
+    return RespostaJSON(job)
+
+
+@app.delete("/jobs/{job_id}")
+def job_cancelar(job_id: str):
+    """
+    Cancela o job. Se ele foi deduplicado, só cancela de fato quando todos
+    que o enviaram cancelarem (até lá o status continua o mesmo).
+    """
+    job = cancelar(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job não encontrado neste worker")
+    return RespostaJSON(job.publico())
@@ -3,21 +3,20 @@ import json
 from typing import Optional, Dict, Any, List
 
 from fastapi import HTTPException
-import google.genai as genai
 
 from .store import IAS
 from .analytics import ias_mais_usadas, consumo_eco_estimado_por_usuario
+from .llm import get_gemini_client
+from .observabilidade import cronometrar, medir
 
 
 # --------------------------
 # 0. CLIENT GEMINI
 # --------------------------
 
-def _get_gemini_client() -> genai.Client:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="GEMINI_API_KEY não configurada.")
-    return genai.Client(api_key=api_key)
+def _get_gemini_client():
+    # google.genai só é importado aqui, no primeiro uso (ver app/llm.py)
+    return get_gemini_client()
 
 
 def _get_gemini_model() -> str:
@@ -90,11 +89,15 @@ def _call_gemini_mentor(descricao: str, contexto: Optional[str] = None) -> Dict[
     """
 
     try:
-        result = client.models.generate_content(
-            model=model,
-            contents=prompt,
-            config={"response_mime_type": "application/json"},
-        )
+        with medir("llm"):
+            result = client.models.generate_content(
+                model=model,
+                contents=prompt,
+                config={"response_mime_type": "application/json"},
+            )
+    except HTTPException:
+        # o 429 do teto de concorrência (vaga_llm) passa direto, com o Retry-After
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Erro no Gemini (mentor): {e!r}")
 
@@ -124,6 +127,7 @@ def _call_gemini_mentor(descricao: str, contexto: Optional[str] = None) -> Dict[
 # 4. FUNÇÃO PRINCIPAL DO MENTOR (USADA PELO ENDPOINT /mentor/explicar-tarefa)
 # --------------------------
 
+@cronometrar("explain_task")
 def explain_task(descricao: str, contexto: Optional[str] = None) -> Dict[str, Any]:
     """
     Gera o plano da tarefa:
@@ -151,6 +155,7 @@ def explain_task(descricao: str, contexto: Optional[str] = None) -> Dict[str, An
 # 5. GEMINI + ANALYTICS: RESUMO DE USO DE IA (COACH)
 # --------------------------
 
+@cronometrar("gerar_resumo_uso_ia")
 def gerar_resumo_uso_ia(usuario_id: str) -> str:
     """
     Usa os analytics + Gemini para gerar um texto amigável
@@ -180,10 +185,13 @@ def gerar_resumo_uso_ia(usuario_id: str) -> str:
     """
 
     try:
-        result = client.models.generate_content(
-            model=model,
-            contents=prompt,
-        )
+        with medir("llm"):
+            result = client.models.generate_content(
+                model=model,
+                contents=prompt,
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Erro no Gemini (resumo uso IA): {e!r}")
 
@@ -194,6 +202,7 @@ def gerar_resumo_uso_ia(usuario_id: str) -> str:
 # 6. GEMINI: PLANO DE ESTUDO / DESENVOLVIMENTO
 # --------------------------
 
+@cronometrar("gerar_plano_estudo")
 def gerar_plano_estudo(objetivo: str, horas_semana: int) -> Dict[str, Any]:
     """
     Gera um plano de estudo/desenvolvimento em JSON
@@ -229,11 +238,14 @@ def gerar_plano_estudo(objetivo: str, horas_semana: int) -> Dict[str, Any]:
     """
 
     try:
-        result = client.models.generate_content(
-            model=model,
-            contents=prompt,
-            config={"response_mime_type": "application/json"},
-        )
+        with medir("llm"):
+            result = client.models.generate_content(
+                model=model,
+                contents=prompt,
+                config={"response_mime_type": "application/json"},
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Erro no Gemini (plano estudo): {e!r}")
 
@@ -262,6 +274,7 @@ def gerar_plano_estudo(objetivo: str, horas_semana: int) -> Dict[str, Any]:
 # 7. GEMINI: REFINAR RESULTADO / TEXTO
 # --------------------------
 
+@cronometrar("refinar_resultado")
 def refinar_resultado(tipo: str, texto_inicial: str, tom: str, tamanho: str) -> Dict[str, Any]:
     """
     Usa o Gemini para refinar um texto (ex.: post LinkedIn, roteiro de vídeo),
@@ -295,11 +308,14 @@ def refinar_resultado(tipo: str, texto_inicial: str, tom: str, tamanho: str) ->
     """
 
     try:
-        result = client.models.generate_content(
-            model=model,
-            contents=prompt,
-            config={"response_mime_type": "application/json"},
-        )
+        with medir("llm"):
+            result = client.models.generate_content(
+                model=model,
+                contents=prompt,
+                config={"response_mime_type": "application/json"},
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Erro no Gemini (refinar resultado): {e!r}")
 
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Literal
+from datetime import datetime
 
 # ---- Mentor ----
 
@@ -26,6 +27,7 @@ class TelemetriaEvent(BaseModel):
     sucesso: Optional[bool] = None
     duracao_seg: Optional[int] = None
     contexto: Dict = {}                      # device, plataforma, etc.
+    evento_id: Optional[str] = None          # gerado pelo app; retries repetem o mesmo
 
 # ---- Perfil de Usuário ----
 
@@ -50,3 +52,51 @@ class IotEvent(BaseModel):
     usuario_id: Optional[str] = None
     evento: str                              # inicio_sessao, fim_sessao, etc.
     metadata: Dict = {}
+    evento_id: Optional[str] = None          # gerado pelo device; retries repetem o mesmo
+
+# ---- Respostas (documentação; serializadas direto com orjson) ----
+
+class TelemetriaRegistro(BaseModel):
+    usuario_id: str
+    evento: str
+    payload: Dict = {}
+    categoria: Optional[str] = None
+    ia_indicada: Optional[str] = None
+    sucesso: Optional[bool] = None
+    duracao_seg: Optional[float] = None
+    contexto: Dict = {}
+    evento_id: Optional[str] = None
+    timestamp: datetime
+
+class TelemetriaLista(BaseModel):
+    eventos: List[TelemetriaRegistro]
+
+class DevicesPagina(BaseModel):
+    devices: List[Device]
+    proximo: Optional[str] = None            # cursor para a próxima página
+
+class IaUso(BaseModel):
+    ia_id: str
+    nome: str
+    usos: int
+    eco_score: Optional[float] = None
+
+class IasMaisUsadas(BaseModel):
+    ias: List[IaUso]
+
+class CategoriaUso(BaseModel):
+    categoria: str
+    quantidade: int
+
+class UsoPorCategoria(BaseModel):
+    categorias: List[CategoriaUso]
+
+class ConsumoUsuario(BaseModel):
+    usuario_id: str
+    total_chamadas: int
+    kwh_estimado: float
+    co2_estimado_kg: float
+    consumo_wh: Optional[float] = None
+    emissao_co2_g: Optional[float] = None
+    ia_mais_utilizada: Optional[str] = None
+    nivel_consumo: Literal["baixo", "moderado", "alto"]
@@ -0,0 +1,285 @@
+# app/observabilidade.py
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+# Logging estruturado (JSON por linha) sem bloquear as requisições:
+# os handlers só enfileiram (QueueHandler) e uma thread (QueueListener)
+# escreve no stdout. Erros repetitivos (ex.: Mongo fora do ar) passam
+# por um limitador por chave. Também guarda métricas por requisição
+# (handler / mongo / llm) no formato texto do Prometheus para o /metrics.
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_ERROS_POR_JANELA = int(os.getenv("LOG_ERROS_POR_JANELA", "5"))
+LOG_JANELA_SEG = float(os.getenv("LOG_JANELA_SEG", "60"))
+
+_CAMPOS_PADRAO = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            "ts": round(record.created, 3),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        # campos passados via extra={...}
+        for chave, valor in record.__dict__.items():
+            if chave not in _CAMPOS_PADRAO:
+                dados[chave] = valor
+        if record.exc_info:
+            dados["exc"] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configurar_logging() -> None:
+    """
+    Liga o logger "app" a uma fila; a escrita no stdout acontece numa thread separada.
+    Chamar mais de uma vez não duplica handlers.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    fila: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    saida = logging.StreamHandler()
+    saida.setFormatter(FormatoJSON())
+
+    logger = logging.getLogger("app")
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(logging.handlers.QueueHandler(fila))
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(fila, saida, respect_handler_level=True)
+    _listener.start()
+
+
+def parar_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(nome: str) -> logging.Logger:
+    return logging.getLogger(f"app.{nome}")
+
+
+class _Limitador:
+    """
+    Até LOG_ERROS_POR_JANELA mensagens por chave a cada LOG_JANELA_SEG;
+    o resto é contado e reportado na próxima mensagem liberada.
+    """
+
+    def __init__(self):
+        self._estado: Dict[str, list] = {}  # chave -> [inicio_janela, emitidos, suprimidos]
+        self._lock = threading.Lock()
+
+    def liberar(self, chave: str) -> Tuple[bool, int]:
+        agora = time.monotonic()
+        with self._lock:
+            est = self._estado.get(chave)
+            if est is None or agora - est[0] >= LOG_JANELA_SEG:
+                suprimidos = est[2] if est else 0
+                self._estado[chave] = [agora, 1, 0]
+                return True, suprimidos
+            if est[1] < LOG_ERROS_POR_JANELA:
+                est[1] += 1
+                suprimidos, est[2] = est[2], 0
+                return True, suprimidos
+            est[2] += 1
+            return False, 0
+
+
+_limitador = _Limitador()
+
+
+def log_limitado(logger: logging.Logger, chave: str, msg: str, *args, nivel: int = logging.ERROR, **extra) -> None:
+    """
+    Log com limite de taxa por chave (para erros que podem se repetir a cada requisição).
+    """
+    liberar, suprimidos = _limitador.liberar(chave)
+    if not liberar:
+        return
+    if suprimidos:
+        extra["suprimidos"] = suprimidos
+    logger.log(nivel, msg, *args, extra=extra)
+
+
+# ---------- MÉTRICAS ----------
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Histograma:
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...]):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._series: Dict[Tuple[str, ...], list] = {}  # valores -> [contagens por bucket, soma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, *rotulos: str) -> None:
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = [[0] * len(BUCKETS), 0.0, 0]
+                self._series[rotulos] = serie
+            for i, limite in enumerate(BUCKETS):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self) -> str:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            for valores, (buckets, soma, total) in sorted(self._series.items()):
+                base = ",".join(f'{r}="{v}"' for r, v in zip(self.rotulos, valores))
+                sep = "," if base else ""
+                for limite, qtd in zip(BUCKETS, buckets):
+                    linhas.append(f'{self.nome}_bucket{{{base}{sep}le="{limite}"}} {qtd}')
+                linhas.append(f'{self.nome}_bucket{{{base}{sep}le="+Inf"}} {total}')
+                linhas.append(f"{self.nome}_sum{{{base}}} {soma}")
+                linhas.append(f"{self.nome}_count{{{base}}} {total}")
+        return "\n".join(linhas)
+
+
+class _Contador:
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...]):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._series: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *rotulos: str, valor: float = 1.0) -> None:
+        with self._lock:
+            self._series[rotulos] = self._series.get(rotulos, 0.0) + valor
+
+    def exportar(self) -> str:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            for valores, total in sorted(self._series.items()):
+                base = ",".join(f'{r}="{v}"' for r, v in zip(self.rotulos, valores))
+                linhas.append(f"{self.nome}{{{base}}} {total}")
+        return "\n".join(linhas)
+
+
+REQUISICOES = _Contador(
+    "http_requests_total", "Requisições HTTP atendidas.", ("rota", "metodo", "status"))
+DURACAO = _Histograma(
+    "http_request_duration_seconds", "Duração total da requisição.", ("rota", "metodo"))
+COMPONENTES = _Histograma(
+    "http_request_component_seconds",
+    "Tempo por componente da requisição (handler = total - mongo - llm).",
+    ("rota", "componente"))
+OPERACOES = _Histograma(
+    "app_operation_duration_seconds", "Duração de chamadas externas (Mongo, LLM).", ("componente",))
+
+ADMISSAO_ESPERA = _Histograma(
+    "admission_queue_wait_seconds", "Tempo na fila do controle de admissão.", ("rota",))
+ADMISSAO_REJEITADAS = _Contador(
+    "admission_rejected_total", "Requisições recusadas com 429 pelo controle de admissão.", ("rota", "motivo"))
+
+EVENTOS_DUPLICADOS = _Contador(
+    "ingest_duplicates_total", "Eventos repetidos (mesmo evento_id) descartados na ingestão.", ("fonte", "camada"))
+JOBS_ESPERA = _Histograma(
+    "jobs_queue_wait_seconds", "Tempo dos jobs assíncronos na fila até um worker pegar.", ("tipo",))
+JOBS_FINALIZADOS = _Contador(
+    "jobs_finished_total", "Jobs assíncronos finalizados.", ("tipo", "status"))
+
+FUNCOES = _Histograma(
+    "app_function_duration_seconds", "Duração das funções do caminho quente (telemetria, analytics, LLM).", ("funcao",))
+
+_METRICAS = [REQUISICOES, DURACAO, COMPONENTES, OPERACOES, ADMISSAO_ESPERA, ADMISSAO_REJEITADAS,
+             EVENTOS_DUPLICADOS, JOBS_ESPERA, JOBS_FINALIZADOS, FUNCOES]
+
+# tempos da requisição atual (componente -> segundos); None fora de requisição
+_tempos_req: ContextVar[Optional[Dict[str, float]]] = ContextVar("_tempos_req", default=None)
+# funções da requisição sob perfil (nome -> [chamadas, segundos]); None fora de perfil (app/perfil.py)
+funcoes_req: ContextVar[Optional[Dict[str, list]]] = ContextVar("funcoes_req", default=None)
+
+
+@contextmanager
+def medir(componente: str):
+    """
+    Mede um trecho (ex.: "mongo", "llm") e soma no tempo da requisição atual.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        OPERACOES.observar(duracao, componente)
+        tempos = _tempos_req.get()
+        if tempos is not None:
+            tempos[componente] = tempos.get(componente, 0.0) + duracao
+
+
+def cronometrar(nome: str):
+    """
+    Decorador para funções do caminho quente: histograma por função em
+    /metrics e, se a requisição estiver sob perfil, soma no resumo dela.
+    Custo: dois perf_counter e um observar.
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medido(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                duracao = time.perf_counter() - inicio
+                FUNCOES.observar(duracao, nome)
+                funcoes = funcoes_req.get()
+                if funcoes is not None:
+                    total = funcoes.setdefault(nome, [0, 0.0])
+                    total[0] += 1
+                    total[1] += duracao
+        return medido
+    return decorador
+
+
+async def middleware_tempos(request, call_next):
+    """
+    Middleware HTTP: duração total e quebra handler / mongo / llm por rota.
+    """
+    tempos: Dict[str, float] = {}
+    token = _tempos_req.set(tempos)
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        total = time.perf_counter() - inicio
+        _tempos_req.reset(token)
+        rota_obj = request.scope.get("route")
+        rota = getattr(rota_obj, "path", "desconhecida")
+        metodo = request.method
+
+        REQUISICOES.inc(rota, metodo, str(status))
+        DURACAO.observar(total, rota, metodo)
+        externos = 0.0
+        for componente, segundos in tempos.items():
+            COMPONENTES.observar(segundos, rota, componente)
+            externos += segundos
+        COMPONENTES.observar(max(0.0, total - externos), rota, "handler")
+
+
+def exportar_metricas() -> str:
+    return "\n".join(m.exportar() for m in _METRICAS) + "\n"
@@ -0,0 +1,228 @@
+# app/perfil.py
+import functools
+import hmac
+import inspect
+import json
+import os
+import random
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+from .observabilidade import funcoes_req, get_logger, log_limitado
+
+log = get_logger("perfil")
+
+# Perfil sob demanda de requisições em produção.
+#
+# Uma requisição é perfilada quando traz o header X-Perfil com o valor de
+# PERFIL_TOKEN (vazio = header desligado) ou cai na amostra aleatória de
+# PERFIL_AMOSTRA (fração, 0 = desligado) das rotas que começam com um dos
+# prefixos de PERFIL_ROTAS (vazio = todas).
+#
+# O perfil é feito pela classe de rota (RotaPerfilada), não por middleware,
+# porque o handler síncrono roda numa thread do threadpool e os
+# profilers só enxergam a própria thread. Saem dois perfis por requisição:
+# - "rota": o que roda no event loop (parse/validação do corpo,
+#   serialização da resposta; a validação do response_model de handler
+#   síncrono vai para o threadpool e aparece como espera);
+# - "handler": a função do endpoint, na thread do threadpool.
+# Com pyinstrument (PERFIL_MOTOR=auto|pyinstrument; importado só na
+# primeira requisição perfilada, não no boot) cada um vira um .html
+# (árvore/flame interativo) e o da rota só conta a própria tarefa
+# (async_mode). Com cProfile viram .pstats (snakeviz, flameprof,
+# python -m pstats), e o da rota pode incluir outras requisições que
+# rodaram no event loop ao mesmo tempo.
+#
+# Junto vai um <id>.json com rota, duração e os tempos das funções
+# instrumentadas com @cronometrar (save_event, list_events, analytics,
+# chamadas ao LLM), que também voltam no header Server-Timing.
+
+PERFIL_TOKEN = os.getenv("PERFIL_TOKEN", "")
+PERFIL_AMOSTRA = float(os.getenv("PERFIL_AMOSTRA", "0"))
+PERFIL_ROTAS = tuple(p for p in os.getenv("PERFIL_ROTAS", "").split(",") if p)
+PERFIL_DIR = os.getenv("PERFIL_DIR", os.path.join("dados", "perfis"))
+PERFIL_MOTOR = os.getenv("PERFIL_MOTOR", "auto")
+PERFIL_MAX_PERFIS = int(os.getenv("PERFIL_MAX_PERFIS", "200"))
+
+HEADER = "x-perfil"
+
+# resolvido no primeiro perfil (_motor)
+_motor_escolhido: Optional[str] = None
+
+
+def _motor() -> str:
+    global _motor_escolhido
+    if _motor_escolhido is None:
+        escolhido = "cprofile"
+        if PERFIL_MOTOR != "cprofile":
+            try:
+                import pyinstrument  # type: ignore  # noqa: F401
+
+                escolhido = "pyinstrument"
+            except ImportError:
+                pass
+        _motor_escolhido = escolhido
+    return _motor_escolhido
+
+
+class _Perfilador:
+    def __init__(self, assincrono: bool):
+        self.motor = _motor()
+        if self.motor == "pyinstrument":
+            import pyinstrument  # type: ignore
+
+            self._p = pyinstrument.Profiler(interval=0.001, async_mode="enabled" if assincrono else "disabled")
+        else:
+            import cProfile
+
+            self._p = cProfile.Profile()
+
+    def iniciar(self) -> None:
+        if self.motor == "pyinstrument":
+            self._p.start()
+        else:
+            self._p.enable()
+
+    def parar(self) -> None:
+        if self.motor == "pyinstrument":
+            self._p.stop()
+        else:
+            self._p.disable()
+
+    def salvar(self, base: str) -> str:
+        if self.motor == "pyinstrument":
+            caminho = base + ".html"
+            with open(caminho, "w", encoding="utf-8") as f:
+                f.write(self._p.output_html())
+        else:
+            caminho = base + ".pstats"
+            self._p.dump_stats(caminho)
+        return caminho
+
+
+class _Sessao:
+    def __init__(self, rota: str, metodo: str):
+        slug = re.sub(r"[^a-zA-Z0-9]+", "_", rota).strip("_") or "raiz"
+        self.id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{slug}-{uuid.uuid4().hex[:6]}"
+        self.rota = rota
+        self.metodo = metodo
+        self.funcoes: Dict[str, list] = {}
+        self.perfis: Dict[str, _Perfilador] = {}
+
+
+# sessão da requisição atual (chega às threads do threadpool pelo contexto copiado)
+_sessao: ContextVar[Optional["_Sessao"]] = ContextVar("_sessao_perfil", default=None)
+
+
+def _deve_perfilar(request) -> bool:
+    valor = request.headers.get(HEADER)
+    if valor is not None and PERFIL_TOKEN:
+        return hmac.compare_digest(valor.encode(), PERFIL_TOKEN.encode())
+    if PERFIL_AMOSTRA <= 0 or random.random() >= PERFIL_AMOSTRA:
+        return False
+    return not PERFIL_ROTAS or request.url.path.startswith(PERFIL_ROTAS)
+
+
+def _perfilar_thread(endpoint: Callable) -> Callable:
+    @functools.wraps(endpoint)
+    def perfilado(*args, **kwargs):
+        sessao: Optional[_Sessao] = _sessao.get()
+        if sessao is None:
+            return endpoint(*args, **kwargs)
+        perfilador = _Perfilador(assincrono=False)
+        perfilador.iniciar()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            perfilador.parar()
+            sessao.perfis["handler"] = perfilador
+    return perfilado
+
+
+def _limpar_antigos() -> None:
+    resumos = sorted(f for f in os.listdir(PERFIL_DIR) if f.endswith(".json"))
+    for resumo in resumos[:max(0, len(resumos) - PERFIL_MAX_PERFIS)]:
+        prefixo = resumo[:-len(".json")]
+        for f in os.listdir(PERFIL_DIR):
+            if f.startswith(prefixo):
+                os.remove(os.path.join(PERFIL_DIR, f))
+
+
+def _salvar(sessao: _Sessao, duracao: float, status: int) -> Dict[str, Any]:
+    os.makedirs(PERFIL_DIR, exist_ok=True)
+    base = os.path.join(PERFIL_DIR, sessao.id)
+    artefatos = [p.salvar(f"{base}.{parte}") for parte, p in sessao.perfis.items()]
+    resumo = {
+        "id": sessao.id,
+        "rota": sessao.rota,
+        "metodo": sessao.metodo,
+        "status": status,
+        "duracao_ms": round(duracao * 1000, 3),
+        "motor": _motor(),
+        "funcoes": {nome: {"chamadas": n, "ms": round(seg * 1000, 3)} for nome, (n, seg) in sessao.funcoes.items()},
+        "artefatos": [os.path.basename(a) for a in artefatos],
+    }
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(resumo, f, ensure_ascii=False, indent=2)
+    _limpar_antigos()
+    return resumo
+
+
+def _server_timing(sessao: _Sessao, duracao: float) -> str:
+    partes = [f"total;dur={duracao * 1000:.1f}"]
+    partes += [f"{nome};dur={seg * 1000:.1f}" for nome, (_, seg) in sessao.funcoes.items()]
+    return ", ".join(partes)
+
+
+class RotaPerfilada(APIRoute):
+    """
+    Rota que perfila a requisição quando _deve_perfilar() manda. Use como
+    app.router.route_class antes de declarar as rotas.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs: Any):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = _perfilar_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        original = super().get_route_handler()
+
+        async def handler(request):
+            if not _deve_perfilar(request):
+                return await original(request)
+
+            sessao = _Sessao(self.path, request.method)
+            token_sessao = _sessao.set(sessao)
+            token_funcoes = funcoes_req.set(sessao.funcoes)
+            perfilador = _Perfilador(assincrono=True)
+            inicio = time.perf_counter()
+            status = 500
+            perfilador.iniciar()
+            try:
+                response = await original(request)
+                status = response.status_code
+            finally:
+                perfilador.parar()
+                duracao = time.perf_counter() - inicio
+                funcoes_req.reset(token_funcoes)
+                _sessao.reset(token_sessao)
+                sessao.perfis["rota"] = perfilador
+                try:
+                    await run_in_threadpool(_salvar, sessao, duracao, status)
+                except OSError as e:
+                    log_limitado(log, "perfil.salvar", "erro ao gravar o perfil", erro=repr(e))
+
+            response.headers["Server-Timing"] = _server_timing(sessao, duracao)
+            response.headers["X-Perfil-Id"] = sessao.id
+            return response
+
+        return handler
+
@@ -0,0 +1,458 @@
+# app/recomendacao.py
+import bisect
+import math
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .db import concluir_historico, get_collection, marcar_falha, reservar_historico
+from .observabilidade import get_logger, log_limitado, medir
+from .store import IAS
+
+log = get_logger("recomendacao")
+
+# Motor de recomendação de IAs por usuário.
+#
+# score(usuario, ia) = Σ_cat u[cat] * [cat ∈ especializacoes(ia)]
+#                    + u_eco * eco(ia) + u_vel * velocidade(ia) - u_consumo * consumo(ia)
+#                    + familiaridade(usuario, ia)
+#
+# u[cat] junta preferências do perfil e o histograma de telemetria do usuário
+# (log1p das contagens). Cada evento só mexe nas IAs daquela categoria
+# (índice invertido) e na IA usada, então o ranking é mantido ordenado
+# incrementalmente e o top-k sai em O(k).
+#
+# As contagens são compartilhadas pelos workers como as do carbono: cada
+# worker manda um $inc em lote a cada RECOMENDACAO_PUBLICAR_SEG para o
+# documento "u:<id>" da coleção "recomendacao" (só categorias e IAs do
+# catálogo, as únicas que pesam no score), e a consulta aplica ao motor o
+# que está lá mais o que ele ainda não mandou. A telemetria anterior entra
+# uma vez só, no campo "hist" (db.reservar_historico), pela thread iniciada
+# no lifespan (iniciar_recomendacao). Sem Mongo, vale o motor do processo,
+# com o histórico do diário local carregado pela mesma thread.
+
+RECOMENDACAO_PUBLICAR_SEG = float(os.getenv("RECOMENDACAO_PUBLICAR_SEG", "5"))
+RECOMENDACAO_HISTORICO_PRAZO_SEG = float(os.getenv("RECOMENDACAO_HISTORICO_PRAZO_SEG", "600"))
+
+# sinônimos usados em preferencias/telemetria -> categorias do catálogo
+ALIASES_CATEGORIA = {
+    "video": "edicao_video",
+    "vídeo": "edicao_video",
+    "dados": "analise_dados",
+    "planilha": "analise_dados",
+    "imagens": "imagem",
+}
+
+# objetivos do perfil -> pesos extras (categoria ou atributo)
+PESOS_OBJETIVO: Dict[str, Dict[str, float]] = {
+    "produtividade": {"_velocidade": 0.5},
+    "estudo": {"texto": 0.5, "mentor": 0.5, "analise_dados": 0.3},
+    "criatividade": {"design": 0.5, "imagem": 0.5, "edicao_video": 0.5},
+    "conteudo": {"texto": 0.3, "edicao_video": 0.5},
+    "sustentabilidade": {"_eco": 1.0, "_consumo": 0.5},
+}
+
+PESO_PREFERENCIA = 1.0
+PESO_HISTOGRAMA = 0.6
+PESO_USO_IA = 0.8
+PESO_HISTORICO = 0.5
+# Sem perfil, o ranking cai no eco_score; com perfil sem "eco", pesa a
+# velocidade (as duas ordenações que o recomendador antigo usava).
+PESO_ECO_BASE = 0.3
+PESO_ECO_PREFERENCIA = 1.5
+PESO_VELOCIDADE_BASE = 0.0
+PESO_VELOCIDADE_SEM_ECO = 0.5
+
+
+def _norm_categoria(cat: Optional[str]) -> Optional[str]:
+    if not cat:
+        return None
+    cat = cat.strip().lower().replace(" ", "_")
+    return ALIASES_CATEGORIA.get(cat, cat)
+
+
+class _Catalogo:
+    """
+    Atributos normalizados das IAs + índice invertido categoria -> IAs.
+    """
+
+    def __init__(self, ias: Dict[str, Dict[str, Any]]):
+        self.ias = ias
+        self.ids: List[str] = list(ias)
+        max_consumo = max((ia["consumo_wh"] for ia in ias.values()), default=1.0) or 1.0
+        self.eco = {i: ia["eco_score"] / 100.0 for i, ia in ias.items()}
+        self.vel = {i: ia["velocidade"] / 10.0 for i, ia in ias.items()}
+        self.consumo = {i: ia["consumo_wh"] / max_consumo for i, ia in ias.items()}
+        self.categorias: Dict[str, List[str]] = {}
+        for i, ia in ias.items():
+            for cat in ia["especializacoes"]:
+                self.categorias.setdefault(_norm_categoria(cat), []).append(i)
+
+
+class _EstadoUsuario:
+    def __init__(self, usuario_id: str):
+        self.usuario_id = usuario_id
+        self.preferencias: Dict[str, float] = {}   # categoria -> peso do perfil
+        self.histograma: Dict[str, int] = {}       # categoria -> eventos
+        self.uso_ia: Dict[str, int] = {}           # ia_id -> eventos
+        self.historico: set = set()
+        self.perfil = None                          # último UserProfile aplicado
+        self.u_eco = PESO_ECO_BASE
+        self.u_vel = PESO_VELOCIDADE_BASE
+        self.u_consumo = 0.0
+        self.scores: Dict[str, float] = {}
+        self.ranking: List[Tuple[float, str]] = []  # (-score, ia_id) ordenado
+
+    def peso_categoria(self, cat: str) -> float:
+        return self.preferencias.get(cat, 0.0) + PESO_HISTOGRAMA * math.log1p(self.histograma.get(cat, 0))
+
+    def familiaridade(self, ia_id: str) -> float:
+        f = PESO_USO_IA * math.log1p(self.uso_ia.get(ia_id, 0))
+        if ia_id in self.historico:
+            f += PESO_HISTORICO
+        return f
+
+
+class MotorRecomendacao:
+    def __init__(self, ias: Dict[str, Dict[str, Any]] = IAS):
+        self.catalogo = _Catalogo(ias)
+        self._usuarios: Dict[str, _EstadoUsuario] = {}
+        self._lock = threading.Lock()
+        # usuário sem perfil nem eventos: consultado sem criar estado
+        self._padrao = _EstadoUsuario("")
+        self._recalcular(self._padrao)
+
+    # ---------- score ----------
+
+    def _score(self, est: _EstadoUsuario, ia_id: str) -> float:
+        cat = self.catalogo
+        s = sum(est.peso_categoria(c) for c in map(_norm_categoria, cat.ias[ia_id]["especializacoes"]))
+        s += est.u_eco * cat.eco[ia_id] + est.u_vel * cat.vel[ia_id] - est.u_consumo * cat.consumo[ia_id]
+        return s + est.familiaridade(ia_id)
+
+    def _atualizar_score(self, est: _EstadoUsuario, ia_id: str) -> None:
+        antigo = est.scores.get(ia_id)
+        if antigo is not None:
+            pos = bisect.bisect_left(est.ranking, (-antigo, ia_id))
+            del est.ranking[pos]
+        novo = self._score(est, ia_id)
+        est.scores[ia_id] = novo
+        bisect.insort(est.ranking, (-novo, ia_id))
+
+    def _recalcular(self, est: _EstadoUsuario) -> None:
+        est.scores = {i: self._score(est, i) for i in self.catalogo.ids}
+        est.ranking = sorted((-s, i) for i, s in est.scores.items())
+
+    def _estado(self, usuario_id: str) -> _EstadoUsuario:
+        est = self._usuarios.get(usuario_id)
+        if est is None:
+            est = _EstadoUsuario(usuario_id)
+            self._recalcular(est)
+            self._usuarios[usuario_id] = est
+        return est
+
+    # ---------- entradas ----------
+
+    def atualizar_perfil(self, profile) -> None:
+        """
+        Aplica preferencias/objetivos/historico_ias do perfil (UserProfile).
+        """
+        with self._lock:
+            est = self._estado(profile.id)
+            est.preferencias = {}
+            est.u_eco, est.u_vel, est.u_consumo = PESO_ECO_BASE, PESO_VELOCIDADE_BASE, 0.0
+
+            for pref in profile.preferencias:
+                if pref.lower() == "eco":
+                    est.u_eco += PESO_ECO_PREFERENCIA
+                    est.u_consumo += PESO_ECO_PREFERENCIA / 2
+                    continue
+                cat = _norm_categoria(pref)
+                est.preferencias[cat] = est.preferencias.get(cat, 0.0) + PESO_PREFERENCIA
+
+            for obj in profile.objetivos:
+                for chave, peso in PESOS_OBJETIVO.get(obj.lower(), {}).items():
+                    if chave == "_eco":
+                        est.u_eco += peso
+                    elif chave == "_velocidade":
+                        est.u_vel += peso
+                    elif chave == "_consumo":
+                        est.u_consumo += peso
+                    else:
+                        est.preferencias[chave] = est.preferencias.get(chave, 0.0) + peso
+
+            if "eco" not in (p.lower() for p in profile.preferencias):
+                est.u_vel += PESO_VELOCIDADE_SEM_ECO
+
+            est.historico = set(profile.historico_ias)
+            est.perfil = profile
+            self._recalcular(est)
+
+    def sincronizar_perfil(self, profile) -> None:
+        """
+        Aplica o perfil só se ele mudou desde a última vez (ex.: upsert feito em outro worker).
+        """
+        est = self._usuarios.get(profile.id)
+        if est is None or est.perfil != profile:
+            self.atualizar_perfil(profile)
+
+    def registrar_evento(self, usuario_id: str, categoria: Optional[str], ia_indicada: Optional[str]) -> None:
+        """
+        Atualiza o histograma do usuário. Só as IAs afetadas são re-pontuadas.
+        """
+        cat = _norm_categoria(categoria)
+        if cat is None and ia_indicada not in self.catalogo.ias:
+            return
+
+        with self._lock:
+            est = self._estado(usuario_id)
+            afetadas = set()
+            if cat is not None:
+                est.histograma[cat] = est.histograma.get(cat, 0) + 1
+                afetadas.update(self.catalogo.categorias.get(cat, ()))
+            if ia_indicada in self.catalogo.ias:
+                est.uso_ia[ia_indicada] = est.uso_ia.get(ia_indicada, 0) + 1
+                afetadas.add(ia_indicada)
+            for ia_id in afetadas:
+                self._atualizar_score(est, ia_id)
+
+    def definir_contagens(self, usuario_id: str, histograma: Dict[str, int], uso_ia: Dict[str, int]) -> None:
+        """
+        Troca as contagens do usuário pelas compartilhadas (todos os workers);
+        só recalcula se mudaram.
+        """
+        with self._lock:
+            est = self._usuarios.get(usuario_id)
+            if est is None and not (histograma or uso_ia):
+                return
+            est = est or self._estado(usuario_id)
+            if est.histograma == histograma and est.uso_ia == uso_ia:
+                return
+            est.histograma, est.uso_ia = histograma, uso_ia
+            self._recalcular(est)
+
+    # ---------- consultas ----------
+
+    def top_k(self, usuario_id: str, k: int = 5) -> List[Tuple[str, float]]:
+        with self._lock:
+            est = self._usuarios.get(usuario_id, self._padrao)
+            return [(ia_id, -neg) for neg, ia_id in est.ranking[:k]]
+
+
+MOTOR = MotorRecomendacao()
+# eventos gravados a partir daqui chegam por registrar_evento(); os anteriores, pelo histórico
+_INICIO = datetime.utcnow()
+_HISTORICO_ID = "_historico"
+
+# contagens ainda não mandadas para o Mongo: usuario_id -> {"histograma": {cat: n}, "uso_ia": {ia: n}}
+_pendentes: Dict[str, Dict[str, Dict[str, int]]] = {}
+_pendentes_lock = threading.Lock()
+_parar = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _contagens(categoria: Optional[str], ia_indicada: Optional[str]) -> List[Tuple[str, str]]:
+    # (campo, chave) que o evento soma nos contadores compartilhados
+    cat = _norm_categoria(categoria)
+    res = []
+    if cat in MOTOR.catalogo.categorias:
+        res.append(("histograma", cat))
+    if ia_indicada in MOTOR.catalogo.ias:
+        res.append(("uso_ia", ia_indicada))
+    return res
+
+
+def _somar(destino: Dict[str, Dict[str, Dict[str, int]]], usuario_id: str, campo: str, chave: str, n: int) -> None:
+    contador = destino.setdefault(usuario_id, {}).setdefault(campo, {})
+    contador[chave] = contador.get(chave, 0) + n
+
+
+def _do_evento(e: Dict[str, Any]) -> Tuple[str, Optional[str], Optional[str]]:
+    payload = e.get("payload") if isinstance(e.get("payload"), dict) else {}
+    return (
+        e.get("usuario_id") or "anon",
+        e.get("categoria") or payload.get("categoria"),
+        e.get("ia_indicada") or payload.get("ia_indicada"),
+    )
+
+
+def registrar_evento(usuario_id: str, categoria: Optional[str], ia_indicada: Optional[str]) -> None:
+    MOTOR.registrar_evento(usuario_id, categoria, ia_indicada)
+    contagens = _contagens(categoria, ia_indicada)
+    if contagens:
+        with _pendentes_lock:
+            for campo, chave in contagens:
+                _somar(_pendentes, usuario_id, campo, chave, 1)
+
+
+# ---------- MONGO ----------
+
+def _recomendacao_col():
+    return get_collection("recomendacao")
+
+
+def _devolver(lote: Dict[str, Dict[str, Dict[str, int]]]) -> None:
+    with _pendentes_lock:
+        for usuario_id, campos in lote.items():
+            for campo, contador in campos.items():
+                for chave, n in contador.items():
+                    _somar(_pendentes, usuario_id, campo, chave, n)
+
+
+def publicar() -> None:
+    """
+    Manda as contagens pendentes para o Mongo ($inc em lote). Sem Mongo,
+    ou se a escrita falhar, elas ficam para a próxima vez.
+    """
+    global _pendentes
+    col = _recomendacao_col()
+    if col is None:
+        return
+    with _pendentes_lock:
+        lote, _pendentes = _pendentes, {}
+    if not lote:
+        return
+
+    from pymongo import UpdateOne  # type: ignore
+
+    operacoes = [
+        UpdateOne(
+            {"_id": f"u:{usuario_id}"},
+            {"$inc": {f"{campo}.{chave}": n for campo, contador in campos.items() for chave, n in contador.items()}},
+            upsert=True,
+        )
+        for usuario_id, campos in lote.items()
+    ]
+    try:
+        with medir("mongo"):
+            col.bulk_write(operacoes, ordered=False)
+    except Exception as e:
+        marcar_falha()
+        log_limitado(log, "recomendacao.publicar", "erro ao publicar contagens no Mongo", erro=repr(e))
+        _devolver(lote)
+
+
+def _contagens_compartilhadas(usuario_id: str) -> Optional[Tuple[Dict[str, int], Dict[str, int]]]:
+    """
+    (histograma, uso_ia) do usuário no Mongo (contadores + histórico) mais
+    o que este worker ainda não publicou. None sem Mongo.
+    """
+    col = _recomendacao_col()
+    if col is None:
+        return None
+    try:
+        with medir("mongo"):
+            doc = col.find_one({"_id": f"u:{usuario_id}"}, {"histograma": 1, "uso_ia": 1, "hist": 1}) or {}
+    except Exception as e:
+        marcar_falha()
+        log_limitado(log, "recomendacao.ler", "erro ao ler contagens do Mongo, usando as do processo", erro=repr(e))
+        return None
+    total: Dict[str, Dict[str, Dict[str, int]]] = {}
+    with _pendentes_lock:
+        fontes = [doc, doc.get("hist") or {}, _pendentes.get(usuario_id) or {}]
+        for fonte in fontes:
+            for campo in ("histograma", "uso_ia"):
+                for chave, n in (fonte.get(campo) or {}).items():
+                    _somar(total, usuario_id, campo, chave, n)
+    campos = total.get(usuario_id, {})
+    return campos.get("histograma", {}), campos.get("uso_ia", {})
+
+
+# ---------- HISTÓRICO ----------
+
+def _historico_compartilhado(col) -> bool:
+    """
+    Garante que a telemetria anterior aos contadores está em "hist".
+    True quando já está (feito aqui ou por outro worker).
+    """
+    from pymongo import UpdateOne  # type: ignore
+
+    from .telemetry import iterar_eventos
+
+    with medir("mongo"):
+        ate, pronto = reservar_historico(col, _INICIO, RECOMENDACAO_HISTORICO_PRAZO_SEG, _HISTORICO_ID)
+    if ate is None:
+        return pronto
+
+    hist: Dict[str, Dict[str, Dict[str, int]]] = {}
+    for e in iterar_eventos():
+        if e["timestamp"] >= ate:
+            break
+        usuario_id, categoria, ia_indicada = _do_evento(e)
+        for campo, chave in _contagens(categoria, ia_indicada):
+            _somar(hist, usuario_id, campo, chave, 1)
+    operacoes = [UpdateOne({"_id": f"u:{u}"}, {"$set": {"hist": campos}}, upsert=True) for u, campos in hist.items()]
+    with medir("mongo"):
+        if operacoes:
+            col.bulk_write(operacoes, ordered=False)
+        concluir_historico(col, ate, doc_id=_HISTORICO_ID)
+    log.info("histórico da recomendação carregado", extra={"usuarios": len(hist)})
+    return True
+
+
+def _historico_local() -> None:
+    # sem Mongo: a telemetria do diário local entra direto no motor do processo
+    from .telemetry import iterar_eventos
+
+    for e in iterar_eventos():
+        if e["timestamp"] >= _INICIO:
+            break
+        MOTOR.registrar_evento(*_do_evento(e))
+
+
+def _loop() -> None:
+    compartilhado, local = False, False
+    while True:
+        col = _recomendacao_col()
+        try:
+            if col is not None and not compartilhado:
+                compartilhado = _historico_compartilhado(col)
+            elif col is None and not local:
+                _historico_local()
+                local = True
+        except Exception as e:
+            marcar_falha()
+            log_limitado(log, "recomendacao.historico", "erro ao carregar o histórico da recomendação", erro=repr(e))
+        publicar()
+        if _parar.wait(RECOMENDACAO_PUBLICAR_SEG):
+            return
+
+
+def iniciar_recomendacao() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _parar.clear()
+    _thread = threading.Thread(target=_loop, name="recomendacao", daemon=True)
+    _thread.start()
+
+
+def parar_recomendacao() -> None:
+    global _thread
+    _parar.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        publicar()
+    _thread = None
+
+
+# ---------- CONSULTAS ----------
+
+
+def atualizar_perfil(profile) -> None:
+    MOTOR.atualizar_perfil(profile)
+
+
+def sincronizar_perfil(profile) -> None:
+    MOTOR.sincronizar_perfil(profile)
+
+
+def recomendar(usuario_id: str, k: int = 5) -> List[Dict[str, Any]]:
+    """
+    Top-k IAs do usuário (dicts da store + "score").
+    """
+    contagens = _contagens_compartilhadas(usuario_id)
+    if contagens is not None:
+        MOTOR.definir_contagens(usuario_id, *contagens)
+    return [{**IAS[i], "score": round(s, 4)} for i, s in MOTOR.top_k(usuario_id, k)]
@@ -0,0 +1,346 @@
+# app/repositorios.py
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Iterable, List, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+from . import db
+from .db import get_collection, marcar_falha
+from .observabilidade import get_logger, log_limitado, medir
+
+log = get_logger("repositorios")
+
+# Repositórios de documentos (usuários, devices...) com dois backends:
+# - RepositorioMemoria: dict em processo + índices secundários;
+# - RepositorioMongo: coleção Mongo com índices, compartilhada entre workers.
+# O backend Mongo fica atrás de um cache LRU read-through (RepositorioComCache).
+
+M = TypeVar("M", bound=BaseModel)
+
+STORE_BACKEND = os.getenv("STORE_BACKEND", "auto")  # auto | mongo | memoria
+CACHE_TAMANHO = int(os.getenv("CACHE_TAMANHO", "10000"))
+# Outros workers não invalidam o nosso cache: o TTL limita quanto tempo
+# uma leitura pode ficar desatualizada depois de um upsert feito em outro worker.
+CACHE_TTL_SEG = float(os.getenv("CACHE_TTL_SEG", "2"))
+
+
+class RepositorioMemoria(Generic[M]):
+    """
+    Backend em processo: documentos por id + índices secundários
+    (campo -> valor -> ids em ordem) para filtrar sem varrer tudo e
+    paginar por chave com bisect, inclusive com filtro.
+    """
+
+    def __init__(self, modelo: Type[M], indices: Iterable[str] = ()):
+        self.modelo = modelo
+        self._docs: Dict[str, M] = {}
+        self._ids_ordenados: List[str] = []  # para paginação por chave (keyset)
+        self._indices: Dict[str, Dict[Any, List[str]]] = {campo: {} for campo in indices}
+        self._lock = threading.Lock()
+
+    def _indexar(self, obj: M) -> None:
+        for campo, indice in self._indices.items():
+            bisect.insort(indice.setdefault(getattr(obj, campo), []), obj.id)
+
+    def _desindexar(self, obj: M) -> None:
+        for campo, indice in self._indices.items():
+            ids = indice.get(getattr(obj, campo))
+            if ids is None:
+                continue
+            i = bisect.bisect_left(ids, obj.id)
+            if i < len(ids) and ids[i] == obj.id:
+                del ids[i]
+            if not ids:
+                del indice[getattr(obj, campo)]
+
+    def upsert(self, obj: M) -> M:
+        with self._lock:
+            antigo = self._docs.get(obj.id)
+            if antigo is not None:
+                self._desindexar(antigo)
+            else:
+                bisect.insort(self._ids_ordenados, obj.id)
+            self._docs[obj.id] = obj
+            self._indexar(obj)
+        return obj
+
+    def remover(self, id: str) -> None:
+        with self._lock:
+            antigo = self._docs.pop(id, None)
+            if antigo is None:
+                return
+            self._desindexar(antigo)
+            i = bisect.bisect_left(self._ids_ordenados, id)
+            del self._ids_ordenados[i]
+
+    def get(self, id: str) -> Optional[M]:
+        return self._docs.get(id)
+
+    def _menor_indice(self, filtros: Dict[str, Any]) -> Optional[List[str]]:
+        """
+        Lista ordenada de ids do filtro indexado mais seletivo; None =
+        nenhum filtro indexado. Os outros filtros são conferidos documento
+        a documento. Chame com o lock adquirido.
+        """
+        listas = [self._indices[campo].get(valor, []) for campo, valor in filtros.items() if campo in self._indices]
+        return min(listas, key=len) if listas else None
+
+    def pagina(self, apos: Optional[str] = None, limite: int = 100, **filtros: Any) -> List[M]:
+        """
+        Paginação por chave: até `limite` documentos com id > `apos`, em ordem de id.
+        Cada página começa com bisect depois do cursor (no índice do filtro,
+        se houver), então percorrer tudo custa O(n), não O(n²/limite).
+        """
+        filtros = {k: v for k, v in filtros.items() if v is not None}
+
+        def ok(obj: M) -> bool:
+            return all(getattr(obj, campo) == valor for campo, valor in filtros.items())
+
+        with self._lock:
+            ids = self._menor_indice(filtros)
+            if ids is None:
+                ids = self._ids_ordenados
+            inicio = bisect.bisect_right(ids, apos) if apos is not None else 0
+            out: List[M] = []
+            for i in range(inicio, len(ids)):
+                obj = self._docs[ids[i]]
+                if ok(obj):
+                    out.append(obj)
+                    if len(out) >= limite:
+                        break
+            return out
+
+    def listar(self, **filtros: Any) -> List[M]:
+        filtros = {k: v for k, v in filtros.items() if v is not None}
+        with self._lock:
+            if not filtros:
+                return list(self._docs.values())
+
+            ids = self._menor_indice(filtros)
+            candidatos = self._docs.values() if ids is None else (self._docs[i] for i in ids)
+            return [
+                obj for obj in candidatos
+                if all(getattr(obj, campo) == valor for campo, valor in filtros.items())
+            ]
+
+    def contar(self) -> int:
+        return len(self._docs)
+
+
+class RepositorioMongo(Generic[M]):
+    """
+    Backend Mongo: o id do modelo vira o _id do documento e cada campo
+    indexado ganha um índice composto (campo, _id) na coleção, criado no
+    primeiro uso, que atende o filtro e a ordenação da paginação por chave.
+    A coleção é resolvida a cada operação (conexão lazy, ver app/db.py);
+    se o Mongo estiver fora ou falhar, usa um RepositorioMemoria como
+    fallback, igual à telemetria. O fallback só guarda o que não conseguiu
+    ir para o Mongo: não é uma segunda cópia (e desatualizada) da coleção.
+    Quando o Mongo volta, a primeira operação descarrega o fallback na
+    coleção (upsert por id) antes de ler ou gravar qualquer coisa.
+    """
+
+    def __init__(self, colecao: str, modelo: Type[M], indices: Iterable[str] = ()):
+        self.colecao = colecao
+        self.modelo = modelo
+        self._campos_indice = list(indices)
+        self._indices_ok = False
+        self._fallback: RepositorioMemoria[M] = RepositorioMemoria(modelo, self._campos_indice)
+        self._descarregando = threading.Lock()
+
+    def _col(self):
+        col = get_collection(self.colecao)
+        if col is not None and not self._indices_ok:
+            with medir("mongo"):
+                for campo in self._campos_indice:
+                    col.create_index([(campo, 1), ("_id", 1)])
+            self._indices_ok = True
+        if col is not None and self._fallback.contar():
+            self._descarregar(col)
+        return col
+
+    def _descarregar(self, col) -> None:
+        """
+        Manda para o Mongo o que foi gravado no fallback durante a queda.
+        Com o lock, quem chega durante a descarga espera: nenhuma leitura
+        deixa de ver esses documentos e nenhuma gravação nova é sobrescrita
+        por uma versão antiga. Se falhar no meio, o resto fica para a próxima.
+        """
+        with self._descarregando:
+            pendentes = self._fallback.listar()
+            for obj in pendentes:
+                with medir("mongo"):
+                    col.replace_one({"_id": obj.id}, {"_id": obj.id, **obj.model_dump()}, upsert=True)
+                self._fallback.remover(obj.id)
+            if pendentes:
+                log.info("fallback descarregado no Mongo", extra={"colecao": self.colecao, "documentos": len(pendentes)})
+
+    def _log_erro(self, msg: str, e: Exception) -> None:
+        marcar_falha()
+        log_limitado(log, f"repo.{self.colecao}", msg, colecao=self.colecao, erro=repr(e))
+
+    def _doc(self, doc: Dict[str, Any]) -> M:
+        doc.pop("_id", None)
+        return self.modelo(**doc)
+
+    def upsert(self, obj: M) -> M:
+        try:
+            col = self._col()
+            if col is not None:
+                with medir("mongo"):
+                    col.replace_one({"_id": obj.id}, {"_id": obj.id, **obj.model_dump()}, upsert=True)
+                # o Mongo passa a valer para este id
+                self._fallback.remover(obj.id)
+                return obj
+        except Exception as e:
+            self._log_erro("erro ao salvar no Mongo, usando memória", e)
+        self._fallback.upsert(obj)
+        return obj
+
+    def get(self, id: str) -> Optional[M]:
+        try:
+            col = self._col()
+            if col is None:
+                return self._fallback.get(id)
+            with medir("mongo"):
+                doc = col.find_one({"_id": id})
+        except Exception as e:
+            self._log_erro("erro ao ler do Mongo, usando memória", e)
+            return self._fallback.get(id)
+        return self._doc(doc) if doc else None
+
+    def listar(self, **filtros: Any) -> List[M]:
+        filtros = {k: v for k, v in filtros.items() if v is not None}
+        try:
+            col = self._col()
+            if col is None:
+                return self._fallback.listar(**filtros)
+            with medir("mongo"):
+                docs = list(col.find(filtros))
+            return [self._doc(d) for d in docs]
+        except Exception as e:
+            self._log_erro("erro ao ler do Mongo, usando memória", e)
+            return self._fallback.listar(**filtros)
+
+    def pagina(self, apos: Optional[str] = None, limite: int = 100, **filtros: Any) -> List[M]:
+        filtros = {k: v for k, v in filtros.items() if v is not None}
+        consulta = dict(filtros)
+        if apos is not None:
+            consulta["_id"] = {"$gt": apos}
+        try:
+            col = self._col()
+            if col is None:
+                return self._fallback.pagina(apos=apos, limite=limite, **filtros)
+            with medir("mongo"):
+                docs = list(col.find(consulta).sort("_id", 1).limit(limite))
+            return [self._doc(d) for d in docs]
+        except Exception as e:
+            self._log_erro("erro ao ler do Mongo, usando memória", e)
+            return self._fallback.pagina(apos=apos, limite=limite, **filtros)
+
+    def contar(self) -> int:
+        try:
+            col = self._col()
+            if col is not None:
+                return col.estimated_document_count()
+        except Exception as e:
+            self._log_erro("erro ao contar no Mongo", e)
+        return self._fallback.contar()
+
+
+class CacheLRU:
+    """
+    Cache LRU com TTL, seguro para as threads do FastAPI.
+    """
+
+    def __init__(self, tamanho: int, ttl_seg: float):
+        self.tamanho = tamanho
+        self.ttl_seg = ttl_seg
+        self._itens: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chave: str) -> Any:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or (self.ttl_seg > 0 and time.monotonic() - item[1] > self.ttl_seg):
+                if item is not None:
+                    del self._itens[chave]
+                self.misses += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.hits += 1
+            return item[0]
+
+    def put(self, chave: str, valor: Any) -> None:
+        with self._lock:
+            self._itens[chave] = (valor, time.monotonic())
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, chave: str) -> None:
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._itens.clear()
+
+
+class RepositorioComCache(Generic[M]):
+    """
+    Read-through: get consulta o cache e, se não achar, o backend.
+    upsert grava no backend e invalida a entrada do cache.
+    """
+
+    def __init__(self, base, tamanho: int = CACHE_TAMANHO, ttl_seg: float = CACHE_TTL_SEG):
+        self.base = base
+        self.modelo = base.modelo
+        self.cache = CacheLRU(tamanho, ttl_seg)
+
+    def upsert(self, obj: M) -> M:
+        self.base.upsert(obj)
+        self.cache.invalidar(obj.id)
+        return obj
+
+    def get(self, id: str) -> Optional[M]:
+        obj = self.cache.get(id)
+        if obj is not None:
+            return obj
+        obj = self.base.get(id)
+        if obj is not None:
+            self.cache.put(id, obj)
+        return obj
+
+    def listar(self, **filtros: Any) -> List[M]:
+        return self.base.listar(**filtros)
+
+    def pagina(self, apos: Optional[str] = None, limite: int = 100, **filtros: Any) -> List[M]:
+        return self.base.pagina(apos=apos, limite=limite, **filtros)
+
+    def contar(self) -> int:
+        return self.base.contar()
+
+
+def criar_repositorio(colecao: str, modelo: Type[M], indices: Iterable[str] = ()):
+    """
+    Escolhe o backend conforme STORE_BACKEND:
+    - "memoria": sempre em processo;
+    - "mongo"/"auto": Mongo (com cache LRU) se o pymongo estiver instalado,
+      senão memória. Não conecta aqui: a conexão sai no primeiro uso.
+    """
+    if STORE_BACKEND == "memoria" or not db.PYMONGO_DISPONIVEL:
+        if STORE_BACKEND == "mongo":
+            log.warning("STORE_BACKEND=mongo mas pymongo não instalado; usando memória", extra={"colecao": colecao})
+        return RepositorioMemoria(modelo, indices)
+
+    repo = RepositorioMongo(colecao, modelo, indices)
+    if CACHE_TAMANHO > 0:
+        return RepositorioComCache(repo)
+    return repo
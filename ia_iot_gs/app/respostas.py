@@ -0,0 +1,71 @@
+# app/respostas.py
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+# orjson é opcional: sem ele, as respostas caem no json padrão do Starlette
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Tipo não serializável: {type(obj).__name__}")
+
+
+def dumps(conteudo: Any) -> bytes:
+    """
+    Serializa para JSON (bytes). Aceita modelos pydantic e datetimes.
+    """
+    if orjson is not None:
+        return orjson.dumps(conteudo, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    import json
+    from fastapi.encoders import jsonable_encoder
+
+    return json.dumps(jsonable_encoder(conteudo), ensure_ascii=False).encode("utf-8")
+
+
+class RespostaJSON(JSONResponse):
+    """
+    JSONResponse serializada com orjson (quando instalado).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _linhas(itens: Iterable[Any]) -> Iterator[bytes]:
+    for item in itens:
+        yield dumps(item) + b"\n"
+
+
+def resposta_ndjson(itens: Iterable[Any]) -> StreamingResponse:
+    """
+    Streaming NDJSON: um objeto JSON por linha, gerado sob demanda.
+    """
+    return StreamingResponse(_linhas(itens), media_type="application/x-ndjson")
+
+
+def percorrer_paginas(
+    buscar: Callable[..., list],
+    apos: Optional[str] = None,
+    tamanho: int = 1000,
+    **filtros: Any,
+) -> Iterator[Any]:
+    """
+    Itera todos os itens (id > apos) de um repositório paginando por chave,
+    sem materializar a coleção inteira.
+    """
+    while True:
+        itens = buscar(apos=apos, limite=tamanho, **filtros)
+        yield from itens
+        if len(itens) < tamanho:
+            return
+        apos = itens[-1].id
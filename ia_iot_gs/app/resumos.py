@@ -0,0 +1,318 @@
+# app/resumos.py
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .admissao import LLM_ESPERA_VAGA_FUNDO_SEG, prazo_vaga_llm
+from .db import get_collection, marcar_falha
+from .observabilidade import get_logger, log_limitado, medir
+
+log = get_logger("resumos")
+
+# Resumos de uso de IA pré-calculados por usuário.
+#
+# save_event marca o usuário como "sujo" (marcar_sujo). Um agendador em
+# background regenera o resumo (gerar_resumo_uso_ia) só depois que a
+# telemetria do usuário ficar parada por RESUMO_DEBOUNCE_SEG segundos
+# (ou, no máximo, RESUMO_ESPERA_MAX_SEG após a primeira mudança).
+# O endpoint serve o último resumo salvo na hora (stale-while-revalidate).
+#
+# O agendador só chama o Gemini sozinho para quem juntou RESUMO_MIN_EVENTOS
+# eventos novos; "anon" (o balde dos clientes sem usuário) também é marcado
+# como sujo, mas só é regenerado quando alguém pede o resumo dele.
+# A versão do resumo é incrementada no Mongo ($inc), então sobrevive a
+# restarts e é a mesma para todos os workers.
+#
+# _SUJOS só vê os eventos deste worker. Cada worker guarda o resumo lido por
+# até RESUMO_CACHE_TTL_SEG; depois relê do Mongo (fica com a maior versão)
+# e conta os eventos do usuário gravados depois do gerado_em, na telemetria
+# compartilhada: quem não recebeu os eventos também sabe que está velho.
+
+RESUMO_DEBOUNCE_SEG = float(os.getenv("RESUMO_DEBOUNCE_SEG", "30"))
+RESUMO_ESPERA_MAX_SEG = float(os.getenv("RESUMO_ESPERA_MAX_SEG", "300"))
+RESUMO_MIN_EVENTOS = int(os.getenv("RESUMO_MIN_EVENTOS", "5"))
+RESUMO_INTERVALO_SEG = float(os.getenv("RESUMO_INTERVALO_SEG", "5"))
+RESUMO_CACHE_TTL_SEG = float(os.getenv("RESUMO_CACHE_TTL_SEG", "10"))
+
+USUARIO_ANONIMO = "anon"
+
+RECOMENDACOES_PADRAO = [
+    "Agrupe tarefas semelhantes para reduzir o número de chamadas às IAs.",
+    "Prefira modelos mais leves para pedidos simples e rápidos.",
+]
+
+# usuario_id -> {"versao_telemetria", "pendentes", "desde", "ultimo"}
+_SUJOS: Dict[str, Dict[str, Any]] = {}
+# usuario_id -> {"versao", "versao_telemetria", "gerado_em", "resumo"}
+_RESUMOS: Dict[str, Dict[str, Any]] = {}
+# usuario_id -> (lido_em, eventos de qualquer worker depois do gerado_em)
+_LIDOS: Dict[str, Tuple[float, int]] = {}
+# usuários com regeneração pedida explicitamente (sem esperar o debounce)
+_PEDIDOS: set = set()
+
+_lock = threading.Lock()
+_acordar = threading.Event()
+_parar = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _resumos_col():
+    return get_collection("resumos_uso_ia")
+
+
+def marcar_sujo(usuario_id: str) -> None:
+    """
+    Chamado por save_event: registra que a telemetria do usuário mudou.
+    É O(1) e não faz I/O.
+    """
+    agora = time.monotonic()
+    with _lock:
+        estado = _SUJOS.get(usuario_id)
+        if estado is None:
+            estado = {"versao_telemetria": 0, "pendentes": 0, "desde": agora, "ultimo": agora}
+            _SUJOS[usuario_id] = estado
+        elif estado["pendentes"] == 0:
+            estado["desde"] = agora
+        estado["versao_telemetria"] += 1
+        estado["pendentes"] += 1
+        estado["ultimo"] = agora
+
+
+def _esta_sujo(usuario_id: str) -> bool:
+    estado = _SUJOS.get(usuario_id)
+    locais = estado["pendentes"] if estado else 0
+    remotos = _LIDOS[usuario_id][1] if usuario_id in _LIDOS else 0
+    return max(locais, remotos) >= RESUMO_MIN_EVENTOS
+
+
+def _pronto_para_regenerar(usuario_id: str, estado: Dict[str, Any], agora: float) -> bool:
+    if usuario_id == USUARIO_ANONIMO or estado["pendentes"] < RESUMO_MIN_EVENTOS:
+        return False
+    parado = agora - estado["ultimo"] >= RESUMO_DEBOUNCE_SEG
+    esperou_demais = agora - estado["desde"] >= RESUMO_ESPERA_MAX_SEG
+    return parado or esperou_demais
+
+
+def _empacotar(usuario_id: str, resumo: Any) -> Dict[str, Any]:
+    """
+    Normaliza o retorno de gerar_resumo_uso_ia no formato da tela de Insights.
+    """
+    if isinstance(resumo, dict) and all(
+        k in resumo for k in ["destaque", "texto_resumo", "recomendacoes"]
+    ):
+        return resumo
+
+    return {
+        "destaque": f"Resumo de uso de IA para {usuario_id}",
+        "texto_resumo": resumo if isinstance(resumo, str) else str(resumo),
+        "recomendacoes": list(RECOMENDACOES_PADRAO),
+    }
+
+
+def _carregar(usuario_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Resumo do usuário, relido do Mongo quando a cópia deste worker passa
+    de RESUMO_CACHE_TTL_SEG (outro worker pode ter gerado uma versão nova).
+    """
+    from .telemetry import contar_eventos_desde
+
+    agora = time.monotonic()
+    with _lock:
+        registro = _RESUMOS.get(usuario_id)
+        lido = _LIDOS.get(usuario_id)
+    if registro is not None and lido is not None and agora - lido[0] < RESUMO_CACHE_TTL_SEG:
+        return registro
+
+    col = _resumos_col()
+    if col is None:
+        return registro
+    try:
+        with medir("mongo"):
+            guardado = col.find_one({"usuario_id": usuario_id}, {"_id": 0})
+    except Exception as e:
+        marcar_falha()
+        log_limitado(log, "resumos.ler", "erro ao ler do Mongo", erro=repr(e))
+        return registro
+
+    if guardado is not None and (registro is None or registro["versao"] < guardado["versao"]):
+        registro = guardado
+    remotos = 0
+    if registro is not None and isinstance(registro.get("gerado_em"), datetime):
+        remotos = contar_eventos_desde(usuario_id, registro["gerado_em"], RESUMO_MIN_EVENTOS) or 0
+
+    with _lock:
+        atual = _RESUMOS.get(usuario_id)
+        if registro is not None and (atual is None or atual["versao"] < registro["versao"]):
+            _RESUMOS[usuario_id] = registro
+        _LIDOS[usuario_id] = (agora, remotos)
+        return _RESUMOS.get(usuario_id)
+
+
+def regenerar(usuario_id: str) -> Dict[str, Any]:
+    """
+    Gera um novo resumo (chamada síncrona ao Gemini) e salva com versão.
+    """
+    from .mentor import gerar_resumo_uso_ia
+
+    with _lock:
+        estado = _SUJOS.get(usuario_id)
+        versao_telemetria = estado["versao_telemetria"] if estado else 0
+        pendentes_antes = estado["pendentes"] if estado else 0
+
+    resumo = _empacotar(usuario_id, gerar_resumo_uso_ia(usuario_id))
+    registro = {
+        "usuario_id": usuario_id,
+        "versao_telemetria": versao_telemetria,
+        "gerado_em": datetime.utcnow(),
+        "resumo": resumo,
+    }
+    versao_salva = _salvar(registro)
+
+    with _lock:
+        anterior = _RESUMOS.get(usuario_id)
+        if versao_salva is not None:
+            registro["versao"] = versao_salva
+        else:
+            # sem Mongo: a versão só existe neste processo
+            registro["versao"] = (anterior["versao"] + 1) if anterior else 1
+        if anterior is None or anterior["versao"] <= registro["versao"]:
+            _RESUMOS[usuario_id] = registro
+            _LIDOS[usuario_id] = (time.monotonic(), 0)
+        _PEDIDOS.discard(usuario_id)
+        estado = _SUJOS.get(usuario_id)
+        if estado is not None:
+            # eventos que chegaram durante a geração continuam pendentes
+            estado["pendentes"] = max(0, estado["pendentes"] - pendentes_antes)
+
+    return registro
+
+
+def _salvar(registro: Dict[str, Any]) -> Optional[int]:
+    """
+    Grava o resumo incrementando a versão no próprio Mongo (a versão do
+    processo some no restart). Retorna a versão gravada, ou None sem Mongo.
+    """
+    col = _resumos_col()
+    if col is None:
+        return None
+    try:
+        with medir("mongo"):
+            doc = col.find_one_and_update(
+                {"usuario_id": registro["usuario_id"]},
+                {"$set": registro, "$inc": {"versao": 1}},
+                projection={"_id": 0, "versao": 1},
+                upsert=True,
+                return_document=True,  # ReturnDocument.AFTER
+            )
+    except Exception as e:
+        marcar_falha()
+        log_limitado(log, "resumos.salvar", "erro ao salvar no Mongo", erro=repr(e))
+        return None
+    return doc["versao"]
+
+
+def solicitar_regeneracao(usuario_id: str) -> None:
+    """
+    Pede ao agendador para regenerar o resumo assim que possível.
+    """
+    with _lock:
+        _PEDIDOS.add(usuario_id)
+    _acordar.set()
+
+
+def _formatar(registro: Dict[str, Any], desatualizado: bool) -> Dict[str, Any]:
+    gerado_em = registro.get("gerado_em")
+    return {
+        **registro["resumo"],
+        "versao": registro["versao"],
+        "gerado_em": gerado_em.isoformat() if isinstance(gerado_em, datetime) else gerado_em,
+        "desatualizado": desatualizado,
+    }
+
+
+def obter_resumo(usuario_id: str, modo: str = "swr") -> Dict[str, Any]:
+    """
+    Retorna o resumo do usuário.
+
+    modos:
+    - "swr": devolve o último resumo salvo na hora; se estiver desatualizado,
+      agenda a regeneração em background (stale-while-revalidate).
+    - "cache": devolve o último resumo salvo, sem agendar nada.
+    - "sincrono": regenera agora e devolve o resultado novo.
+
+    Se ainda não existe resumo salvo, gera de forma síncrona.
+    """
+    if modo == "sincrono":
+        return _formatar(regenerar(usuario_id), desatualizado=False)
+
+    registro = _carregar(usuario_id)
+    if registro is None:
+        return _formatar(regenerar(usuario_id), desatualizado=False)
+
+    with _lock:
+        desatualizado = _esta_sujo(usuario_id)
+
+    if desatualizado and modo == "swr":
+        solicitar_regeneracao(usuario_id)
+
+    return _formatar(registro, desatualizado=desatualizado)
+
+
+def _usuarios_para_regenerar() -> list:
+    agora = time.monotonic()
+    with _lock:
+        prontos = {u for u, est in _SUJOS.items() if _pronto_para_regenerar(u, est, agora)}
+        prontos |= _PEDIDOS
+    return sorted(prontos)
+
+
+def _adiar(usuario_id: str) -> None:
+    agora = time.monotonic()
+    with _lock:
+        _PEDIDOS.discard(usuario_id)
+        estado = _SUJOS.get(usuario_id)
+        if estado is not None:
+            estado["desde"] = agora
+            estado["ultimo"] = agora
+
+
+def _loop() -> None:
+    prazo_vaga_llm.set(LLM_ESPERA_VAGA_FUNDO_SEG)
+    while not _parar.is_set():
+        for usuario_id in _usuarios_para_regenerar():
+            if _parar.is_set():
+                break
+            try:
+                regenerar(usuario_id)
+            except HTTPException as e:
+                # mantém o resumo anterior e espera outro debounce antes de tentar de novo
+                log_limitado(log, "resumos.regenerar", "falha ao regenerar resumo",
+                             usuario_id=usuario_id, erro=e.detail)
+                _adiar(usuario_id)
+            except Exception:
+                log.exception("erro inesperado ao regenerar resumo", extra={"usuario_id": usuario_id})
+                _adiar(usuario_id)
+        _acordar.wait(RESUMO_INTERVALO_SEG)
+        _acordar.clear()
+
+
+def iniciar_agendador() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _parar.clear()
+    _thread = threading.Thread(target=_loop, name="resumos-uso-ia", daemon=True)
+    _thread.start()
+
+
+def parar_agendador() -> None:
+    global _thread
+    _parar.set()
+    _acordar.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+    _thread = None
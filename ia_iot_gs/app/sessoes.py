@@ -0,0 +1,232 @@
+# app/sessoes.py
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Sessões de estudo (IoB) montadas em streaming a partir dos eventos IoT.
+#
+# Cada par (usuario_id, device_id) tem no máximo uma sessão aberta:
+# - "inicio_sessao" abre (se já havia uma aberta, ela fecha no último evento);
+# - "fim_sessao" fecha;
+# - qualquer outro evento do par com sessão aberta conta como atividade;
+# - sem evento por SESSAO_INATIVIDADE_SEG, a sessão fecha no último evento.
+#
+# As sessões abertas ficam num OrderedDict em ordem de última atividade,
+# então achar as expiradas é olhar o começo da fila: cada evento custa
+# O(1) amortizado e a memória das sessões é a das abertas. Ao fechar, os
+# minutos entram nos agregados do usuário (por dia UTC, por device e por
+# local), que as consultas leem direto, sem varrer IOT_EVENTS.
+#
+# Sessão aberta conta até o último evento dela, a mesma regra de quando
+# fecha por inatividade: os minutos de uma leitura nunca somem na seguinte.
+
+SESSAO_INATIVIDADE_SEG = float(os.getenv("SESSAO_INATIVIDADE_SEG", "1800"))
+SESSAO_DIAS = int(os.getenv("SESSAO_DIAS", "35"))
+
+EVENTO_INICIO = "inicio_sessao"
+EVENTO_FIM = "fim_sessao"
+LOCAL_DESCONHECIDO = "desconhecido"
+
+
+class _Sessao:
+    __slots__ = ("device_id", "local", "inicio", "ultimo")
+
+    def __init__(self, device_id: str, local: str, inicio: datetime):
+        self.device_id = device_id
+        self.local = local
+        self.inicio = inicio
+        self.ultimo = inicio
+
+    def minutos(self, ate: Optional[datetime] = None) -> float:
+        return max(0.0, ((ate or self.ultimo) - self.inicio).total_seconds() / 60)
+
+
+class _Agregados:
+    __slots__ = ("por_dia", "por_device", "por_local", "sessoes", "minutos", "ultimo_evento")
+
+    def __init__(self):
+        self.por_dia: Dict[date, float] = {}
+        self.por_device: Dict[str, float] = {}
+        self.por_local: Dict[str, float] = {}
+        self.sessoes = 0
+        self.minutos = 0.0
+        self.ultimo_evento: Optional[Dict[str, Any]] = None
+
+
+def _minutos_por_dia(inicio: datetime, fim: datetime):
+    """
+    Divide [inicio, fim] nos dias UTC que ele cruza (quase sempre 1 ou 2).
+    """
+    atual = inicio
+    while atual < fim:
+        virada = datetime.combine(atual.date() + timedelta(days=1), datetime.min.time())
+        trecho_fim = min(fim, virada)
+        yield atual.date(), (trecho_fim - atual).total_seconds() / 60
+        atual = trecho_fim
+
+
+class Sessionizador:
+    def __init__(
+        self,
+        inatividade_seg: float = SESSAO_INATIVIDADE_SEG,
+        dias: int = SESSAO_DIAS,
+        local_do_device: Optional[Callable[[str], Optional[str]]] = None,
+    ):
+        self.inatividade = timedelta(seconds=inatividade_seg)
+        self.dias = dias
+        self._local_do_device = local_do_device or (lambda device_id: None)
+        self._abertas: "OrderedDict[Tuple[str, str], _Sessao]" = OrderedDict()
+        self._abertas_usuario: Dict[str, Dict[str, _Sessao]] = {}   # usuario -> device -> sessão
+        self._usuarios: Dict[str, _Agregados] = {}
+        self._lock = threading.Lock()
+
+    # ---------- escrita ----------
+
+    def registrar(self, evento: Dict[str, Any]) -> None:
+        """
+        Processa um evento IoT (dict com usuario_id, device_id, evento,
+        metadata e timestamp). O(1) amortizado.
+        """
+        usuario_id = evento.get("usuario_id")
+        device_id = evento.get("device_id")
+        if not usuario_id or not device_id:
+            return
+        quando: datetime = evento["timestamp"]
+        tipo = evento.get("evento")
+        chave = (usuario_id, device_id)
+
+        local = None
+        if tipo == EVENTO_INICIO:
+            # fora do lock: pode ir ao repositório de devices (cache/Mongo)
+            local = (evento.get("metadata") or {}).get("local") or self._local_do_device(device_id)
+
+        with self._lock:
+            self._expirar(quando)
+            self._agregados(usuario_id).ultimo_evento = evento
+            sessao = self._abertas.get(chave)
+
+            if tipo == EVENTO_INICIO:
+                if sessao is not None:
+                    self._fechar(chave, sessao)
+                sessao = _Sessao(device_id, local or LOCAL_DESCONHECIDO, quando)
+                self._abertas[chave] = sessao
+                self._abertas_usuario.setdefault(usuario_id, {})[device_id] = sessao
+                return
+
+            if sessao is None:
+                return
+            sessao.ultimo = max(sessao.ultimo, quando)
+            if tipo == EVENTO_FIM:
+                self._fechar(chave, sessao)
+            else:
+                self._abertas.move_to_end(chave)
+
+    def _agregados(self, usuario_id: str) -> _Agregados:
+        agregados = self._usuarios.get(usuario_id)
+        if agregados is None:
+            agregados = self._usuarios[usuario_id] = _Agregados()
+        return agregados
+
+    def _expirar(self, agora: datetime) -> None:
+        # chamado com o lock; a fila está em ordem de última atividade
+        while self._abertas:
+            chave, sessao = next(iter(self._abertas.items()))
+            if agora - sessao.ultimo < self.inatividade:
+                break
+            self._fechar(chave, sessao)
+
+    def _fechar(self, chave: Tuple[str, str], sessao: _Sessao) -> None:
+        del self._abertas[chave]
+        do_usuario = self._abertas_usuario[chave[0]]
+        del do_usuario[chave[1]]
+        if not do_usuario:
+            del self._abertas_usuario[chave[0]]
+        agregados = self._agregados(chave[0])
+        minutos = sessao.minutos()
+        agregados.sessoes += 1
+        agregados.minutos += minutos
+        agregados.por_device[sessao.device_id] = agregados.por_device.get(sessao.device_id, 0.0) + minutos
+        agregados.por_local[sessao.local] = agregados.por_local.get(sessao.local, 0.0) + minutos
+        for dia, parcial in _minutos_por_dia(sessao.inicio, sessao.ultimo):
+            if dia not in agregados.por_dia:
+                self._podar_dias(agregados, dia)
+            agregados.por_dia[dia] = agregados.por_dia.get(dia, 0.0) + parcial
+
+    def _podar_dias(self, agregados: _Agregados, novo: date) -> None:
+        limite = novo - timedelta(days=self.dias)
+        for dia in [d for d in agregados.por_dia if d <= limite]:
+            del agregados.por_dia[dia]
+
+    # ---------- leitura ----------
+
+    def _abertas_do_usuario(self, usuario_id: str):
+        return list(self._abertas_usuario.get(usuario_id, {}).values())
+
+    def contexto(self, usuario_id: str, agora: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Sessão em andamento (se houver), último evento IoT e minutos de hoje.
+        """
+        agora = agora or datetime.utcnow()
+        with self._lock:
+            self._expirar(agora)
+            agregados = self._usuarios.get(usuario_id)
+            abertas = self._abertas_do_usuario(usuario_id)
+            hoje = agregados.por_dia.get(agora.date(), 0.0) if agregados else 0.0
+            em_andamento = [
+                {
+                    "device_id": s.device_id,
+                    "local": s.local,
+                    "inicio": s.inicio,
+                    "ultimo_evento": s.ultimo,
+                    "minutos": round(s.minutos(), 1),
+                }
+                for s in abertas
+            ]
+            hoje += sum(m for s in abertas for dia, m in _minutos_por_dia(s.inicio, s.ultimo) if dia == agora.date())
+            return {
+                "sessao_atual": em_andamento[0] if em_andamento else None,
+                "ultimo_iot": agregados.ultimo_evento if agregados else None,
+                "minutos_estudo_hoje": round(hoje, 1),
+            }
+
+    def resumo(self, usuario_id: str, dias: int = 7, agora: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Minutos de estudo do usuário nos últimos `dias` dias (sessões
+        fechadas + as em andamento até o último evento), por dia, device e local.
+        """
+        agora = agora or datetime.utcnow()
+        with self._lock:
+            self._expirar(agora)
+            agregados = self._usuarios.get(usuario_id) or _Agregados()
+            por_dia = dict(agregados.por_dia)
+            por_device = dict(agregados.por_device)
+            por_local = dict(agregados.por_local)
+            sessoes, total = agregados.sessoes, agregados.minutos
+            for s in self._abertas_do_usuario(usuario_id):
+                minutos = s.minutos()
+                total += minutos
+                por_device[s.device_id] = por_device.get(s.device_id, 0.0) + minutos
+                por_local[s.local] = por_local.get(s.local, 0.0) + minutos
+                for dia, parcial in _minutos_por_dia(s.inicio, s.ultimo):
+                    por_dia[dia] = por_dia.get(dia, 0.0) + parcial
+
+        inicio = agora.date() - timedelta(days=dias - 1)
+        serie = [
+            {"dia": d.isoformat(), "minutos": round(por_dia.get(d, 0.0), 1)}
+            for d in (inicio + timedelta(days=i) for i in range(dias))
+        ]
+        return {
+            "usuario_id": usuario_id,
+            "por_dia": serie,
+            "minutos_periodo": round(sum(p["minutos"] for p in serie), 1),
+            # device/local/total: desde o início (não só o período)
+            "minutos_total": round(total, 1),
+            "sessoes": sessoes,
+            "por_device": {k: round(v, 1) for k, v in sorted(por_device.items(), key=lambda kv: -kv[1])},
+            "por_local": {k: round(v, 1) for k, v in sorted(por_local.items(), key=lambda kv: -kv[1])},
+        }
+
+    def abertas(self) -> int:
+        return len(self._abertas)
@@ -0,0 +1,568 @@
+# app/sketches.py
+import hashlib
+import math
+import os
+import socket
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .db import concluir_historico, get_collection, marcar_falha, reservar_historico
+from .observabilidade import cronometrar, get_logger, log_limitado, medir
+
+log = get_logger("sketches")
+
+# Analytics aproximados em memória fixa, alimentados por save_event:
+#
+# - Space-Saving (top-k) das IAs (eventos mentor_resposta) e das categorias,
+#   com as mesmas regras de ias_mais_usadas / uso_por_categoria;
+# - HyperLogLog de usuários distintos por dia (últimos SKETCH_DIAS dias) e
+#   por categoria (só das categorias que estão no top-k, então a memória
+#   não cresce com categorias inventadas pelos clientes).
+#
+# Os dois são mescláveis: cada worker publica o seu estado no Mongo
+# (coleção "sketches_analytics", um documento por worker) a cada
+# SKETCH_PUBLICAR_SEG e as consultas juntam todos. Sem Mongo, vale o
+# estado do processo.
+#
+# A consulta só mescla o sketch que usa (ias-mais-usadas só lê o
+# Space-Saving das IAs) e guarda o resultado por SKETCH_PUBLICAR_SEG, o
+# mesmo atraso que os outros workers já têm.
+#
+# As contagens não morrem com o worker: o documento de quem parou de
+# publicar há SKETCH_MORTO_SEG é retirado (find_one_and_delete, então só um
+# worker o pega) e mesclado no documento "_aposentados". E a telemetria
+# anterior aos sketches entra uma vez só, como no carbono: cada worker marca
+# o próprio boot ($min em "_historico".inicio) e um deles monta os sketches
+# dos eventos anteriores a esse instante no próprio "_historico" ($set:
+# refazer não conta duas vezes; outro refaz se o dono passar de
+# SKETCH_HISTORICO_PRAZO_SEG). Sem Mongo, o histórico do diário local entra
+# no estado do processo. Tudo na thread de publicação, fora das requisições.
+
+SKETCH_TOP_K = int(os.getenv("SKETCH_TOP_K", "64"))
+SKETCH_HLL_P = int(os.getenv("SKETCH_HLL_P", "12"))
+SKETCH_DIAS = int(os.getenv("SKETCH_DIAS", "35"))
+SKETCH_PUBLICAR_SEG = float(os.getenv("SKETCH_PUBLICAR_SEG", "10"))
+SKETCH_MORTO_SEG = float(os.getenv("SKETCH_MORTO_SEG", "120"))
+SKETCH_HISTORICO_PRAZO_SEG = float(os.getenv("SKETCH_HISTORICO_PRAZO_SEG", "600"))
+
+# sketches que as consultas mesclam separadamente (campos do documento publicado)
+PARTES = ("ias", "categorias", "usuarios_dia", "usuarios_categoria")
+
+
+# ---------- SPACE-SAVING ----------
+
+class SpaceSaving:
+    """
+    Top-k aproximado (Metwally et al.) com no máximo k contadores.
+
+    Para cada item monitorado: contagem >= frequência real >= contagem - erro.
+    Todo item com frequência > total/k está garantidamente no resumo.
+
+    Os itens ficam agrupados por contagem ("stream summary"), então achar o
+    menor para despejar é O(1) em vez de varrer os k contadores.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self.total = 0
+        self.contadores: Dict[str, List[int]] = {}  # item -> [contagem, erro]
+        self._baldes: Dict[int, set] = {}           # contagem -> itens
+        self._menor = 0
+
+    def _mover(self, item: str, de: int, para: int) -> None:
+        baldes = self._baldes
+        balde = baldes[de]
+        if len(balde) == 1:
+            del baldes[de]
+            if de == self._menor:
+                self._menor = para if para == de + 1 else min(baldes, default=para)
+        else:
+            balde.discard(item)
+        destino = baldes.get(para)
+        if destino is None:
+            baldes[para] = {item}
+        else:
+            destino.add(item)
+        if para < self._menor:
+            self._menor = para
+
+    def adicionar(self, item: str, n: int = 1) -> Optional[str]:
+        """
+        Conta `item`. Retorna o item despejado para abrir espaço, se houver.
+        """
+        self.total += n
+        c = self.contadores.get(item)
+        if c is not None:
+            c[0] += n
+            self._mover(item, c[0] - n, c[0])
+            return None
+        if len(self.contadores) < self.k:
+            self.contadores[item] = [n, 0]
+            self._baldes.setdefault(n, set()).add(item)
+            self._menor = n if len(self.contadores) == 1 else min(self._menor, n)
+            return None
+        minimo = self._menor
+        menor = next(iter(self._baldes[minimo]))
+        del self.contadores[menor]
+        self.contadores[item] = [minimo + n, minimo]
+        # o novo item herda a posição do despejado
+        self._baldes[minimo].discard(menor)
+        self._baldes[minimo].add(item)
+        self._mover(item, minimo, minimo + n)
+        return menor
+
+    def _reindexar(self) -> None:
+        self._baldes = {}
+        for item, (c, _) in self.contadores.items():
+            self._baldes.setdefault(c, set()).add(item)
+        self._menor = min(self._baldes, default=0)
+
+    def _minimo(self) -> int:
+        return self._menor if len(self.contadores) >= self.k else 0
+
+    def mesclar(self, outro: "SpaceSaving") -> "SpaceSaving":
+        """
+        Junta dois resumos (Agarwal et al., "Mergeable Summaries"): quem falta
+        num lado recebe o mínimo daquele lado como contagem e erro.
+        """
+        min_a, min_b = self._minimo(), outro._minimo()
+        juntos: Dict[str, List[int]] = {}
+        for item in set(self.contadores) | set(outro.contadores):
+            a = self.contadores.get(item, [min_a, min_a])
+            b = outro.contadores.get(item, [min_b, min_b])
+            juntos[item] = [a[0] + b[0], a[1] + b[1]]
+        res = SpaceSaving(max(self.k, outro.k))
+        res.total = self.total + outro.total
+        res.contadores = dict(sorted(juntos.items(), key=lambda kv: -kv[1][0])[: res.k])
+        res._reindexar()
+        return res
+
+    def top(self, n: Optional[int] = None) -> List[Dict[str, Any]]:
+        ordenados = sorted(self.contadores.items(), key=lambda kv: (-kv[1][0], kv[0]))
+        return [
+            {"item": item, "contagem": c, "erro_max": e, "contagem_min": c - e}
+            for item, (c, e) in ordenados[:n]
+        ]
+
+    def exportar(self) -> Dict[str, Any]:
+        # lista, não dict: o item pode ter "." ou "$", que o Mongo não aceita como chave
+        return {"k": self.k, "total": self.total, "contadores": [[i, c, e] for i, (c, e) in self.contadores.items()]}
+
+    @classmethod
+    def importar(cls, dados: Dict[str, Any]) -> "SpaceSaving":
+        ss = cls(int(dados["k"]))
+        ss.total = int(dados["total"])
+        ss.contadores = {item: [int(c), int(e)] for item, c, e in dados["contadores"]}
+        ss._reindexar()
+        return ss
+
+
+# ---------- HYPERLOGLOG ----------
+
+def _hash64(valor: str) -> int:
+    # hash estável entre processos (hash() do Python muda a cada execução)
+    return int.from_bytes(hashlib.blake2b(valor.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    Contagem de distintos em 2^p registradores de 1 byte (p=12: 4 KiB).
+    Erro padrão relativo ~ 1.04 / sqrt(2^p) (p=12: ~1,6%).
+    """
+
+    def __init__(self, p: int = 12, registradores: Optional[bytes] = None):
+        self.p = p
+        self.m = 1 << p
+        self._bits = 64 - p
+        self._mascara = (1 << self._bits) - 1
+        self.registradores = bytearray(registradores) if registradores else bytearray(self.m)
+
+    def adicionar(self, valor: str) -> None:
+        self.adicionar_hash(_hash64(valor))
+
+    def adicionar_hash(self, h: int) -> None:
+        bits = self._bits
+        indice = h >> bits
+        rho = bits - (h & self._mascara).bit_length() + 1
+        if rho > self.registradores[indice]:
+            self.registradores[indice] = rho
+
+    def mesclar(self, outro: "HyperLogLog") -> "HyperLogLog":
+        if outro.p != self.p:
+            raise ValueError("HyperLogLogs com precisões diferentes")
+        return HyperLogLog(self.p, bytes(max(a, b) for a, b in zip(self.registradores, outro.registradores)))
+
+    @property
+    def erro_relativo(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def estimar(self) -> float:
+        m = self.m
+        alfa = 0.7213 / (1 + 1.079 / m)
+        soma = math.fsum(2.0 ** -r for r in self.registradores)
+        estimativa = alfa * m * m / soma
+        zeros = self.registradores.count(0)
+        if estimativa <= 2.5 * m and zeros:
+            # faixa baixa: linear counting é mais preciso
+            return m * math.log(m / zeros)
+        return estimativa
+
+
+# ---------- ESTADO DO WORKER ----------
+
+class AnalyticsAproximados:
+    def __init__(self, k: int = SKETCH_TOP_K, p: int = SKETCH_HLL_P, dias: int = SKETCH_DIAS):
+        self.k, self.p, self.dias = k, p, dias
+        self.ias = SpaceSaving(k)
+        self.categorias = SpaceSaving(k)
+        self.usuarios_dia: Dict[date, HyperLogLog] = {}
+        self.usuarios_categoria: Dict[str, HyperLogLog] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, evento: Dict[str, Any]) -> None:
+        categoria = evento.get("categoria")
+        ia = evento.get("ia_indicada")
+        if not (categoria and ia):
+            payload = evento.get("payload") if isinstance(evento.get("payload"), dict) else {}
+            categoria = categoria or payload.get("categoria")
+            ia = ia or payload.get("ia_indicada")
+        ts = evento.get("timestamp") or datetime.utcnow()
+        dia = ts.date()
+        h = _hash64(evento.get("usuario_id") or "anon")
+
+        with self._lock:
+            if ia and evento.get("evento") == "mentor_resposta":
+                self.ias.adicionar(ia)
+
+            hll = self.usuarios_dia.get(dia)
+            if hll is None:
+                hll = self.usuarios_dia[dia] = HyperLogLog(self.p)
+                self._podar_dias(dia)
+            hll.adicionar_hash(h)
+
+            if categoria:
+                despejada = self.categorias.adicionar(categoria)
+                if despejada is not None:
+                    self.usuarios_categoria.pop(despejada, None)
+                hll = self.usuarios_categoria.get(categoria)
+                if hll is None:
+                    hll = self.usuarios_categoria[categoria] = HyperLogLog(self.p)
+                hll.adicionar_hash(h)
+
+    def _podar_dias(self, hoje: date) -> None:
+        limite = hoje - timedelta(days=self.dias)
+        for dia in [d for d in self.usuarios_dia if d <= limite]:
+            del self.usuarios_dia[dia]
+
+    def mesclar(self, outro: "AnalyticsAproximados") -> "AnalyticsAproximados":
+        res = AnalyticsAproximados(self.k, self.p, self.dias)
+        res.ias = self.ias.mesclar(outro.ias)
+        res.categorias = self.categorias.mesclar(outro.categorias)
+        for destino, a, b in (
+            (res.usuarios_dia, self.usuarios_dia, outro.usuarios_dia),
+            (res.usuarios_categoria, self.usuarios_categoria, outro.usuarios_categoria),
+        ):
+            for chave in set(a) | set(b):
+                if chave in a and chave in b:
+                    destino[chave] = a[chave].mesclar(b[chave])
+                else:
+                    destino[chave] = a.get(chave) or b.get(chave)
+        return res
+
+    def incorporar(self, outro: "AnalyticsAproximados") -> None:
+        # como mesclar, mas no próprio objeto (LOCAL continua sendo o que save_event alimenta)
+        with self._lock:
+            juntos = self.mesclar(outro)
+            self.ias, self.categorias = juntos.ias, juntos.categorias
+            self.usuarios_dia, self.usuarios_categoria = juntos.usuarios_dia, juntos.usuarios_categoria
+
+    def exportar(self, partes: Iterable[str] = PARTES) -> Dict[str, Any]:
+        exportadores = {
+            "ias": lambda: self.ias.exportar(),
+            "categorias": lambda: self.categorias.exportar(),
+            "usuarios_dia": lambda: {d.isoformat(): bytes(h.registradores) for d, h in self.usuarios_dia.items()},
+            "usuarios_categoria": lambda: [[c, bytes(h.registradores)] for c, h in self.usuarios_categoria.items()],
+        }
+        with self._lock:
+            return {"k": self.k, "p": self.p, **{parte: exportadores[parte]() for parte in partes}}
+
+    @classmethod
+    def importar(cls, dados: Dict[str, Any]) -> "AnalyticsAproximados":
+        # partes ausentes (exportar(partes=...)) ficam vazias
+        a = cls(int(dados["k"]), int(dados["p"]))
+        if "ias" in dados:
+            a.ias = SpaceSaving.importar(dados["ias"])
+        if "categorias" in dados:
+            a.categorias = SpaceSaving.importar(dados["categorias"])
+        usuarios_dia = dados.get("usuarios_dia") or {}
+        a.usuarios_dia = {date.fromisoformat(d): HyperLogLog(a.p, r) for d, r in usuarios_dia.items()}
+        a.usuarios_categoria = {c: HyperLogLog(a.p, r) for c, r in dados.get("usuarios_categoria") or []}
+        return a
+
+    def copia(self) -> "AnalyticsAproximados":
+        return AnalyticsAproximados.importar(self.exportar())
+
+
+LOCAL = AnalyticsAproximados()
+# LOCAL conta os eventos a partir daqui; o boot entra no id porque o pid se
+# repete quando o container reinicia
+_INICIO = datetime.utcnow()
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{_INICIO:%Y%m%d%H%M%S%f}"
+_HISTORICO_ID = "_historico"
+_APOSENTADOS_ID = "_aposentados"
+
+_parar = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+# parte -> (monotonic do cálculo, estado consolidado só com aquela parte)
+_consolidados: Dict[str, Tuple[float, "AnalyticsAproximados"]] = {}
+_consolidados_lock = threading.Lock()
+
+
+def registrar(evento: Dict[str, Any]) -> None:
+    LOCAL.registrar(evento)
+
+
+# ---------- COMPARTILHAMENTO ENTRE WORKERS ----------
+
+def _sketches_col():
+    return get_collection("sketches_analytics")
+
+
+def publicar() -> None:
+    col = _sketches_col()
+    if col is None:
+        return
+    try:
+        with medir("mongo"):
+            col.replace_one({"_id": WORKER_ID},
+                            {"_id": WORKER_ID, "publicado_em": datetime.utcnow(), **LOCAL.exportar()},
+                            upsert=True)
+    except Exception as e:
+        marcar_falha()
+        log_limitado(log, "sketches.publicar", "erro ao publicar sketches no Mongo", erro=repr(e))
+
+
+def _mesclar_em(col, doc_id: str, estado: AnalyticsAproximados, tentativas: int = 5) -> None:
+    # read-modify-write com "versao" no filtro: quem perder a corrida relê e tenta de novo
+    from .idempotencia import eh_chave_duplicada
+
+    for _ in range(tentativas):
+        with medir("mongo"):
+            atual = col.find_one({"_id": doc_id})
+        versao = atual.get("versao", 0) if atual else 0
+        total = estado if atual is None else AnalyticsAproximados.importar(atual).mesclar(estado)
+        total._podar_dias(datetime.utcnow().date())
+        novo = {"_id": doc_id, "versao": versao + 1, **total.exportar()}
+        try:
+            with medir("mongo"):
+                if atual is None:
+                    col.insert_one(novo)
+                    return
+                if col.replace_one({"_id": doc_id, "versao": versao}, novo).matched_count:
+                    return
+        except Exception as e:
+            if not eh_chave_duplicada(e):
+                raise
+    raise RuntimeError(f"concorrência demais ao mesclar {doc_id}")
+
+
+def _aposentar(col) -> None:
+    """
+    Mescla em _APOSENTADOS_ID os documentos dos workers que pararam de
+    publicar, para as contagens deles continuarem nas consultas.
+    """
+    limite = datetime.utcnow() - timedelta(seconds=SKETCH_MORTO_SEG)
+    with medir("mongo"):
+        mortos = [d["_id"] for d in col.find({"publicado_em": {"$lt": limite}}, {"_id": 1})]
+    for doc_id in mortos:
+        with medir("mongo"):
+            doc = col.find_one_and_delete({"_id": doc_id, "publicado_em": {"$lt": limite}})
+        if doc is None:
+            continue  # outro worker pegou
+        try:
+            _mesclar_em(col, _APOSENTADOS_ID, AnalyticsAproximados.importar(doc))
+        except Exception:
+            # devolve o documento para a próxima rodada
+            with medir("mongo"):
+                col.replace_one({"_id": doc_id}, doc, upsert=True)
+            raise
+        log.info("sketches de worker parado aposentados", extra={"worker": doc_id})
+
+
+def _montar_historico(ate: datetime) -> AnalyticsAproximados:
+    from .telemetry import iterar_eventos
+
+    estado = AnalyticsAproximados()
+    for e in iterar_eventos():
+        if e["timestamp"] >= ate:
+            break
+        estado.registrar(e)
+    estado._podar_dias(datetime.utcnow().date())
+    return estado
+
+
+def _historico_compartilhado(col) -> bool:
+    """
+    Garante que os sketches da telemetria anterior aos workers estão em
+    _HISTORICO_ID. True quando já estão (feito aqui ou por outro worker).
+    """
+    with medir("mongo"):
+        ate, pronto = reservar_historico(col, _INICIO, SKETCH_HISTORICO_PRAZO_SEG, _HISTORICO_ID)
+    if ate is None:
+        return pronto
+
+    estado = _montar_historico(ate)
+    with medir("mongo"):
+        concluir_historico(col, ate, estado.exportar(), _HISTORICO_ID)
+    log.info("histórico dos sketches carregado", extra={"ate": ate.isoformat()})
+    return True
+
+
+def _historico_local() -> None:
+    # sem Mongo: a telemetria do diário local entra no estado do processo
+    LOCAL.incorporar(_montar_historico(_INICIO))
+
+
+def _consolidar(parte: str) -> AnalyticsAproximados:
+    total = AnalyticsAproximados.importar(LOCAL.exportar((parte,)))
+    col = _sketches_col()
+    if col is None:
+        return total
+    # workers vivos, os ainda não aposentados, _aposentados e _historico
+    try:
+        with medir("mongo"):
+            outros = list(col.find({"_id": {"$ne": WORKER_ID}}, {"_id": 0, "k": 1, "p": 1, parte: 1}))
+    except Exception as e:
+        marcar_falha()
+        log_limitado(log, "sketches.ler", "erro ao ler sketches do Mongo", erro=repr(e))
+        return total
+    for doc in outros:
+        if "k" in doc:  # _historico ainda sendo montado
+            total = total.mesclar(AnalyticsAproximados.importar(doc))
+    return total
+
+
+def consolidado(parte: str) -> AnalyticsAproximados:
+    """
+    Estado local mesclado com o último publicado pelos outros workers, só
+    com a `parte` pedida (uma de PARTES; as outras vêm vazias). Guardado
+    por SKETCH_PUBLICAR_SEG.
+    """
+    agora = time.monotonic()
+    guardado = _consolidados.get(parte)
+    if guardado is not None and agora - guardado[0] < SKETCH_PUBLICAR_SEG:
+        return guardado[1]
+    with _consolidados_lock:
+        guardado = _consolidados.get(parte)
+        if guardado is not None and agora - guardado[0] < SKETCH_PUBLICAR_SEG:
+            return guardado[1]
+        total = _consolidar(parte)
+        _consolidados[parte] = (time.monotonic(), total)
+        return total
+
+
+def _loop() -> None:
+    compartilhado, local = False, False
+    while True:
+        col = _sketches_col()
+        try:
+            if col is not None and not compartilhado:
+                compartilhado = _historico_compartilhado(col)
+            elif col is None and not local:
+                _historico_local()
+                local = True
+        except Exception as e:
+            marcar_falha()
+            log_limitado(log, "sketches.historico", "erro ao carregar o histórico dos sketches", erro=repr(e))
+        publicar()
+        if col is not None:
+            try:
+                _aposentar(col)
+            except Exception as e:
+                marcar_falha()
+                log_limitado(log, "sketches.aposentar", "erro ao aposentar sketches de workers parados", erro=repr(e))
+        if _parar.wait(SKETCH_PUBLICAR_SEG):
+            return
+
+
+def iniciar_publicacao() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _parar.clear()
+    _thread = threading.Thread(target=_loop, name="sketches-publicar", daemon=True)
+    _thread.start()
+
+
+def parar_publicacao() -> None:
+    global _thread
+    _parar.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        publicar()
+    _thread = None
+
+
+# ---------- CONSULTAS ----------
+
+def _faixa(estimativa: float, erro_relativo: float) -> Dict[str, Any]:
+    # ~95%: dois erros padrão
+    return {
+        "estimativa": round(estimativa),
+        "erro_relativo": round(erro_relativo, 4),
+        "intervalo_95": [max(0, round(estimativa * (1 - 2 * erro_relativo))), round(estimativa * (1 + 2 * erro_relativo))],
+    }
+
+
+@cronometrar("ias_mais_usadas_aprox")
+def ias_mais_usadas_aprox(top_n: int = 5) -> Dict[str, Any]:
+    from .store import IAS
+
+    ss = consolidado("ias").ias
+    ias = []
+    for linha in ss.top(top_n):
+        cfg = IAS.get(linha["item"], {})
+        ias.append({
+            "ia_id": linha["item"],
+            "nome": cfg.get("nome") or linha["item"],
+            "usos": linha["contagem"],
+            "usos_min": linha["contagem_min"],
+            "erro_max": linha["erro_max"],
+            "eco_score": cfg.get("eco_score"),
+        })
+    return {"ias": ias, "total_eventos": ss.total, "erro_garantido": ss.total // ss.k}
+
+
+@cronometrar("uso_por_categoria_aprox")
+def uso_por_categoria_aprox(top_n: Optional[int] = None) -> Dict[str, Any]:
+    ss = consolidado("categorias").categorias
+    categorias = [
+        {"categoria": l["item"], "quantidade": l["contagem"], "quantidade_min": l["contagem_min"], "erro_max": l["erro_max"]}
+        for l in ss.top(top_n)
+    ]
+    return {"categorias": categorias, "total_eventos": ss.total, "erro_garantido": ss.total // ss.k}
+
+
+@cronometrar("usuarios_ativos_aprox")
+def usuarios_ativos_aprox(dias: int = 1, categoria: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Usuários distintos nos últimos `dias` dias (união dos HLLs diários,
+    até SKETCH_DIAS) ou, com `categoria`, desde o início (entre as
+    categorias do top-k).
+    """
+    if categoria is not None:
+        hll = consolidado("usuarios_categoria").usuarios_categoria.get(categoria)
+        base = {"categoria": categoria}
+    else:
+        hoje = datetime.utcnow().date()
+        hll = None
+        for dia, h in consolidado("usuarios_dia").usuarios_dia.items():
+            if (hoje - dia).days < dias:
+                hll = h if hll is None else hll.mesclar(h)
+        base = {"dias": dias}
+    if hll is None:
+        return {**base, **_faixa(0, 0.0)}
+    return {**base, **_faixa(hll.estimar(), hll.erro_relativo)}
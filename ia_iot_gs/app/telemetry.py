@@ -1,36 +1,30 @@
 # app/telemetry.py
-import os
+import heapq
+import threading
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
-# Tenta usar MongoDB, mas não obriga
-try:
-    from pymongo import MongoClient  # type: ignore
-except ImportError:
-    MongoClient = None  # type: ignore
+from . import carbono, idempotencia, recomendacao, resumos, sketches
+from .db import get_collection, marcar_falha
+from .diario import get_diario, pendente as diario_pendente, percorrer as percorrer_diario, \
+    replicar as replicar_diario, ultimos as ultimos_diario
+from .observabilidade import EVENTOS_DUPLICADOS, cronometrar, get_logger, log_limitado, medir
 
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-MONGO_DB = os.getenv("MONGO_DB", "gs_disruptive")
+log = get_logger("telemetria")
 
-_client: Optional["MongoClient"] = None
-telemetria_col = None
+# Fallback sem Mongo: diário local em disco (app/diario.py), reenviado
+# para o Mongo quando ele volta. Com o diário desligado
+# (TELEMETRIA_LOG_DIR=""), fica só em memória, como antes.
+_EVENTS_MEM: List[Dict[str, Any]] = []
 
-if MongoClient is not None:
-    try:
-        _client = MongoClient(MONGO_URL)
-        db = _client[MONGO_DB]
-        telemetria_col = db["telemetria"]
-        print("DEBUG_TELEMETRIA: usando MongoDB para telemetria")
-    except Exception as e:
-        print("DEBUG_TELEMETRIA: falha ao conectar no Mongo, usando memória:", repr(e))
-        telemetria_col = None
-else:
-    print("DEBUG_TELEMETRIA: pymongo não instalado, usando memória")
+# último evento gravado por usuário neste processo (contexto sem Mongo)
+_ULTIMO_POR_USUARIO: Dict[str, Dict[str, Any]] = {}
 
-# Fallback em memória (para rodar mesmo sem Mongo)
-_EVENTS_MEM: List[Dict[str, Any]] = []
+_replicacao: threading.Thread | None = None
+_indice_evento_id_ok = False
 
 
+@cronometrar("save_event")
 def save_event(
     usuario_id: str,
     evento: str,
@@ -40,12 +34,19 @@ def save_event(
     sucesso: bool | None = None,
     duracao_seg: float | None = None,
     contexto: Dict[str, Any] | None = None,
+    evento_id: str | None = None,
 ) -> Dict[str, Any]:
     """
     Salva um evento de telemetria.
-    - Se Mongo estiver disponível, grava lá.
-    - Sempre guarda em memória também (_EVENTS_MEM) para consultas rápidas.
+    - Com evento_id repetido (retry do app), descarta sem I/O (app/idempotencia.py).
+    - Se Mongo estiver disponível, grava lá (índice único em evento_id).
+    - Senão (ou se a escrita falhar), grava no diário local.
+    Resumos, recomendação e sketches só contam o evento depois de gravado.
     """
+    if evento_id and idempotencia.TELEMETRIA.duplicado(evento_id):
+        EVENTOS_DUPLICADOS.inc("telemetria", "filtro")
+        return {"status": "ok", "duplicado": True}
+
     doc: Dict[str, Any] = {
         "usuario_id": usuario_id or "anon",
         "evento": evento,
@@ -57,38 +58,227 @@ def save_event(
         "contexto": contexto or {},
         "timestamp": datetime.utcnow(),
     }
+    if evento_id:
+        doc["evento_id"] = evento_id
 
-    # Salva em memória
-    _EVENTS_MEM.append(doc)
-
-    # Salva no Mongo se tiver disponível
+    # Salva no Mongo se tiver disponível (conexão criada no primeiro uso)
+    telemetria_col = get_collection("telemetria")
+    salvo = False
     if telemetria_col is not None:
+        _garantir_indice(telemetria_col)
+        _replicar_diario(telemetria_col)
         try:
-            res = telemetria_col.insert_one(doc)
+            with medir("mongo"):
+                res = telemetria_col.insert_one(doc)
             doc["_id"] = str(res.inserted_id)
+            salvo = True
         except Exception as e:
-            # Não derruba a API se o Mongo falhar
-            print("DEBUG_TELEMETRIA: erro ao salvar no Mongo:", repr(e))
+            if idempotencia.eh_chave_duplicada(e):
+                # retry que o filtro do processo não pegou (outro worker, LRU cheio)
+                EVENTOS_DUPLICADOS.inc("telemetria", "mongo")
+                return {"status": "ok", "duplicado": True}
+            # Não derruba a API se o Mongo falhar (e não inunda o log)
+            marcar_falha()
+            log_limitado(log, "telemetria.salvar", "erro ao salvar no Mongo, usando o diário", erro=repr(e))
+            doc.pop("_id", None)
+
+    if not salvo:
+        _salvar_local(doc)
+    _ULTIMO_POR_USUARIO[doc["usuario_id"]] = doc
 
+    # Marca o resumo de uso de IA do usuário para regeneração em background
+    resumos.marcar_sujo(doc["usuario_id"])
+
+    # Atualiza os scores de recomendação do usuário (incremental)
+    recomendacao.registrar_evento(
+        doc["usuario_id"],
+        categoria or doc["payload"].get("categoria"),
+        ia_indicada or doc["payload"].get("ia_indicada"),
+    )
+
+    # Top-k e usuários distintos aproximados (memória fixa)
+    sketches.registrar(doc)
+    carbono.registrar(doc)
     return {"status": "ok"}
 
 
+def _garantir_indice(col) -> None:
+    """
+    Índice único em evento_id (só nos documentos que têm um: eventos
+    antigos e clientes que não mandam id ficam de fora), índice
+    (usuario_id, timestamp) do último evento por usuário e índice em
+    timestamp, que atende o $gt + sort de iterar_eventos (exportação
+    incremental, históricos). Tentado uma vez por processo.
+    """
+    global _indice_evento_id_ok
+    if _indice_evento_id_ok:
+        return
+    _indice_evento_id_ok = True
+    try:
+        with medir("mongo"):
+            col.create_index(
+                "evento_id",
+                unique=True,
+                partialFilterExpression={"evento_id": {"$type": "string"}},
+            )
+            col.create_index([("usuario_id", 1), ("timestamp", -1)])
+            col.create_index("timestamp")
+    except Exception as e:
+        log_limitado(log, "telemetria.indice", "não foi possível criar os índices da telemetria", erro=repr(e))
+
+
+def _salvar_local(doc: Dict[str, Any]) -> None:
+    diario = get_diario()
+    if diario is None:
+        _EVENTS_MEM.append(doc)
+        return
+    try:
+        diario.anexar(doc)
+    except OSError as e:
+        log_limitado(log, "telemetria.diario", "erro ao gravar no diário, usando memória", erro=repr(e))
+        _EVENTS_MEM.append(doc)
+
+
+def _inserir_ignorando_duplicados(col, docs: List[Dict[str, Any]]) -> None:
+    try:
+        with medir("mongo"):
+            col.insert_many(docs, ordered=False)
+    except Exception as e:
+        # reenvio de um trecho já enviado: só chaves duplicadas (11000) são esperadas
+        erros = (getattr(e, "details", None) or {}).get("writeErrors") or []
+        if erros and all(err.get("code") == 11000 for err in erros):
+            return
+        raise
+
+
+def _replicar_diario(col) -> None:
+    """
+    Com o Mongo de volta, reenvia o diário numa thread (uma por vez).
+    """
+    global _replicacao
+    diario = get_diario()
+    if diario is None or (_replicacao is not None and _replicacao.is_alive()) or not diario_pendente():
+        return
+
+    def rodar() -> None:
+        try:
+            enviados = replicar_diario(lambda docs: _inserir_ignorando_duplicados(col, docs))
+            if enviados:
+                log.info("diário reenviado para o Mongo", extra={"eventos": enviados})
+        except Exception as e:
+            marcar_falha()
+            log_limitado(log, "telemetria.replicar", "erro ao reenviar o diário para o Mongo", erro=repr(e))
+
+    _replicacao = threading.Thread(target=rodar, name="diario-replicar", daemon=True)
+    _replicacao.start()
+
+
+@cronometrar("list_events")
 def list_events(limit: int = 1000) -> List[Dict[str, Any]]:
     """
     Lista eventos de telemetria.
     - Se Mongo estiver disponível, lê de lá (até 'limit' docs, mais recentes).
-    - Senão, retorna o que está em memória.
+    - Senão, lê os mais recentes do diário local (mmap, de trás para frente).
+    """
+    telemetria_col = get_collection("telemetria")
+    if telemetria_col is not None:
+        _replicar_diario(telemetria_col)
+        try:
+            with medir("mongo"):
+                cursor = (
+                    telemetria_col.find({}, {"_id": 0})
+                    .sort("timestamp", -1)
+                    .limit(limit)
+                )
+                return list(cursor)
+        except Exception as e:
+            marcar_falha()
+            log_limitado(log, "telemetria.ler", "erro ao ler do Mongo, usando o diário", erro=repr(e))
+
+    # fallback: diário local (+ o que ficou em memória se o diário falhou)
+    diario = get_diario()
+    if diario is None:
+        return _EVENTS_MEM[-limit:]
+    eventos = _EVENTS_MEM[-limit:][::-1]
+    if len(eventos) < limit:
+        eventos += ultimos_diario(limit - len(eventos))
+    return eventos
+
+
+def ultimo_evento_usuario(usuario_id: str) -> Optional[Dict[str, Any]]:
     """
+    Último evento de telemetria do usuário. Com Mongo, uma consulta pelo
+    índice (usuario_id, timestamp), que vê os eventos de todos os workers;
+    sem Mongo, o último gravado por este processo.
+    """
+    telemetria_col = get_collection("telemetria")
     if telemetria_col is not None:
+        _garantir_indice(telemetria_col)
         try:
-            cursor = (
-                telemetria_col.find({}, {"_id": 0})
-                .sort("timestamp", -1)
-                .limit(limit)
+            with medir("mongo"):
+                return telemetria_col.find_one(
+                    {"usuario_id": usuario_id}, {"_id": 0}, sort=[("timestamp", -1)]
+                )
+        except Exception as e:
+            marcar_falha()
+            log_limitado(log, "telemetria.ler", "erro ao ler do Mongo, usando a memória", erro=repr(e))
+    return _ULTIMO_POR_USUARIO.get(usuario_id)
+
+
+def contar_eventos_desde(usuario_id: str, desde: datetime, limite: int) -> Optional[int]:
+    """
+    Quantos eventos do usuário chegaram depois de `desde`, em todos os
+    workers, contando no máximo até `limite` (o índice (usuario_id,
+    timestamp) resolve sem varrer o resto). None sem Mongo.
+    """
+    telemetria_col = get_collection("telemetria")
+    if telemetria_col is None:
+        return None
+    _garantir_indice(telemetria_col)
+    try:
+        with medir("mongo"):
+            return telemetria_col.count_documents(
+                {"usuario_id": usuario_id, "timestamp": {"$gt": desde}}, limit=limite
             )
-            return list(cursor)
+    except Exception as e:
+        marcar_falha()
+        log_limitado(log, "telemetria.ler", "erro ao contar no Mongo", erro=repr(e))
+        return None
+
+
+def iterar_eventos(desde: Optional[datetime] = None, lote: int = 1000) -> Iterator[Dict[str, Any]]:
+    """
+    Percorre a telemetria em ordem de timestamp (só os posteriores a `desde`),
+    sem montar a lista inteira: o Mongo entrega em lotes de `lote` documentos.
+    Sem Mongo, percorre o diário local (+ memória).
+    """
+    filtro = {"timestamp": {"$gt": desde}} if desde is not None else {}
+    telemetria_col = get_collection("telemetria")
+    if telemetria_col is not None:
+        _garantir_indice(telemetria_col)
+        entregues = 0
+        try:
+            cursor = telemetria_col.find(filtro, {"_id": 0}).sort("timestamp", 1).batch_size(lote)
+            for evento in cursor:
+                entregues += 1
+                yield evento
+            return
         except Exception as e:
-            print("DEBUG_TELEMETRIA: erro ao ler do Mongo, usando memória:", repr(e))
+            marcar_falha()
+            if entregues:
+                # já entregou parte: recomeçar pelo diário duplicaria eventos
+                raise
+            log_limitado(log, "telemetria.iterar", "erro ao ler do Mongo, usando o diário", erro=repr(e))
+
+    locais = heapq.merge(
+        percorrer_diario(),
+        sorted(_EVENTS_MEM, key=_timestamp),
+        key=_timestamp,
+    )
+    for e in locais:
+        if desde is None or e["timestamp"] > desde:
+            yield e
+
 
-    # fallback: em memória
-    return _EVENTS_MEM[-limit:]
+def _timestamp(evento: Dict[str, Any]) -> datetime:
+    return evento["timestamp"]
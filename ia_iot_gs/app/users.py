@@ -1,12 +1,16 @@
 # app/users.py
-from typing import Dict, Optional
+from typing import Optional
 from .models import UserProfile
+from .repositorios import criar_repositorio
+from . import recomendacao
 
-USERS: Dict[str, UserProfile] = {}
+# Mongo (coleção "usuarios") quando disponível, senão memória do processo
+USERS = criar_repositorio("usuarios", UserProfile, indices=("nivel",))
 
 
 def upsert_user(profile: UserProfile) -> UserProfile:
-    USERS[profile.id] = profile
+    USERS.upsert(profile)
+    recomendacao.atualizar_perfil(profile)
     return profile
 
 
@@ -14,31 +18,21 @@ def get_user(user_id: str) -> Optional[UserProfile]:
     return USERS.get(user_id)
 
 
-def recomendar_ias_para_usuario(user_id: str):
+def recomendar_ias_para_usuario(user_id: str, k: int = 5):
     """
-    Lógica bem simples: usar objetivos e preferencias para priorizar IAs.
-    Depois você pode deixar isso mais inteligente.
+    Ranking personalizado (app/recomendacao.py): combina preferencias,
+    objetivos e historico_ias do perfil com o histograma de telemetria
+    do usuário e os atributos eco/velocidade das IAs.
+    Sem perfil, o ranking cai no eco_score + o que a telemetria já mostrou.
     """
-    from .store import IAS
-
-    profile = USERS.get(user_id)
+    profile = get_user(user_id)
     if not profile:
-        # fallback: ordena por eco_score
-        ias = sorted(IAS.values(), key=lambda x: x["eco_score"], reverse=True)
-        return {"usuario_id": user_id, "recomendacoes": ias[:5]}
-
-    # Exemplo: se usuário gosta de "eco", ordenar por eco_score
-    ias = list(IAS.values())
-    if "eco" in profile.preferencias:
-        ias = sorted(ias, key=lambda x: (x["eco_score"], -x["consumo_wh"]), reverse=True)
-    else:
-        # padrão: ordenar por velocidade
-        ias = sorted(ias, key=lambda x: x["velocidade"], reverse=True)
-
-    # Aqui dá pra filtrar por objetivos/preferencias, mas vamos manter simples
+        return {"usuario_id": user_id, "recomendacoes": recomendacao.recomendar(user_id, k)}
+
+    recomendacao.sincronizar_perfil(profile)
     return {
         "usuario_id": user_id,
         "nivel": profile.nivel,
         "objetivos": profile.objetivos,
-        "recomendacoes": ias[:5]
+        "recomendacoes": recomendacao.recomendar(user_id, k),
     }
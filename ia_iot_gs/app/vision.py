@@ -1,37 +1,32 @@
 # app/vision.py
 
 import os, json
-from fastapi import UploadFile, HTTPException
-import google.genai as genai
-
-
-def _get_gemini_client() -> genai.Client:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="GEMINI_API_KEY não configurada.")
-    return genai.Client(api_key=api_key)
-
-
-def _get_model():
-    return os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
 
-def analisar_ambiente_trabalho(imagem: UploadFile):
-    """
-    Usa o Gemini Vision para analisar uma imagem e gerar um relatório
-    sobre ergonomia, iluminação, organização e distrações.
-    """
-    client = _get_gemini_client()
-    model = _get_model()
+from fastapi import UploadFile, HTTPException
 
-    # Lê o binário da imagem
-    img_bytes = imagem.file.read()
+from .admissao import LLM_MAX_CONCORRENCIA
+from .llm import get_gemini_client
+from .observabilidade import cronometrar, medir
 
-    prompt = """
-    Você é um especialista em ergonomia, produtividade e bem-estar no trabalho.
-
-    A partir da imagem enviada, ANALISE e RETORNE APENAS UM JSON no formato:
+# Lote (várias fotos do mesmo ambiente numa chamada só): o Gemini aceita
+# até ~20 MB de dados inline por requisição; acima de VISAO_LOTE_MAX_IMAGENS
+# fotos ou VISAO_LOTE_MAX_MB, o lote é dividido em várias chamadas
+# (em paralelo) e as análises combinadas são mescladas aqui. Cada grupo
+# ocupa uma vaga do teto LLM_MAX_CONCORRENCIA (app/llm.py), como qualquer
+# outra chamada, e o pool nunca tem mais threads que o teto.
+# VISAO_LOTE_MAX_TOTAL limita as fotos aceitas por requisição e
+# VISAO_LOTE_MAX_TOTAL_MB a soma dos tamanhos (cada foto também respeita
+# JOBS_IMAGEM_MAX_MB, o mesmo teto do /jobs/visao).
+VISAO_LOTE_MAX_TOTAL = int(os.getenv("VISAO_LOTE_MAX_TOTAL", "24"))
+VISAO_LOTE_MAX_TOTAL_MB = float(os.getenv("VISAO_LOTE_MAX_TOTAL_MB", "60"))
+VISAO_LOTE_MAX_IMAGENS = int(os.getenv("VISAO_LOTE_MAX_IMAGENS", "8"))
+VISAO_LOTE_MAX_MB = float(os.getenv("VISAO_LOTE_MAX_MB", "18"))
 
+# formato de uma análise (o mesmo por imagem e no combinado do lote)
+_FORMATO_ANALISE = """
     {
       "classificacao_geral": "ótimo | bom | razoável | ruim",
       "ergonomia": {
@@ -57,26 +52,71 @@ def analisar_ambiente_trabalho(imagem: UploadFile):
         "Organizar itens essenciais"
       ]
     }
+"""
 
+_IMPORTANTE = """
     IMPORTANTE:
     - Retorne SOMENTE o JSON (nenhum texto fora dele).
     - Use pt-BR.
-    """
+"""
+
+PROMPT_AMBIENTE = """
+    Você é um especialista em ergonomia, produtividade e bem-estar no trabalho.
+
+    A partir da imagem enviada, ANALISE e RETORNE APENAS UM JSON no formato:
+""" + _FORMATO_ANALISE + _IMPORTANTE
+
+PROMPT_LOTE = """
+    Você é um especialista em ergonomia, produtividade e bem-estar no trabalho.
+
+    Você vai receber {n} fotos do MESMO ambiente de trabalho (ângulos
+    diferentes), marcadas como "Imagem 1" a "Imagem {n}". ANALISE cada uma
+    e também o ambiente como um todo, e RETORNE APENAS UM JSON no formato:
+
+    {{
+      "imagens": [
+        {{"indice": 1, ...análise da imagem 1...}},
+        ...
+      ],
+      "combinada": {{...análise do ambiente considerando todas as fotos...}}
+    }}
+
+    Cada análise (por imagem e a combinada) segue este formato:
+""" + _FORMATO_ANALISE.replace("{", "{{").replace("}", "}}") + _IMPORTANTE + """\
+    - "imagens" deve ter exatamente {n} itens, um por foto, na ordem.
+"""
+
+# da melhor para a pior: a análise mesclada de vários lotes fica com a pior
+_ESCALAS = {
+    ("classificacao_geral",): ["ótimo", "bom", "razoável", "ruim"],
+    ("iluminacao", "nivel"): ["boa", "média", "baixa"],
+    ("organizacao", "nivel"): ["organizado", "moderado", "bagunçado"],
+}
+
+
+def _get_gemini_client():
+    # google.genai só é importado aqui, no primeiro uso (ver app/llm.py)
+    return get_gemini_client()
+
+
+def _get_model():
+    return os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+
+def _gerar_json(parts: List[Dict[str, Any]]) -> Any:
+    client = _get_gemini_client()
+    model = _get_model()
 
     try:
-        result = client.models.generate_content(
-            model=model,
-            contents=[
-                {
-                    "role": "user",
-                    "parts": [
-                        {"text": prompt},
-                        {"inline_data": {"data": img_bytes, "mime_type": imagem.content_type}}
-                    ]
-                }
-            ],
-            config={"response_mime_type": "application/json"}
-        )
+        with medir("llm"):
+            result = client.models.generate_content(
+                model=model,
+                contents=[{"role": "user", "parts": parts}],
+                config={"response_mime_type": "application/json"}
+            )
+    except HTTPException:
+        # o 429 do teto de concorrência (vaga_llm) passa direto, com o Retry-After
+        raise
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Erro no Gemini Vision: {e!r}")
 
@@ -84,11 +124,135 @@ def analisar_ambiente_trabalho(imagem: UploadFile):
 
     # Tenta converter para JSON
     try:
-        data = json.loads(raw)
+        return json.loads(raw)
     except Exception as e:
         raise HTTPException(
             status_code=502,
             detail=f"Retorno do Gemini não era JSON: {e!r} | Conteúdo={raw!r}"
         )
 
-    return data
+
+def analisar_ambiente_trabalho(imagem: UploadFile):
+    """
+    Usa o Gemini Vision para analisar uma imagem e gerar um relatório
+    sobre ergonomia, iluminação, organização e distrações.
+    """
+    # Lê o binário da imagem
+    return analisar_imagem(imagem.file.read(), imagem.content_type)
+
+
+@cronometrar("analisar_imagem")
+def analisar_imagem(img_bytes: bytes, mime_type: str):
+    """
+    Mesma análise a partir dos bytes (usada também pelos jobs assíncronos,
+    que guardam a imagem e rodam fora da requisição).
+    """
+    return _gerar_json([
+        {"text": PROMPT_AMBIENTE},
+        {"inline_data": {"data": img_bytes, "mime_type": mime_type}},
+    ])
+
+
+# ---------- LOTE ----------
+
+def _dividir(imagens: List[Tuple[bytes, str]]) -> List[List[int]]:
+    """
+    Índices das imagens agrupados respeitando os limites por chamada
+    (uma imagem maior que o limite vai sozinha).
+    """
+    limite_bytes = VISAO_LOTE_MAX_MB * 1024 * 1024
+    grupos: List[List[int]] = []
+    atual: List[int] = []
+    tamanho = 0
+    for i, (conteudo, _) in enumerate(imagens):
+        if atual and (len(atual) >= VISAO_LOTE_MAX_IMAGENS or tamanho + len(conteudo) > limite_bytes):
+            grupos.append(atual)
+            atual, tamanho = [], 0
+        atual.append(i)
+        tamanho += len(conteudo)
+    if atual:
+        grupos.append(atual)
+    return grupos
+
+
+def _analisar_grupo(imagens: List[Tuple[bytes, str]]) -> Tuple[List[Any], Dict[str, Any]]:
+    if len(imagens) == 1:
+        # uma foto só: o prompt simples já é a análise combinada
+        data = analisar_imagem(*imagens[0])
+        return [data], data
+
+    parts: List[Dict[str, Any]] = [{"text": PROMPT_LOTE.format(n=len(imagens))}]
+    for i, (conteudo, mime_type) in enumerate(imagens, start=1):
+        parts.append({"text": f"Imagem {i}:"})
+        parts.append({"inline_data": {"data": conteudo, "mime_type": mime_type}})
+    data = _gerar_json(parts)
+
+    por_indice = {}
+    for item in (data.get("imagens") or []) if isinstance(data, dict) else []:
+        if isinstance(item, dict) and isinstance(item.get("indice"), int):
+            por_indice[item.pop("indice")] = item
+    analises = [por_indice.get(i, {"erro": "o modelo não devolveu a análise desta imagem"})
+                for i in range(1, len(imagens) + 1)]
+    combinada = data.get("combinada") if isinstance(data, dict) else None
+    return analises, combinada or {}
+
+
+def _mesclar(combinadas: List[Dict[str, Any]], caminho: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    """
+    Junta as análises combinadas de vários grupos: listas viram a união
+    (sem repetir), níveis ficam com o pior e o resto vem do primeiro grupo
+    que tiver o campo.
+    """
+    mesclada: Dict[str, Any] = {}
+    for analise in combinadas:
+        for campo, valor in analise.items():
+            chave = caminho + (campo,)
+            atual = mesclada.get(campo)
+            if campo not in mesclada:
+                mesclada[campo] = list(valor) if isinstance(valor, list) else valor
+            elif isinstance(valor, dict) and isinstance(atual, dict):
+                mesclada[campo] = _mesclar([atual, valor], chave)
+            elif isinstance(valor, list) and isinstance(atual, list):
+                vistos = {str(v).casefold() for v in atual}
+                for v in valor:
+                    if str(v).casefold() not in vistos:
+                        vistos.add(str(v).casefold())
+                        atual.append(v)
+            elif chave in _ESCALAS:
+                escala = _ESCALAS[chave]
+                if valor in escala and (atual not in escala or escala.index(valor) > escala.index(atual)):
+                    mesclada[campo] = valor
+    return mesclada
+
+
+@cronometrar("analisar_imagens")
+def analisar_imagens(imagens: List[Tuple[bytes, str]]) -> Dict[str, Any]:
+    """
+    Analisa várias fotos do mesmo ambiente com o mínimo de chamadas ao
+    Gemini: o prompt vai uma vez por grupo em vez de uma vez por foto.
+
+    imagens: [(bytes, mime_type), ...]. Retorna
+    {"imagens": [análise por foto, na ordem], "combinada": {...}, "chamadas": int}.
+    """
+    grupos = _dividir(imagens)
+    if len(grupos) == 1:
+        resultados = [_analisar_grupo(imagens)]
+    else:
+        # grupos em paralelo: a latência total fica a do grupo mais lento
+        # (as threads do pool não somam no tempo "llm" da requisição, só em
+        # app_operation_duration_seconds; somar chamadas paralelas passaria do total)
+        # Cada grupo roda numa cópia do contexto de quem chamou: um lote vindo
+        # de um job espera pela vaga do LLM com o prazo do job, não o da rota.
+        trabalhadores = max(1, min(len(grupos), LLM_MAX_CONCORRENCIA))
+        with ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="visao-lote") as pool:
+            futuros = [pool.submit(contextvars.copy_context().run, _analisar_grupo, [imagens[i] for i in g])
+                       for g in grupos]
+            resultados = [f.result() for f in futuros]
+
+    analises = [analise for por_imagem, _ in resultados for analise in por_imagem]
+    combinadas = [combinada for _, combinada in resultados]
+    return {
+        "imagens": analises,
+        "combinada": combinadas[0] if len(combinadas) == 1 else _mesclar(combinadas),
+        "chamadas": len(grupos),
+    }
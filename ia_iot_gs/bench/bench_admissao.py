@@ -0,0 +1,134 @@
+# bench/bench_admissao.py
+"""
+Controle de admissão sob abuso: um cliente martelando /mentor/explicar-tarefa
+enquanto usuários normais usam a mesma rota no ritmo do app.
+
+O abusador é carga aberta (--taxa-abuso req/s, como um script que não
+espera resposta para mandar o próximo), então os dois modos recebem a
+mesma carga. Sobe bench.servidor_fake duas vezes (ADMISSAO_ATIVA=0 e 1) e, em cada uma,
+mede a latência dos usuários normais sem abuso e com abuso. Sem admissão o
+abusador ocupa o threadpool e o p99 dos normais dispara; com admissão ele
+recebe 429 (Retry-After) e o p99 dos normais fica no patamar da latência do LLM.
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_admissao --duracao 30 --taxa-abuso 200
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from bench.carga import AQUI, Cliente, _percentil, _porta_livre
+
+CORPO = json.dumps({"descricao": "Preciso escrever um post para o LinkedIn"}).encode()
+
+
+def _subir(admissao: bool, latencia_ms: float) -> Tuple[subprocess.Popen, str]:
+    porta = _porta_livre()
+    env = dict(os.environ, ADMISSAO_ATIVA="1" if admissao else "0",
+               # todos os clientes saem de 127.0.0.1: sem o bucket por IP
+               ADMISSAO_USUARIOS_POR_IP="0", LOG_LEVEL="ERROR")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "bench.servidor_fake", "--porta", str(porta),
+         "--latencia-ms", str(latencia_ms), "--jitter-ms", "0"],
+        cwd=AQUI, env=env,
+    )
+    url = f"http://127.0.0.1:{porta}"
+    cliente = Cliente(url, timeout=1)
+    for _ in range(300):
+        try:
+            if cliente.enviar("GET", "/health", None, {}) == 200:
+                return proc, url
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise TimeoutError("servidor falso não subiu")
+
+
+def _rodada(url: str, duracao: float, normais: int, intervalo: float,
+            abusadores: int, taxa_abuso: float) -> Dict[str, object]:
+    latencias: List[float] = []
+    status_normais: Counter = Counter()
+    status_abuso: Counter = Counter()
+    lock = threading.Lock()
+    fim = time.perf_counter() + duracao
+
+    def normal(i: int) -> None:
+        rnd = random.Random(i)
+        cliente = Cliente(url)
+        headers = {"Content-Type": "application/json", "X-Usuario-Id": f"u{i}"}
+        time.sleep(rnd.uniform(0, intervalo))
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            try:
+                status = cliente.enviar("POST", "/mentor/explicar-tarefa", CORPO, headers)
+            except Exception:
+                status = 0
+            ms = (time.perf_counter() - inicio) * 1000
+            with lock:
+                latencias.append(ms)
+                status_normais[status] += 1
+            time.sleep(max(0.0, intervalo - ms / 1000))
+
+    def abusador(taxa: float) -> None:
+        # carga aberta: cada thread dispara no seu ritmo, responda o servidor rápido ou não
+        cliente = Cliente(url)
+        headers = {"Content-Type": "application/json", "X-Usuario-Id": "abusador"}
+        proximo = time.perf_counter()
+        while time.perf_counter() < fim:
+            time.sleep(max(0.0, proximo - time.perf_counter()))
+            proximo += 1 / taxa
+            try:
+                status = cliente.enviar("POST", "/mentor/explicar-tarefa", CORPO, headers)
+            except Exception:
+                status = 0
+            with lock:
+                status_abuso[status] += 1
+
+    threads = [threading.Thread(target=normal, args=(i,)) for i in range(normais)]
+    threads += [threading.Thread(target=abusador, args=(taxa_abuso / abusadores,)) for _ in range(abusadores)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return {
+        "n": len(latencias),
+        "p50": _percentil(latencias, 0.50),
+        "p99": _percentil(latencias, 0.99),
+        "normais": dict(status_normais),
+        "abuso": dict(status_abuso),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duracao", type=float, default=30.0)
+    parser.add_argument("--latencia-ms", type=float, default=300)
+    parser.add_argument("--normais", type=int, default=20, help="usuários normais (um por thread)")
+    parser.add_argument("--intervalo", type=float, default=5.0, help="segundos entre pedidos de cada usuário normal")
+    parser.add_argument("--abusadores", type=int, default=64, help="threads do cliente abusivo")
+    parser.add_argument("--taxa-abuso", type=float, default=200, help="req/s do cliente abusivo (todas as threads)")
+    args = parser.parse_args()
+
+    print(f"{'admissão':<10} {'abuso':<6} {'n':>5} {'p50 ms':>9} {'p99 ms':>9}  status normais / abusador")
+    for admissao in (False, True):
+        proc, url = _subir(admissao, args.latencia_ms)
+        try:
+            for abusadores in (0, args.abusadores):
+                r = _rodada(url, args.duracao, args.normais, args.intervalo, abusadores, args.taxa_abuso)
+                print(f"{'ligada' if admissao else 'desligada':<10} {abusadores:<6} {r['n']:>5} "
+                      f"{r['p50']:>9.1f} {r['p99']:>9.1f}  {r['normais']} / {r['abuso']}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# bench/bench_carbono.py
+"""
+Consumo de um usuário: a varredura dos últimos 5000 eventos (como
+consumo_eco_estimado_por_usuario fazia) x a consulta aos totais mantidos
+na ingestão (app/carbono.py).
+
+Mede também o custo por evento de registrar e o recalcular() de todos os
+usuários depois de uma mudança de fator, contra montar a matriz
+contas x IAs no numpy e multiplicar (U · f).
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_carbono --eventos 100000 1000000 --usuarios 20000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from app import carbono
+from app.store import IAS
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    np = None
+
+IAS_IDS = list(IAS) + [None, "outra"]
+
+
+def _stream(n: int, usuarios: int):
+    rnd = random.Random(42)
+    t = datetime(2026, 1, 1)
+    for _ in range(n):
+        t += timedelta(seconds=rnd.expovariate(1 / 5))
+        yield {
+            "usuario_id": f"u{rnd.randrange(usuarios)}",
+            "evento": rnd.choice(("mentor_resposta", "mentor_resposta", "visao_ambiente", "outro")),
+            "ia_indicada": rnd.choice(IAS_IDS),
+            "payload": {},
+            "timestamp": t,
+        }
+
+
+def _varredura(eventos, usuario_id: str):
+    # o cálculo antigo: filtra a janela e conta
+    janela = eventos[-5000:]
+    return sum(1 for e in janela if e["usuario_id"] == usuario_id and e["evento"] in carbono.EVENTOS_IA)
+
+
+def _por_consulta(funcao, alvos) -> float:
+    inicio = time.perf_counter()
+    for u in alvos:
+        funcao(u)
+    return (time.perf_counter() - inicio) / len(alvos)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eventos", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--usuarios", type=int, default=20_000)
+    parser.add_argument("--consultas", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'eventos':>9} {'registrar (µs/ev)':>18} {'varredura (µs)':>15} {'consulta (µs)':>14} "
+          f"{'recalcular (ms)':>16} {'matriz numpy (ms)':>18}")
+    for n in args.eventos:
+        eventos = list(_stream(n, args.usuarios))
+        contabilidade = carbono.ContabilidadeCarbono(dias=10_000)
+        inicio = time.perf_counter()
+        for e in eventos:
+            contabilidade.registrar(e)
+        registrar = (time.perf_counter() - inicio) / n
+
+        alvos = [f"u{i}" for i in random.Random(7).sample(range(args.usuarios), args.consultas)]
+        varredura = _por_consulta(lambda u: _varredura(eventos, u), alvos)
+        consulta = _por_consulta(contabilidade.conta_usuario, alvos)
+
+        inicio = time.perf_counter()
+        contabilidade.recalcular()
+        sem_numpy = time.perf_counter() - inicio
+
+        com_numpy = float("nan")
+        if np is not None:
+            contas = list(contabilidade.usuarios.values()) + list(contabilidade.por_dia.values())
+            ias = list(contabilidade.fatores.wh)
+            inicio = time.perf_counter()
+            U = np.array([[c.usos.get(ia, 0) for ia in ias] for c in contas], dtype=np.float64)
+            wh = U @ np.asarray([contabilidade.fatores.wh[ia] for ia in ias])
+            com_numpy = time.perf_counter() - inicio
+            assert all(abs(c.wh - w) < 1e-6 for c, w in zip(contas, wh.tolist()))
+
+        print(f"{n:>9,} {registrar * 1e6:>18.2f} {varredura * 1e6:>15.1f} {consulta * 1e6:>14.2f} "
+              f"{sem_numpy * 1e3:>16.1f} {com_numpy * 1e3:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# bench/bench_devices.py
+"""
+Compara o GET /iot/devices antigo (lista inteira + jsonable_encoder + json)
+com a página keyset + orjson, a página filtrada por índice e o streaming NDJSON.
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_devices --tamanhos 10000 100000
+"""
+import argparse
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from app.models import Device
+from app.repositorios import RepositorioMemoria
+from app.respostas import dumps, percorrer_paginas, _linhas
+
+TIPOS = ["smartphone", "desktop", "totem", "notebook"]
+LOCAIS = ["lab_fiap", "casa", "coworking", "biblioteca", "auditorio"]
+CAPACIDADES = ["baixa", "media", "alta"]
+
+
+def _popular(n: int) -> RepositorioMemoria:
+    repo = RepositorioMemoria(Device, indices=("tipo", "local", "capacidade"))
+    for i in range(n):
+        repo.upsert(Device(
+            id=f"dev-{i:07d}",
+            tipo=TIPOS[i % len(TIPOS)],
+            local=LOCAIS[i % len(LOCAIS)],
+            capacidade=CAPACIDADES[i % len(CAPACIDADES)],
+        ))
+    return repo
+
+
+def _medir(nome: str, fn, repeticoes: int) -> None:
+    fn()  # aquecimento
+    inicio = time.perf_counter()
+    tamanho = 0
+    for _ in range(repeticoes):
+        tamanho = len(fn())
+    ms = (time.perf_counter() - inicio) / repeticoes * 1000
+    print(f"  {nome:<38} {ms:>10.2f} ms  {tamanho / 1024:>10.1f} KiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    for n in args.tamanhos:
+        repo = _popular(n)
+        meio = f"dev-{n // 2:07d}"
+        print(f"{n} devices")
+        _medir("antigo: lista + jsonable_encoder", lambda: json.dumps(
+            jsonable_encoder({"devices": repo.listar()})).encode(), args.repeticoes)
+        _medir("pagina(100) + orjson", lambda: dumps(
+            {"devices": repo.pagina(apos=meio, limite=100)}), args.repeticoes)
+        _medir("pagina(100, tipo, local) + orjson", lambda: dumps(
+            {"devices": repo.pagina(apos=meio, limite=100, tipo="totem", local="casa")}), args.repeticoes)
+        _medir("ndjson completo", lambda: b"".join(
+            _linhas(percorrer_paginas(repo.pagina))), args.repeticoes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# bench/bench_diario.py
+"""
+Diário local da telemetria (app/diario.py):
+- escrita: eventos/s com fsync por evento x group commit x sem fsync,
+  com várias threads escrevendo ao mesmo tempo (como o threadpool da API);
+- leitura: "últimos N" pelo mmap de trás para frente;
+- reenvio: duas pastas de worker (w-000, w-001) reenviadas para a mesma
+  coleção não podem colidir no _id (confere e falha se perder evento).
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_diario --eventos 20000 --threads 16
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from app.diario import Diario
+from bench.fakes import ColecaoFalsa
+
+
+def _evento(i: int) -> dict:
+    return {
+        "usuario_id": f"u{i % 500}",
+        "evento": "mentor_resposta",
+        "payload": {"ia_indicada": "chatgpt", "categoria": "texto", "dificuldade": "media"},
+        "categoria": "texto",
+        "ia_indicada": "chatgpt",
+        "sucesso": True,
+        "duracao_seg": 12.5,
+        "contexto": {"device": "smartphone"},
+        "timestamp": datetime.utcnow(),
+    }
+
+
+class _FsyncPorEvento(Diario):
+    # referência: um fsync a cada evento, sem agrupar
+    def anexar(self, doc):
+        super().anexar(doc)
+        os.fsync(self._fd)
+
+
+def _escrever(diario: Diario, eventos: int, threads: int) -> float:
+    por_thread = eventos // threads
+
+    def trabalhador(t: int) -> None:
+        for i in range(por_thread):
+            diario.anexar(_evento(t * por_thread + i))
+
+    inicio = time.perf_counter()
+    ts = [threading.Thread(target=trabalhador, args=(t,)) for t in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return por_thread * threads / (time.perf_counter() - inicio)
+
+
+def _conferir_reenvio(pasta: str, por_worker: int = 100) -> None:
+    col = ColecaoFalsa("telemetria")
+    for nome in ("w-000", "w-001"):
+        diario = Diario(os.path.join(pasta, "reenvio", nome), fsync="nunca")
+        for i in range(por_worker):
+            diario.anexar(_evento(i))
+        # reenviar duas vezes (queda no meio) também não pode duplicar
+        diario.replicar(lambda docs: col.insert_many(docs, ordered=False))
+        diario._gravar_posicao(1, 0)
+        diario.replicar(lambda docs: col.insert_many(docs, ordered=False))
+        diario.fechar()
+    total = sum(1 for _ in col.find({}))
+    assert total == 2 * por_worker, f"reenvio perdeu eventos: {total} de {2 * por_worker}"
+    print(f"reenvio  2 pastas          {total:>10} eventos no Mongo (ok)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eventos", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    modos = [("fsync por evento", _FsyncPorEvento, "nunca"), ("group commit", Diario, "grupo"), ("sem fsync", Diario, "nunca")]
+    pasta = tempfile.mkdtemp(prefix="bench_diario_")
+    try:
+        for nome, classe, fsync in modos:
+            alvo = os.path.join(pasta, nome.replace(" ", "_"))
+            diario = classe(alvo, fsync=fsync)
+            eps = _escrever(diario, args.eventos, args.threads)
+            print(f"escrita  {nome:<18} {eps:>10,.0f} eventos/s")
+            diario.fechar()
+
+        diario = Diario(os.path.join(pasta, "sem_fsync"))
+        for n in (100, 1000, 5000):
+            inicio = time.perf_counter()
+            docs = diario.ultimos(n)
+            ms = (time.perf_counter() - inicio) * 1000
+            print(f"leitura  últimos {n:<6} {ms:>10.2f} ms  ({len(docs)} eventos)")
+        diario.fechar()
+
+        _conferir_reenvio(pasta)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
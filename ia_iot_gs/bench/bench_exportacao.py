@@ -0,0 +1,89 @@
+# bench/bench_exportacao.py
+"""
+Telemetria em JSON (como GET /events/telemetria devolve) x stream Arrow
+(/export/telemetria.arrow) x Parquet particionado por dia: tempo e bytes.
+
+Roda com o Mongo em processo (bench/fakes.py) populado com N eventos.
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_exportacao --eventos 100000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench import fakes
+
+
+def _popular(n: int) -> None:
+    from app.db import get_collection
+
+    col = get_collection("telemetria")
+    rnd = random.Random(1)
+    inicio = datetime.utcnow() - timedelta(days=7)
+    docs = []
+    for i in range(n):
+        docs.append({
+            "usuario_id": f"u{rnd.randrange(2000)}",
+            "evento": "mentor_resposta",
+            "payload": {
+                "ia_indicada": rnd.choice(["chatgpt", "claude", "gemini", "capcut"]),
+                "quando_usar": "Para gerar um primeiro rascunho do texto.",
+                "passos_com_ia": ["Gerar o rascunho", "Pedir ajustes de tom"],
+                "dificuldade": "media",
+                "tempo_estimado_min": 30,
+            },
+            "categoria": rnd.choice(["texto", "design", "edicao_video"]),
+            "ia_indicada": None,
+            "sucesso": True,
+            "duracao_seg": rnd.random() * 300,
+            "contexto": {"device": "smartphone"},
+            "timestamp": inicio + timedelta(seconds=i * 604800 / n),
+        })
+    col.insert_many(docs)
+
+
+def _tamanho_pasta(pasta: str) -> int:
+    return sum(os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(pasta) for f in fs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eventos", type=int, default=100000)
+    args = parser.parse_args()
+
+    fakes.instalar(latencia_ms=0, jitter_ms=0)
+    _popular(args.eventos)
+
+    from app.exportacao import exportar_parquet, stream_arrow
+    from app.respostas import dumps
+    from app.telemetry import list_events
+
+    inicio = time.perf_counter()
+    corpo = dumps({"eventos": list_events(limit=args.eventos)})
+    print(f"JSON      {time.perf_counter() - inicio:>7.2f} s  {len(corpo) / 1e6:>8.1f} MB")
+
+    inicio = time.perf_counter()
+    total = sum(len(parte) for parte in stream_arrow("telemetria"))
+    print(f"Arrow IPC {time.perf_counter() - inicio:>7.2f} s  {total / 1e6:>8.1f} MB")
+
+    destino = tempfile.mkdtemp(prefix="bench_export_")
+    try:
+        inicio = time.perf_counter()
+        resumo = exportar_parquet("telemetria", destino)
+        print(f"Parquet   {time.perf_counter() - inicio:>7.2f} s  {_tamanho_pasta(destino) / 1e6:>8.1f} MB"
+              f"  ({len(resumo['arquivos'])} partições por dia)")
+
+        inicio = time.perf_counter()
+        resumo = exportar_parquet("telemetria", destino, incremental=True)
+        print(f"Parquet incremental sem novos eventos: {time.perf_counter() - inicio:.2f} s ({resumo['eventos']} eventos)")
+    finally:
+        shutil.rmtree(destino, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# bench/bench_idempotencia.py
+"""
+Descarte de retries por evento_id (app/idempotencia.py): custo por
+evento e memória do LRU.
+
+- filtro sozinho: µs por evento novo e por retry, e a memória do LRU cheio;
+- save_event com o Mongo em processo (bench/fakes.py): sem id, com id e
+  com uma fração de retries, conferindo quantos documentos ficaram.
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_idempotencia --eventos 1000000 --retries 0.1
+"""
+import argparse
+import os
+import random
+import time
+import tracemalloc
+import uuid
+
+os.environ.setdefault("TELEMETRIA_LOG_DIR", "")
+
+from bench import fakes  # noqa: E402
+
+
+def _ids(n: int):
+    return [uuid.uuid4().hex for _ in range(n)]
+
+
+def bench_filtro(eventos: int, lru: int) -> None:
+    from app.idempotencia import FiltroDuplicados
+
+    filtro = FiltroDuplicados(lru=lru)
+    ids = _ids(eventos)
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    for chave in ids:
+        filtro.duplicado(chave)
+    us_novo = (time.perf_counter() - inicio) / eventos * 1e6
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    recentes = ids[-min(lru, eventos):]
+    inicio = time.perf_counter()
+    descartados = sum(filtro.duplicado(chave) for chave in recentes)
+    us_retry = (time.perf_counter() - inicio) / len(recentes) * 1e6
+    print(f"LRU {lru:,} ids: {memoria / 1e6:.1f} MB (sem contar os ids, que já existiam)")
+    print(f"evento novo {us_novo:.2f} µs, retry {us_retry:.2f} µs ({descartados:,}/{len(recentes):,} descartados)")
+
+
+def bench_save_event(eventos: int, retries: float) -> None:
+    from app import idempotencia
+    from app.db import get_collection
+    from app.telemetry import save_event
+
+    rnd = random.Random(7)
+    col = get_collection("telemetria")
+
+    def rodar(com_id: bool, fracao_retry: float) -> float:
+        col._docs.clear()
+        for valores in col._unicos.values():
+            valores.clear()
+        idempotencia.TELEMETRIA = idempotencia.FiltroDuplicados()
+        enviados = []
+        inicio = time.perf_counter()
+        for i in range(eventos):
+            if enviados and rnd.random() < fracao_retry:
+                evento_id = rnd.choice(enviados[-1000:])
+            else:
+                evento_id = uuid.uuid4().hex if com_id else None
+                enviados.append(evento_id)
+            save_event(f"u{i % 500}", "mentor_resposta", {"ia_indicada": "chatgpt"}, evento_id=evento_id)
+        return (time.perf_counter() - inicio) / eventos * 1e6
+
+    base = rodar(False, 0)
+    com_id = rodar(True, 0)
+    com_retry = rodar(True, retries)
+    print(f"save_event sem id {base:.1f} µs/evento, com id {com_id:.1f} µs/evento "
+          f"(+{com_id - base:.1f} µs)")
+    print(f"save_event com {retries:.0%} de retries: {com_retry:.1f} µs/evento, "
+          f"{len(col._docs):,} documentos gravados de {eventos:,} requisições")
+
+    # retry que cai em outro worker: o filtro dele nunca viu o id, o índice único pega
+    evento_id = uuid.uuid4().hex
+    save_event("u1", "mentor_resposta", evento_id=evento_id)
+    idempotencia.TELEMETRIA = idempotencia.FiltroDuplicados()
+    print(f"retry em outro worker: {save_event('u1', 'mentor_resposta', evento_id=evento_id)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eventos", type=int, default=1_000_000)
+    parser.add_argument("--lru", type=int, default=200_000)
+    parser.add_argument("--eventos-api", type=int, default=20_000)
+    parser.add_argument("--retries", type=float, default=0.1, help="fração das requisições que são retries")
+    args = parser.parse_args()
+
+    bench_filtro(args.eventos, args.lru)
+    fakes.instalar(latencia_ms=0, jitter_ms=0)
+    bench_save_event(args.eventos_api, args.retries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# bench/bench_recomendacao.py
+"""
+Custo do motor de recomendação com um catálogo grande: perfil, evento
+incremental e top-k por requisição.
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_recomendacao --usuarios 10000 --catalogo 5000
+"""
+import argparse
+import random
+import time
+
+from app.models import UserProfile
+from app.recomendacao import MotorRecomendacao
+
+CATEGORIAS = ["texto", "analise_dados", "mentor", "imagem", "design", "edicao_video"]
+
+
+def _catalogo(n: int, rnd: random.Random) -> dict:
+    return {
+        f"ia{i}": {
+            "id": f"ia{i}",
+            "nome": f"IA {i}",
+            "especializacoes": rnd.sample(CATEGORIAS, 2),
+            "velocidade": rnd.randint(1, 10),
+            "eco_score": rnd.randint(40, 99),
+            "consumo_wh": rnd.uniform(0.5, 6.0),
+        }
+        for i in range(n)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--usuarios", type=int, default=10_000)
+    parser.add_argument("--eventos", type=int, default=200_000)
+    parser.add_argument("--catalogo", type=int, default=5_000)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    motor = MotorRecomendacao(_catalogo(args.catalogo, rnd))
+    ias = list(motor.catalogo.ids)
+
+    inicio = time.perf_counter()
+    for u in range(args.usuarios):
+        motor.atualizar_perfil(UserProfile(id=f"u{u}", preferencias=rnd.sample(CATEGORIAS + ["eco"], 2)))
+    print(f"perfis:        {(time.perf_counter() - inicio) / args.usuarios * 1e6:8.1f} µs/usuário")
+
+    inicio = time.perf_counter()
+    for _ in range(args.eventos):
+        motor.registrar_evento(f"u{rnd.randrange(args.usuarios)}", rnd.choice(CATEGORIAS), rnd.choice(ias))
+    print(f"eventos:       {(time.perf_counter() - inicio) / args.eventos * 1e6:8.1f} µs/evento")
+
+    inicio = time.perf_counter()
+    for u in range(args.usuarios):
+        motor.top_k(f"u{u}", 5)
+    print(f"top-5:         {(time.perf_counter() - inicio) / args.usuarios * 1e6:8.1f} µs/consulta")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# bench/bench_repositorios.py
+"""
+Benchmark dos repositórios de usuários/devices com N processos (simulando
+N workers do uvicorn). Cada processo faz upserts e leituras (get_user,
+recomendar_ias_para_usuario, list_devices) durante alguns segundos.
+
+Com STORE_BACKEND=mongo todos os processos enxergam os mesmos dados;
+o script confere isso lendo, no final, usuários gravados por outros processos.
+
+Uso (dentro de ia_iot_gs):
+    STORE_BACKEND=mongo python -m bench.bench_repositorios --workers 1 2 4 8
+"""
+import argparse
+import multiprocessing as mp
+import random
+import time
+
+
+def _worker(wid: int, segundos: float, usuarios: int, fila) -> None:
+    from app.models import Device, UserProfile
+    from app.users import upsert_user, get_user, recomendar_ias_para_usuario
+    from app.iot import upsert_device, list_devices
+
+    rnd = random.Random(wid)
+    ops = 0
+    fim = time.perf_counter() + segundos
+    while time.perf_counter() < fim:
+        uid = f"u{rnd.randrange(usuarios)}"
+        r = rnd.random()
+        if r < 0.1:
+            upsert_user(UserProfile(id=uid, preferencias=["eco"] if rnd.random() < 0.5 else []))
+        elif r < 0.15:
+            upsert_device(Device(id=f"d{wid}-{rnd.randrange(100)}", tipo="totem", local="lab_fiap"))
+        elif r < 0.2:
+            list_devices()
+        elif r < 0.6:
+            get_user(uid)
+        else:
+            recomendar_ias_para_usuario(uid)
+        ops += 1
+
+    # marca própria para os outros processos conferirem
+    upsert_user(UserProfile(id=f"marca-{wid}", nome=str(wid)))
+    fila.put(ops)
+
+
+def _conferir(workers: int) -> int:
+    from app.users import get_user
+
+    return sum(1 for wid in range(workers) if get_user(f"marca-{wid}") is not None)
+
+
+def rodar(workers: int, segundos: float, usuarios: int) -> float:
+    fila = mp.Queue()
+    procs = [mp.Process(target=_worker, args=(w, segundos, usuarios, fila)) for w in range(workers)]
+    inicio = time.perf_counter()
+    for p in procs:
+        p.start()
+    total = sum(fila.get() for _ in procs)
+    for p in procs:
+        p.join()
+    duracao = time.perf_counter() - inicio
+    vistos = _conferir(workers)
+    print(f"workers={workers:<3} ops={total:<9} ops/s={total / duracao:>10.0f} marcas_visiveis={vistos}/{workers}")
+    return total / duracao
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--segundos", type=float, default=5.0)
+    parser.add_argument("--usuarios", type=int, default=1000)
+    args = parser.parse_args()
+
+    from app.repositorios import STORE_BACKEND
+
+    print("STORE_BACKEND =", STORE_BACKEND)
+    base = None
+    for n in args.workers:
+        vazao = rodar(n, args.segundos, args.usuarios)
+        base = base or vazao
+        print(f"    escala: {vazao / base:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# bench/bench_serializacao.py
+"""
+Microbenchmark de serialização com respostas de tamanho realista:
+caminho padrão do FastAPI (jsonable_encoder + json.dumps) vs RespostaJSON (orjson).
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_serializacao
+"""
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from app.models import Device, UserProfile
+from app.recomendacao import recomendar
+from app.respostas import dumps
+from app.store import IAS
+
+rnd = random.Random(7)
+
+
+def _eventos(n: int) -> dict:
+    inicio = datetime(2025, 1, 1)
+    ias = list(IAS)
+    eventos = []
+    for i in range(n):
+        eventos.append({
+            "usuario_id": f"u{rnd.randrange(500)}",
+            "evento": rnd.choice(["mentor_resposta", "visao_ambiente", "abrir_tela"]),
+            "payload": {
+                "ia_indicada": rnd.choice(ias),
+                "passos_humano": ["Ler o enunciado", "Separar as fontes", "Revisar"],
+                "passos_com_ia": ["Gerar rascunho", "Pedir revisão de tom"],
+                "dificuldade": "media",
+                "tempo_estimado_min": rnd.randint(5, 120),
+            },
+            "categoria": rnd.choice(["texto", "edicao_video", "design", None]),
+            "ia_indicada": rnd.choice(ias + [None]),
+            "sucesso": rnd.random() < 0.9,
+            "duracao_seg": rnd.uniform(1, 300),
+            "contexto": {"device": "smartphone", "plataforma": "android", "versao_app": "1.4.2"},
+            "timestamp": inicio + timedelta(seconds=i),
+        })
+    return {"eventos": eventos}
+
+
+def _devices(n: int) -> dict:
+    return {
+        "devices": [Device(id=f"dev-{i:07d}", tipo="totem", local="lab_fiap", capacidade="alta") for i in range(n)],
+        "proximo": f"dev-{n - 1:07d}",
+    }
+
+
+def _padrao(conteudo) -> bytes:
+    return json.dumps(jsonable_encoder(conteudo), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+CASOS = [
+    ("GET /events/telemetria (1000)", lambda: _eventos(1000)),
+    ("GET /events/telemetria (5000)", lambda: _eventos(5000)),
+    ("GET /iot/devices (100)", lambda: _devices(100)),
+    ("GET /iot/devices (1000)", lambda: _devices(1000)),
+    ("GET /usuarios/{id}", lambda: UserProfile(id="u1", objetivos=["estudo"], preferencias=["texto", "eco"])),
+    ("GET /ias/recomendadas", lambda: {"usuario_id": "u1", "recomendacoes": recomendar("u1")}),
+]
+
+
+def _medir(fn, conteudo, repeticoes: int) -> float:
+    fn(conteudo)
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        fn(conteudo)
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+
+def main() -> None:
+    print(f"{'resposta':<34} {'padrão (ms)':>12} {'orjson (ms)':>12} {'ganho':>7} {'KiB':>8}")
+    for nome, gerar in CASOS:
+        conteudo = gerar()
+        repeticoes = 20 if "5000" in nome or "1000" in nome else 2000
+        t_padrao = _medir(_padrao, conteudo, repeticoes)
+        t_orjson = _medir(dumps, conteudo, repeticoes)
+        kib = len(dumps(conteudo)) / 1024
+        print(f"{nome:<34} {t_padrao:>12.3f} {t_orjson:>12.3f} {t_padrao / t_orjson:>6.1f}x {kib:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
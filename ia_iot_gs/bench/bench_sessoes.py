@@ -0,0 +1,74 @@
+# bench/bench_sessoes.py
+"""
+Contexto do usuário com N eventos IoT na memória: a varredura de trás
+para frente em IOT_EVENTS (como current_context_for_user fazia) x a
+leitura do estado do Sessionizador (app/sessoes.py).
+
+Mede também o custo por evento de SESSOES.registrar e quantas sessões
+ficam abertas (a memória do sessionizador) depois do stream.
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_sessoes --eventos 100000 1000000 --usuarios 5000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.sessoes import Sessionizador
+
+TIPOS = ["inicio_sessao", "foco", "pausa", "foco", "fim_sessao"]
+
+
+def _stream(n: int, usuarios: int, devices: int):
+    rnd = random.Random(42)
+    t = datetime(2026, 1, 1)
+    for _ in range(n):
+        t += timedelta(seconds=rnd.expovariate(1 / 2))
+        yield {
+            "usuario_id": f"u{rnd.randrange(usuarios)}",
+            "device_id": f"d{rnd.randrange(devices)}",
+            "evento": rnd.choice(TIPOS),
+            "metadata": {},
+            "timestamp": t,
+        }
+
+
+def _varredura(eventos, usuario_id: str):
+    return next((e for e in reversed(eventos) if e.get("usuario_id") == usuario_id), None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eventos", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--usuarios", type=int, default=5000)
+    parser.add_argument("--devices", type=int, default=3)
+    parser.add_argument("--consultas", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'eventos':>9} {'registrar (µs/ev)':>18} {'abertas':>8} {'varredura (ms)':>15} {'sessionizador (µs)':>19}")
+    for n in args.eventos:
+        eventos = list(_stream(n, args.usuarios, args.devices))
+        sessoes = Sessionizador()
+        inicio = time.perf_counter()
+        for e in eventos:
+            sessoes.registrar(e)
+        registrar = (time.perf_counter() - inicio) / n
+
+        agora = eventos[-1]["timestamp"]
+        alvos = [f"u{i}" for i in random.Random(7).sample(range(args.usuarios), args.consultas)]
+        inicio = time.perf_counter()
+        for u in alvos:
+            _varredura(eventos, u)
+        varredura = (time.perf_counter() - inicio) / len(alvos)
+        inicio = time.perf_counter()
+        for u in alvos:
+            sessoes.contexto(u, agora=agora)
+        incremental = (time.perf_counter() - inicio) / len(alvos)
+
+        print(f"{n:>9,} {registrar * 1e6:>18.2f} {sessoes.abertas():>8,} "
+              f"{varredura * 1e3:>15.3f} {incremental * 1e6:>19.2f}")
+
+
+if __name__ == "__main__":
+    main()
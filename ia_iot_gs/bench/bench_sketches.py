@@ -0,0 +1,143 @@
+# bench/bench_sketches.py
+"""
+Analytics exatos (Counter + set, como o caminho atual faria sobre todos os
+eventos) x sketches (app/sketches.py: Space-Saving + HyperLogLog).
+
+Gera um fluxo sintético com distribuições assimétricas (Zipf) de IAs,
+categorias e usuários, espalhado em 30 dias, e mede:
+- custo por evento de cada caminho;
+- memória aproximada das estruturas;
+- erro: top-k das IAs/categorias e usuários distintos (por dia e por categoria).
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_sketches --eventos 10000000
+"""
+import argparse
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Dict, List, Set
+
+from app.sketches import AnalyticsAproximados
+
+LOTE = 100_000
+
+
+def _zipf(n: int, s: float) -> List[float]:
+    return list(accumulate(1 / (i ** s) for i in range(1, n + 1)))
+
+
+class Exato:
+    def __init__(self):
+        self.ias: Counter = Counter()
+        self.categorias: Counter = Counter()
+        self.usuarios_dia: Dict = defaultdict(set)
+        self.usuarios_categoria: Dict[str, Set[str]] = defaultdict(set)
+
+    def registrar(self, e: dict) -> None:
+        if e["evento"] == "mentor_resposta" and e["ia_indicada"]:
+            self.ias[e["ia_indicada"]] += 1
+        self.usuarios_dia[e["timestamp"].date()].add(e["usuario_id"])
+        if e["categoria"]:
+            self.categorias[e["categoria"]] += 1
+            self.usuarios_categoria[e["categoria"]].add(e["usuario_id"])
+
+    def memoria(self) -> int:
+        total = sys.getsizeof(self.ias) + sys.getsizeof(self.categorias)
+        for grupo in (self.usuarios_dia, self.usuarios_categoria):
+            for conjunto in grupo.values():
+                total += sys.getsizeof(conjunto)
+        # strings dos usuários (cada uma contada uma vez)
+        vistos = set().union(*self.usuarios_dia.values())
+        return total + sum(sys.getsizeof(u) for u in vistos)
+
+
+def _memoria_sketch(a: AnalyticsAproximados) -> int:
+    hlls = list(a.usuarios_dia.values()) + list(a.usuarios_categoria.values())
+    contadores = sum(sys.getsizeof(c) + sys.getsizeof(i) for ss in (a.ias, a.categorias)
+                     for i, c in ss.contadores.items())
+    return sum(sys.getsizeof(h.registradores) for h in hlls) + contadores
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eventos", type=int, default=10_000_000)
+    parser.add_argument("--usuarios", type=int, default=2_000_000)
+    parser.add_argument("--ias", type=int, default=300, help="ids distintos de IA (inclui variações vindas do LLM)")
+    parser.add_argument("--categorias", type=int, default=40)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    ias = [f"ia_{i}" for i in range(args.ias)]
+    categorias = [f"cat_{i}" for i in range(args.categorias)]
+    usuarios = [f"u{i}" for i in range(args.usuarios)]
+    pesos_ia, pesos_cat, pesos_u = _zipf(len(ias), 1.1), _zipf(len(categorias), 1.0), _zipf(len(usuarios), 0.7)
+    inicio_periodo = datetime(2026, 1, 1)
+    passo = timedelta(days=30) / args.eventos
+
+    exato, sketch = Exato(), AnalyticsAproximados()
+    t_exato = t_sketch = 0.0
+    feitos = 0
+    while feitos < args.eventos:
+        n = min(LOTE, args.eventos - feitos)
+        lote_ias = rnd.choices(ias, cum_weights=pesos_ia, k=n)
+        lote_cat = rnd.choices(categorias, cum_weights=pesos_cat, k=n)
+        lote_u = rnd.choices(usuarios, cum_weights=pesos_u, k=n)
+        eventos = [
+            {"usuario_id": u, "evento": "mentor_resposta", "ia_indicada": ia, "categoria": cat,
+             "payload": {}, "timestamp": inicio_periodo + passo * (feitos + i)}
+            for i, (u, ia, cat) in enumerate(zip(lote_u, lote_ias, lote_cat))
+        ]
+
+        t = time.perf_counter()
+        for e in eventos:
+            exato.registrar(e)
+        t_exato += time.perf_counter() - t
+
+        t = time.perf_counter()
+        for e in eventos:
+            sketch.registrar(e)
+        t_sketch += time.perf_counter() - t
+        feitos += n
+
+    print(f"{args.eventos:,} eventos, {args.usuarios:,} usuários possíveis, {args.ias} IAs, {args.categorias} categorias")
+    print(f"{'':<10} {'µs/evento':>10} {'memória':>12}")
+    print(f"{'exato':<10} {t_exato / feitos * 1e6:>10.2f} {exato.memoria() / 1e6:>10.1f} MB")
+    print(f"{'sketches':<10} {t_sketch / feitos * 1e6:>10.2f} {_memoria_sketch(sketch) / 1e6:>10.1f} MB")
+
+    for nome, contagem, ss in (("IAs", exato.ias, sketch.ias), ("categorias", exato.categorias, sketch.categorias)):
+        top_exato = [i for i, _ in contagem.most_common(10)]
+        top_aprox = [l["item"] for l in ss.top(10)]
+        erro_max = max(abs(l["contagem"] - contagem[l["item"]]) for l in ss.top(10))
+        dentro = all(l["contagem_min"] <= contagem[l["item"]] <= l["contagem"] for l in ss.top(10))
+        print(f"top-10 {nome:<11} recall {len(set(top_exato) & set(top_aprox)) / 10:.0%}, "
+              f"maior erro {erro_max} (limite garantido {ss.total // ss.k}), limites respeitados: {dentro}")
+
+    # consulta "usuários distintos nos últimos 7 dias": união de sets x união de HLLs
+    dias = sorted(exato.usuarios_dia)[-7:]
+    t = time.perf_counter()
+    real_7d = len(set().union(*(exato.usuarios_dia[d] for d in dias)))
+    ms_exato = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    hll_7d = sketch.usuarios_dia[dias[0]]
+    for d in dias[1:]:
+        hll_7d = hll_7d.mesclar(sketch.usuarios_dia[d])
+    aprox_7d = hll_7d.estimar()
+    ms_sketch = (time.perf_counter() - t) * 1000
+    print(f"distintos em 7 dias     exato {real_7d:,} em {ms_exato:.1f} ms; "
+          f"HLL {aprox_7d:,.0f} em {ms_sketch:.1f} ms (erro {abs(aprox_7d - real_7d) / real_7d:.2%})")
+
+    erros_dia = [abs(sketch.usuarios_dia[d].estimar() - len(us)) / len(us) for d, us in exato.usuarios_dia.items()]
+    erros_cat = [abs(sketch.usuarios_categoria[c].estimar() - len(us)) / len(us)
+                 for c, us in exato.usuarios_categoria.items() if c in sketch.usuarios_categoria]
+    hll = next(iter(sketch.usuarios_dia.values()))
+    print(f"distintos por dia       erro médio {sum(erros_dia) / len(erros_dia):.2%}, máximo {max(erros_dia):.2%} "
+          f"(erro padrão teórico {hll.erro_relativo:.2%})")
+    print(f"distintos por categoria erro médio {sum(erros_cat) / len(erros_cat):.2%}, máximo {max(erros_cat):.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# bench/bench_startup.py
+"""
+Tempo de importação e de cold start da API.
+
+1. `python -X importtime -c "import app.main"`: total e os módulos mais caros.
+2. Cold start: sobe o uvicorn num processo novo e mede até o primeiro
+   GET /health responder 200.
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_startup --rodadas 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+AQUI = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def importtime(top: int = 10) -> float:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=AQUI, capture_output=True, text=True, check=True,
+    )
+    linhas = []
+    for linha in proc.stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        # "import time: <self us> | <cumulative us> | <modulo>"
+        proprio, cumulativo, modulo = linha[len("import time:"):].split("|")
+        linhas.append((int(cumulativo), int(proprio), modulo.strip()))
+
+    total = next(c for c, _, m in linhas if m == "app.main")
+    print(f"import app.main: {total / 1000:.1f} ms")
+    for cumulativo, proprio, modulo in sorted(linhas, reverse=True)[1:top + 1]:
+        print(f"  {cumulativo / 1000:8.1f} ms  {modulo}")
+    return total / 1000
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cold_start(timeout: float = 30.0) -> float:
+    porta = _porta_livre()
+    inicio = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(porta), "--log-level", "warning"],
+        cwd=AQUI, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - inicio < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{porta}/health", timeout=1) as r:
+                    if r.status == 200:
+                        return (time.perf_counter() - inicio) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError("API não respondeu /health")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rodadas", type=int, default=5)
+    args = parser.parse_args()
+
+    importtime()
+    tempos = [cold_start() for _ in range(args.rodadas)]
+    print(f"cold start até o 1º /health: mediana {statistics.median(tempos):.0f} ms "
+          f"(min {min(tempos):.0f}, max {max(tempos):.0f}, {args.rodadas} rodadas)")
+
+
+if __name__ == "__main__":
+    main()
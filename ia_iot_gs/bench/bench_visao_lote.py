@@ -0,0 +1,68 @@
+# bench/bench_visao_lote.py
+"""
+N fotos do mesmo ambiente: N chamadas de analisar_imagem (como o app faz
+hoje, uma requisição por foto) x analisar_imagens (lote, app/vision.py).
+
+Mede, para cada N, a latência total e os tokens de entrada/saída:
+- N chamadas em sequência (app que envia uma foto depois da outra);
+- N chamadas em paralelo (app que envia todas de uma vez);
+- lote (divide em grupos de VISAO_LOTE_MAX_IMAGENS, grupos em paralelo).
+
+Roda contra o Gemini falso (bench/fakes.py): latência fixa por chamada
+mais um tempo por token de saída; tokens contados como o Gemini conta
+(~4 caracteres por token de texto, 258 por imagem).
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.bench_visao_lote --fotos 1 2 4 8 16 --latencia-ms 600 --ms-por-token 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("TELEMETRIA_LOG_DIR", "")
+
+from bench import fakes  # noqa: E402
+
+
+def _medir(gemini, funcao):
+    entrada, saida, chamadas = gemini.tokens_entrada, gemini.tokens_saida, gemini.chamadas
+    inicio = time.perf_counter()
+    funcao()
+    return (time.perf_counter() - inicio,
+            gemini.tokens_entrada - entrada, gemini.tokens_saida - saida, gemini.chamadas - chamadas)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fotos", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--latencia-ms", type=float, default=600)
+    parser.add_argument("--ms-por-token", type=float, default=4)
+    args = parser.parse_args()
+
+    gemini = fakes.instalar(latencia_ms=args.latencia_ms, jitter_ms=0, mongo=False, ms_por_token=args.ms_por_token)
+
+    from app.vision import VISAO_LOTE_MAX_IMAGENS, analisar_imagem, analisar_imagens
+
+    print(f"latência base {args.latencia_ms:.0f} ms + {args.ms_por_token} ms/token de saída, "
+          f"até {VISAO_LOTE_MAX_IMAGENS} fotos por chamada no lote")
+    print(f"{'fotos':>5} {'modo':<12} {'chamadas':>8} {'tempo (s)':>10} {'tokens entrada':>15} {'tokens saída':>13}")
+    for n in args.fotos:
+        fotos = [(os.urandom(200_000), "image/jpeg") for _ in range(n)]
+
+        def sequencial():
+            for foto in fotos:
+                analisar_imagem(*foto)
+
+        def paralelo():
+            with ThreadPoolExecutor(max_workers=n) as pool:
+                list(pool.map(lambda foto: analisar_imagem(*foto), fotos))
+
+        for modo, funcao in (("sequencial", sequencial), ("paralelo", paralelo),
+                             ("lote", lambda: analisar_imagens(fotos))):
+            tempo, entrada, saida, chamadas = _medir(gemini, funcao)
+            print(f"{n:>5} {modo:<12} {chamadas:>8} {tempo:>10.2f} {entrada:>15,} {saida:>13,}")
+
+
+if __name__ == "__main__":
+    main()
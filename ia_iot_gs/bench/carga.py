@@ -0,0 +1,285 @@
+# bench/carga.py
+"""
+Carga ponta a ponta contra a API (de preferência a de bench/servidor_fake.py).
+
+Cenários (roteiros do app mobile):
+- insights:   abrir a tela de Insights (resumo + consumo + ranking + categorias)
+- telemetria: rajada de POST /events/telemetria
+- visao:      rajada de uploads em /visao/ambiente-trabalho
+- mentor:     rajada de explicar-tarefa / plano-estudo / refinar-resultado
+
+Relatório: p50/p95/p99 (ms), req/s e erros por endpoint.
+Modo regressão: --salvar-baseline grava o resultado; --comparar lê um
+baseline e sai com código 1 se p95 piorar ou req/s cair além da tolerância.
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.carga --subir-servidor --cenarios insights telemetria --duracao 20
+    python -m bench.carga --url http://127.0.0.1:8000 --comparar bench/baseline.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+AQUI = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# PNG 1x1 (o Gemini falso não olha a imagem)
+PNG_1X1 = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+Requisicao = Tuple[str, str, Optional[bytes], Dict[str, str], str]  # metodo, caminho, corpo, headers, rotulo
+
+
+class Cliente:
+    """
+    Uma conexão HTTP keep-alive por thread (http.client, sem dependências).
+    """
+
+    def __init__(self, url: str, timeout: float = 60.0):
+        alvo = urllib.parse.urlparse(url)
+        self.host, self.porta, self.timeout = alvo.hostname, alvo.port or 80, timeout
+        self._conn: Optional[http.client.HTTPConnection] = None
+
+    def enviar(self, metodo: str, caminho: str, corpo: Optional[bytes], headers: Dict[str, str]) -> int:
+        for tentativa in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.porta, timeout=self.timeout)
+            try:
+                self._conn.request(metodo, caminho, body=corpo, headers=headers)
+                resp = self._conn.getresponse()
+                resp.read()
+                return resp.status
+            except (http.client.HTTPException, OSError):
+                self._conn.close()
+                self._conn = None
+                if tentativa:
+                    raise
+        return 0
+
+
+def _json(metodo: str, caminho: str, dados: dict, rotulo: str, usuario: str = "") -> Requisicao:
+    headers = {"Content-Type": "application/json"}
+    if usuario:
+        headers["X-Usuario-Id"] = usuario
+    return metodo, caminho, json.dumps(dados).encode(), headers, rotulo
+
+
+def _upload(caminho: str, rotulo: str, usuario: str = "") -> Requisicao:
+    fronteira = uuid.uuid4().hex
+    corpo = (
+        f"--{fronteira}\r\nContent-Disposition: form-data; name=\"imagem\"; filename=\"mesa.png\"\r\n"
+        f"Content-Type: image/png\r\n\r\n"
+    ).encode() + PNG_1X1 + f"\r\n--{fronteira}--\r\n".encode()
+    headers = {"Content-Type": f"multipart/form-data; boundary={fronteira}"}
+    if usuario:
+        headers["X-Usuario-Id"] = usuario
+    return "POST", caminho, corpo, headers, rotulo
+
+
+def roteiro_insights(rnd: random.Random, usuarios: int) -> List[Requisicao]:
+    u = f"u{rnd.randrange(usuarios)}"
+    return [
+        ("GET", f"/mentor/resumo-uso-ia?usuario_id={u}", None, {}, "GET /mentor/resumo-uso-ia"),
+        ("GET", f"/analytics/eco/consumo-usuario/{u}", None, {}, "GET /analytics/eco/consumo-usuario/{id}"),
+        ("GET", "/analytics/ias-mais-usadas", None, {}, "GET /analytics/ias-mais-usadas"),
+        ("GET", "/analytics/uso-por-categoria", None, {}, "GET /analytics/uso-por-categoria"),
+    ]
+
+
+def roteiro_telemetria(rnd: random.Random, usuarios: int) -> List[Requisicao]:
+    evt = {
+        "usuario_id": f"u{rnd.randrange(usuarios)}",
+        "evento": rnd.choice(["mentor_resposta", "visao_ambiente", "abrir_tela"]),
+        "categoria": rnd.choice(["texto", "edicao_video", "design", "analise_dados"]),
+        "ia_indicada": rnd.choice(["chatgpt", "claude", "gemini", "capcut", "stable_diffusion"]),
+        "sucesso": True,
+        "duracao_seg": rnd.randint(1, 300),
+        "contexto": {"device": "smartphone"},
+    }
+    return [_json("POST", "/events/telemetria", evt, "POST /events/telemetria")]
+
+
+# visão e mentor mandam X-Usuario-Id: com a admissão ligada, cada usuário
+# simulado tem o próprio bucket em vez de todos dividirem o do IP
+def roteiro_visao(rnd: random.Random, usuarios: int) -> List[Requisicao]:
+    u = f"u{rnd.randrange(usuarios)}"
+    return [_upload("/visao/ambiente-trabalho", "POST /visao/ambiente-trabalho", u)]
+
+
+def roteiro_mentor(rnd: random.Random, usuarios: int) -> List[Requisicao]:
+    u = f"u{rnd.randrange(usuarios)}"
+    escolha = rnd.random()
+    if escolha < 0.6:
+        return [_json("POST", "/mentor/explicar-tarefa",
+                      {"descricao": "Preciso escrever um post para o LinkedIn"}, "POST /mentor/explicar-tarefa", u)]
+    if escolha < 0.8:
+        return [_json("POST", "/mentor/plano-estudo",
+                      {"objetivo": "Aprender análise de dados", "horas_semana": 5}, "POST /mentor/plano-estudo", u)]
+    return [_json("POST", "/mentor/refinar-resultado",
+                  {"tipo": "post_linkedin", "texto_inicial": "Hoje aprendi IA."}, "POST /mentor/refinar-resultado", u)]
+
+
+CENARIOS: Dict[str, Callable[[random.Random, int], List[Requisicao]]] = {
+    "insights": roteiro_insights,
+    "telemetria": roteiro_telemetria,
+    "visao": roteiro_visao,
+    "mentor": roteiro_mentor,
+}
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    k = (len(valores) - 1) * p
+    i = int(k)
+    j = min(i + 1, len(valores) - 1)
+    return valores[i] + (valores[j] - valores[i]) * (k - i)
+
+
+def rodar(url: str, cenarios: List[str], duracao: float, concorrencia: int, usuarios: int) -> Dict[str, dict]:
+    latencias: Dict[str, List[float]] = defaultdict(list)
+    erros: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    fim = time.perf_counter() + duracao
+
+    def trabalhador(wid: int) -> None:
+        rnd = random.Random(wid)
+        cliente = Cliente(url)
+        while time.perf_counter() < fim:
+            roteiro = CENARIOS[cenarios[wid % len(cenarios)]]
+            for metodo, caminho, corpo, headers, rotulo in roteiro(rnd, usuarios):
+                inicio = time.perf_counter()
+                try:
+                    status = cliente.enviar(metodo, caminho, corpo, headers)
+                except Exception:
+                    status = 0
+                ms = (time.perf_counter() - inicio) * 1000
+                with lock:
+                    latencias[rotulo].append(ms)
+                    if not 200 <= status < 300:
+                        erros[rotulo] += 1
+
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabalhador, args=(w,)) for w in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - inicio
+
+    return {
+        rotulo: {
+            "n": len(vals),
+            "rps": len(vals) / total,
+            "p50": _percentil(vals, 0.50),
+            "p95": _percentil(vals, 0.95),
+            "p99": _percentil(vals, 0.99),
+            "erros": erros[rotulo],
+        }
+        for rotulo, vals in sorted(latencias.items())
+    }
+
+
+def imprimir(resultado: Dict[str, dict]) -> None:
+    print(f"{'endpoint':<42} {'n':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'erros':>6}")
+    for rotulo, r in resultado.items():
+        print(f"{rotulo:<42} {r['n']:>7} {r['rps']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f} {r['erros']:>6}")
+
+
+def comparar(resultado: Dict[str, dict], baseline: Dict[str, dict], tolerancia: float) -> List[str]:
+    problemas = []
+    for rotulo, base in baseline.items():
+        atual = resultado.get(rotulo)
+        if atual is None:
+            continue
+        if base["p95"] > 0 and atual["p95"] > base["p95"] * (1 + tolerancia):
+            problemas.append(f"{rotulo}: p95 {base['p95']:.1f} -> {atual['p95']:.1f} ms")
+        if base["rps"] > 0 and atual["rps"] < base["rps"] * (1 - tolerancia):
+            problemas.append(f"{rotulo}: req/s {base['rps']:.1f} -> {atual['rps']:.1f}")
+    return problemas
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _subir_servidor(args) -> Tuple[subprocess.Popen, str]:
+    porta = _porta_livre()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "bench.servidor_fake", "--porta", str(porta),
+         "--latencia-ms", str(args.latencia_ms), "--taxa-erro", str(args.taxa_erro)],
+        cwd=AQUI,
+    )
+    url = f"http://127.0.0.1:{porta}"
+    cliente = Cliente(url, timeout=1)
+    for _ in range(300):
+        try:
+            if cliente.enviar("GET", "/health", None, {}) == 200:
+                return proc, url
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise TimeoutError("servidor falso não subiu")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8010")
+    parser.add_argument("--subir-servidor", action="store_true", help="sobe bench.servidor_fake numa porta livre")
+    parser.add_argument("--latencia-ms", type=float, default=800, help="com --subir-servidor")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="com --subir-servidor")
+    parser.add_argument("--cenarios", nargs="+", choices=sorted(CENARIOS), default=sorted(CENARIOS))
+    parser.add_argument("--duracao", type=float, default=30.0)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--salvar-baseline")
+    parser.add_argument("--comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    args = parser.parse_args()
+
+    proc = None
+    url = args.url
+    if args.subir_servidor:
+        proc, url = _subir_servidor(args)
+    try:
+        resultado = rodar(url, args.cenarios, args.duracao, args.concorrencia, args.usuarios)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    imprimir(resultado)
+
+    if args.salvar_baseline:
+        with open(args.salvar_baseline, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print("baseline salvo em", args.salvar_baseline)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            problemas = comparar(resultado, json.load(f), args.tolerancia)
+        if problemas:
+            print("REGRESSÃO:")
+            for p in problemas:
+                print("  " + p)
+            sys.exit(1)
+        print(f"sem regressão (tolerância {args.tolerancia:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+# bench/fakes.py
+"""
+Dublês locais para rodar a API sem Gemini e sem Mongo:
+
+- GeminiFalso: mesma interface usada em app/mentor.py e app/vision.py
+  (client.models.generate_content / generate_content_stream), com latência,
+  taxa de erro e streaming configuráveis;
+- MongoFalso: Mongo em processo com o subconjunto usado pela API
+  (insert_one/insert_many, find/sort/limit, find_one, replace_one, create_index...).
+
+instalar() liga os dois na app (app.llm.usar_cliente / app.db.usar_cliente).
+"""
+import copy
+import itertools
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+
+# ---------- GEMINI ----------
+
+class _UsoFalso:
+    def __init__(self, entrada: int, saida: int):
+        self.prompt_token_count = entrada
+        self.candidates_token_count = saida
+        self.total_token_count = entrada + saida
+
+
+class RespostaFalsa:
+    def __init__(self, text: str, uso: Optional[_UsoFalso] = None):
+        self.text = text
+        self.usage_metadata = uso
+
+
+RESPOSTAS_JSON = {
+    "mentor": {
+        "ia_indicada": "chatgpt",
+        "quando_usar": "Para gerar um primeiro rascunho do texto.",
+        "quando_evitar": "Quando o conteúdo exigir dados que você não conferiu.",
+        "passos_humano": ["Definir o objetivo", "Revisar o resultado"],
+        "passos_com_ia": ["Gerar o rascunho", "Pedir ajustes de tom"],
+        "dificuldade": "media",
+        "tempo_estimado_min": 30,
+    },
+    "plano": {
+        "objetivo": "Aprender IA aplicada",
+        "duracao_semanas": 4,
+        "semanas": [
+            {"semana": i, "foco": f"Tema {i}", "temas": ["a", "b"], "tarefas": ["x", "y"]}
+            for i in range(1, 5)
+        ],
+    },
+    "refinar": {
+        "texto_refinado": "Texto refinado de exemplo.",
+        "explicacao_melhorias": "Frases mais curtas e tom mais direto.",
+    },
+    "visao": {
+        "classificacao_geral": "bom",
+        "ergonomia": {"postura_provavel": "neutra", "altura_tela": "ok", "altura_cadeira": "ok", "riscos": []},
+        "iluminacao": {"nivel": "boa", "fontes": ["luz natural"], "problemas": []},
+        "organizacao": {"nivel": "organizado", "itens_na_mesa": ["teclado"], "distracoes": []},
+        "recomendacoes": ["Manter a tela na altura dos olhos"],
+    },
+}
+
+TEXTO_RESUMO = (
+    "Você tem usado IA principalmente para textos. A pegada energética está baixa. "
+    "Continue agrupando pedidos parecidos e prefira modelos leves para tarefas simples."
+)
+
+
+def _texto_do_prompt(contents: Any) -> str:
+    if isinstance(contents, str):
+        return contents
+    partes = []
+    for item in contents or []:
+        for parte in (item.get("parts") or []) if isinstance(item, dict) else []:
+            if "text" in parte:
+                partes.append(parte["text"])
+    return "\n".join(partes)
+
+
+def _imagens(contents: Any) -> int:
+    if isinstance(contents, str):
+        return 0
+    return sum(1 for item in contents or [] if isinstance(item, dict)
+               for parte in item.get("parts") or [] if "inline_data" in parte)
+
+
+# tokens como o Gemini conta: ~4 caracteres de texto por token, 258 por imagem
+TOKENS_POR_IMAGEM = 258
+
+
+def _tokens(texto: str, imagens: int = 0) -> int:
+    return -(-len(texto) // 4) + imagens * TOKENS_POR_IMAGEM
+
+
+def _resposta_lote(n: int) -> Dict[str, Any]:
+    return {
+        "imagens": [{"indice": i, **RESPOSTAS_JSON["visao"]} for i in range(1, n + 1)],
+        "combinada": RESPOSTAS_JSON["visao"],
+    }
+
+
+def _tipo(prompt: str, contents: Any) -> str:
+    if not isinstance(contents, str):
+        return "visao_lote" if _imagens(contents) > 1 else "visao"
+    if "mentor digital" in prompt:
+        return "mentor"
+    if "desenvolvimento profissional" in prompt:
+        return "plano"
+    if "assistente de escrita" in prompt:
+        return "refinar"
+    return "resumo"
+
+
+class _ModelosFalsos:
+    def __init__(self, dono: "GeminiFalso"):
+        self._dono = dono
+
+    def generate_content(self, model: str, contents: Any, config: Optional[Dict] = None) -> RespostaFalsa:
+        texto = "".join(self._dono._gerar(contents))
+        return RespostaFalsa(texto, self._dono._contar(contents, texto))
+
+    def generate_content_stream(self, model: str, contents: Any, config: Optional[Dict] = None) -> Iterator[RespostaFalsa]:
+        for pedaco in self._dono._gerar(contents, streaming=True):
+            yield RespostaFalsa(pedaco)
+
+
+class GeminiFalso:
+    """
+    latencia_ms: média da latência; jitter_ms: desvio (normal, truncado em 0);
+    taxa_erro: fração das chamadas que levantam exceção (como o SDK faria);
+    pedacos: em streaming, em quantos pedaços a resposta é entregue;
+    ms_por_token: tempo de geração por token de saída, somado à latência
+    (respostas maiores demoram mais, como no modelo real).
+    """
+
+    def __init__(self, latencia_ms: float = 800, jitter_ms: float = 200, taxa_erro: float = 0.0,
+                 pedacos: int = 8, semente: Optional[int] = None, ms_por_token: float = 0.0):
+        self.latencia_ms = latencia_ms
+        self.ms_por_token = ms_por_token
+        self.tokens_entrada = 0
+        self.tokens_saida = 0
+        self.jitter_ms = jitter_ms
+        self.taxa_erro = taxa_erro
+        self.pedacos = max(1, pedacos)
+        self._rnd = random.Random(semente)
+        self._lock = threading.Lock()
+        self.chamadas = 0
+        self.models = _ModelosFalsos(self)
+
+    def _latencia(self) -> float:
+        with self._lock:
+            self.chamadas += 1
+            ms = self._rnd.gauss(self.latencia_ms, self.jitter_ms) if self.jitter_ms else self.latencia_ms
+            falhar = self._rnd.random() < self.taxa_erro
+        if falhar:
+            raise RuntimeError("GeminiFalso: erro simulado (503 UNAVAILABLE)")
+        return max(0.0, ms) / 1000
+
+    def _contar(self, contents: Any, texto: str) -> _UsoFalso:
+        uso = _UsoFalso(_tokens(_texto_do_prompt(contents), _imagens(contents)), _tokens(texto))
+        with self._lock:
+            self.tokens_entrada += uso.prompt_token_count
+            self.tokens_saida += uso.candidates_token_count
+        return uso
+
+    def _gerar(self, contents: Any, streaming: bool = False) -> Iterator[str]:
+        espera = self._latencia()
+        prompt = _texto_do_prompt(contents)
+        tipo = _tipo(prompt, contents)
+        if tipo == "resumo":
+            texto = TEXTO_RESUMO
+        elif tipo == "visao_lote":
+            texto = json.dumps(_resposta_lote(_imagens(contents)), ensure_ascii=False)
+        else:
+            texto = json.dumps(RESPOSTAS_JSON[tipo], ensure_ascii=False)
+        espera += self.ms_por_token * _tokens(texto) / 1000
+
+        if not streaming:
+            time.sleep(espera)
+            yield texto
+            return
+
+        tamanho = -(-len(texto) // self.pedacos)
+        for i in range(self.pedacos):
+            time.sleep(espera / self.pedacos)
+            yield texto[i * tamanho:(i + 1) * tamanho]
+
+
+# ---------- MONGO ----------
+
+class _ResultadoInsert:
+    def __init__(self, inserted_id: Any):
+        self.inserted_id = inserted_id
+
+
+class _ResultadoUpdate:
+    def __init__(self, matched_count: int):
+        self.matched_count = matched_count
+
+
+class ChaveDuplicadaFalsa(Exception):
+    # mesmo código do DuplicateKeyError do pymongo
+    code = 11000
+
+
+def _casa(doc: Dict[str, Any], filtro: Dict[str, Any]) -> bool:
+    for campo, cond in filtro.items():
+        valor = doc.get(campo)
+        if isinstance(cond, dict):
+            for op, alvo in cond.items():
+                if op == "$gt" and not (valor is not None and valor > alvo):
+                    return False
+                if op == "$gte" and not (valor is not None and valor >= alvo):
+                    return False
+                if op == "$lt" and not (valor is not None and valor < alvo):
+                    return False
+                if op == "$in" and valor not in alvo:
+                    return False
+                if op == "$ne" and valor == alvo:
+                    return False
+        elif valor != cond:
+            return False
+    return True
+
+
+def _projetar(doc: Dict[str, Any], projecao: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    if projecao and any(v for c, v in projecao.items() if c != "_id"):
+        # projeção de inclusão: só os campos pedidos (+ _id, a não ser que excluído)
+        campos = {c for c, v in projecao.items() if v}
+        if projecao.get("_id", 1):
+            campos.add("_id")
+        return {c: copy.deepcopy(v) for c, v in doc.items() if c in campos}
+    doc = copy.deepcopy(doc)
+    if projecao:
+        for campo, incluir in projecao.items():
+            if not incluir:
+                doc.pop(campo, None)
+    return doc
+
+
+def _atribuir(doc: Dict[str, Any], caminho: str, valor: Any, somar: bool = False) -> None:
+    # "a.b.c" como no Mongo
+    *pais, campo = caminho.split(".")
+    for p in pais:
+        doc = doc.setdefault(p, {})
+    doc[campo] = doc.get(campo, 0) + valor if somar else copy.deepcopy(valor)
+
+
+def _aplicar(doc: Dict[str, Any], atualizacao: Dict[str, Any], inserindo: bool) -> None:
+    for op, campos in atualizacao.items():
+        if op == "$setOnInsert" and not inserindo:
+            continue
+        for caminho, valor in campos.items():
+            if op in ("$set", "$setOnInsert"):
+                _atribuir(doc, caminho, valor)
+            elif op == "$inc":
+                _atribuir(doc, caminho, valor, somar=True)
+            elif op == "$min":
+                atual = doc.get(caminho)
+                if atual is None or valor < atual:
+                    _atribuir(doc, caminho, valor)
+            else:
+                raise NotImplementedError(op)
+
+
+class CursorFalso:
+    def __init__(self, docs: List[Dict[str, Any]], projecao: Optional[Dict[str, int]]):
+        self._docs = docs
+        self._projecao = projecao
+        self._limite = 0
+
+    def sort(self, campo: str, direcao: int = 1) -> "CursorFalso":
+        self._docs.sort(key=lambda d: (d.get(campo) is None, d.get(campo)), reverse=direcao < 0)
+        return self
+
+    def batch_size(self, n: int) -> "CursorFalso":
+        return self
+
+    def limit(self, n: int) -> "CursorFalso":
+        self._limite = n
+        return self
+
+    def __iter__(self):
+        docs = self._docs[: self._limite] if self._limite else self._docs
+        return (_projetar(d, self._projecao) for d in docs)
+
+
+class ColecaoFalsa:
+    def __init__(self, nome: str):
+        self.name = nome
+        self._docs: Dict[Any, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.indices: List[Any] = []
+        self._unicos: Dict[str, set] = {}  # campo com índice único -> valores vistos
+
+    def create_index(self, chaves, **kwargs) -> str:
+        self.indices.append((chaves, kwargs))
+        if kwargs.get("unique") and isinstance(chaves, str):
+            self._unicos.setdefault(chaves, {d[chaves] for d in self._docs.values() if d.get(chaves) is not None})
+        return str(chaves)
+
+    def _viola_unico(self, doc: Dict[str, Any]) -> bool:
+        # índice parcial: só documentos que têm o campo
+        return any(doc.get(campo) is not None and doc[campo] in valores for campo, valores in self._unicos.items())
+
+    def _indexar(self, doc: Dict[str, Any]) -> None:
+        for campo, valores in self._unicos.items():
+            if doc.get(campo) is not None:
+                valores.add(doc[campo])
+
+    def insert_one(self, doc: Dict[str, Any]) -> _ResultadoInsert:
+        with self._lock:
+            if doc.get("_id") in self._docs or self._viola_unico(doc):
+                raise ChaveDuplicadaFalsa(f"E11000 duplicate key em {self.name}")
+            if "_id" not in doc:
+                doc["_id"] = f"oid{next(self._ids):024d}"
+            self._docs[doc["_id"]] = copy.deepcopy(doc)
+            self._indexar(doc)
+        return _ResultadoInsert(doc["_id"])
+
+    def insert_many(self, docs: List[Dict[str, Any]], ordered: bool = True) -> None:
+        # sem BulkWriteError: _id (ou campo único) repetido é ignorado, como o reenvio do diário espera
+        with self._lock:
+            for doc in docs:
+                if "_id" not in doc:
+                    doc["_id"] = f"oid{next(self._ids):024d}"
+                if doc["_id"] in self._docs or self._viola_unico(doc):
+                    continue
+                self._docs[doc["_id"]] = copy.deepcopy(doc)
+                self._indexar(doc)
+
+    def replace_one(self, filtro: Dict[str, Any], doc: Dict[str, Any], upsert: bool = False) -> _ResultadoUpdate:
+        with self._lock:
+            alvo = next((k for k, d in self._docs.items() if _casa(d, filtro)), None)
+            if alvo is None and not upsert:
+                return _ResultadoUpdate(0)
+            novo = copy.deepcopy(doc)
+            novo.setdefault("_id", alvo if alvo is not None else filtro.get("_id", f"oid{next(self._ids):024d}"))
+            if alvo is not None and alvo != novo["_id"]:
+                del self._docs[alvo]
+            self._docs[novo["_id"]] = novo
+        return _ResultadoUpdate(0 if alvo is None else 1)
+
+    def _atualizar(self, filtro: Dict[str, Any], atualizacao: Dict[str, Any], upsert: bool) -> Optional[Dict[str, Any]]:
+        # chamado com o lock
+        alvo = next((d for d in self._docs.values() if _casa(d, filtro)), None)
+        if alvo is None:
+            if not upsert:
+                return None
+            alvo = {k: v for k, v in filtro.items() if not isinstance(v, dict)}
+            alvo.setdefault("_id", f"oid{next(self._ids):024d}")
+            _aplicar(alvo, atualizacao, inserindo=True)
+            self._docs[alvo["_id"]] = alvo
+        else:
+            _aplicar(alvo, atualizacao, inserindo=False)
+        return alvo
+
+    def update_one(self, filtro: Dict[str, Any], atualizacao: Dict[str, Any], upsert: bool = False) -> None:
+        with self._lock:
+            self._atualizar(filtro, atualizacao, upsert)
+
+    def bulk_write(self, operacoes: List[Any], ordered: bool = True) -> None:
+        # aceita as UpdateOne do pymongo (ou qualquer objeto com _filter/_doc/_upsert)
+        with self._lock:
+            for op in operacoes:
+                self._atualizar(op._filter, op._doc, op._upsert)
+
+    def find_one_and_update(self, filtro: Dict[str, Any], atualizacao: Dict[str, Any], projection=None,
+                            upsert: bool = False, return_document: bool = False):
+        with self._lock:
+            antes = next((copy.deepcopy(d) for d in self._docs.values() if _casa(d, filtro)), None)
+            depois = self._atualizar(filtro, atualizacao, upsert)
+            doc = depois if return_document else antes
+            return _projetar(doc, projection) if doc is not None else None
+
+    def find_one_and_delete(self, filtro: Dict[str, Any]):
+        with self._lock:
+            alvo = next((k for k, d in self._docs.items() if _casa(d, filtro)), None)
+            return self._docs.pop(alvo) if alvo is not None else None
+
+    def delete_many(self, filtro: Dict[str, Any]) -> None:
+        with self._lock:
+            for k in [k for k, d in self._docs.items() if _casa(d, filtro)]:
+                del self._docs[k]
+
+    def find(self, filtro: Optional[Dict[str, Any]] = None, projecao: Optional[Dict[str, int]] = None) -> CursorFalso:
+        with self._lock:
+            docs = [d for d in self._docs.values() if _casa(d, filtro or {})]
+        return CursorFalso(docs, projecao)
+
+    def find_one(self, filtro: Optional[Dict[str, Any]] = None, projecao: Optional[Dict[str, int]] = None, sort=None):
+        filtro = filtro or {}
+        if sort:
+            docs = self.find(filtro, projecao).sort(*sort[0]).limit(1)
+            return next(iter(docs), None)
+        with self._lock:
+            if set(filtro) == {"_id"} and not isinstance(filtro["_id"], dict):
+                doc = self._docs.get(filtro["_id"])
+            else:
+                doc = next((d for d in self._docs.values() if _casa(d, filtro)), None)
+        return _projetar(doc, projecao) if doc is not None else None
+
+    def count_documents(self, filtro: Dict[str, Any], limit: int = 0) -> int:
+        with self._lock:
+            n = sum(1 for d in self._docs.values() if _casa(d, filtro))
+        return min(n, limit) if limit else n
+
+    def estimated_document_count(self) -> int:
+        return len(self._docs)
+
+
+class BancoFalso:
+    def __init__(self, nome: str):
+        self.name = nome
+        self._colecoes: Dict[str, ColecaoFalsa] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, nome: str) -> ColecaoFalsa:
+        with self._lock:
+            if nome not in self._colecoes:
+                self._colecoes[nome] = ColecaoFalsa(nome)
+            return self._colecoes[nome]
+
+
+class _AdminFalso:
+    def command(self, nome: str, *args, **kwargs) -> Dict[str, Any]:
+        return {"ok": 1.0}
+
+
+class MongoFalso:
+    def __init__(self):
+        self._bancos: Dict[str, BancoFalso] = {}
+        self.admin = _AdminFalso()
+
+    def __getitem__(self, nome: str) -> BancoFalso:
+        if nome not in self._bancos:
+            self._bancos[nome] = BancoFalso(nome)
+        return self._bancos[nome]
+
+    def close(self) -> None:
+        pass
+
+
+def instalar(latencia_ms: float = 800, jitter_ms: float = 200, taxa_erro: float = 0.0,
+             pedacos: int = 8, mongo: bool = True, semente: Optional[int] = None,
+             ms_por_token: float = 0.0) -> GeminiFalso:
+    """
+    Liga o Gemini falso (e, se mongo=True, o Mongo em processo) na app.
+    Chame antes de importar app.main para os repositórios escolherem o backend Mongo.
+    """
+    from app import db, llm
+
+    gemini = GeminiFalso(latencia_ms, jitter_ms, taxa_erro, pedacos, semente, ms_por_token)
+    llm.usar_cliente(gemini)
+    if mongo:
+        db.usar_cliente(MongoFalso())
+    return gemini
@@ -0,0 +1,40 @@
+# bench/servidor_fake.py
+"""
+Sobe a API com o Gemini falso e o Mongo em processo (bench/fakes.py).
+
+Uso (dentro de ia_iot_gs):
+    python -m bench.servidor_fake --porta 8010 --latencia-ms 800 --taxa-erro 0.02
+    python -m bench.servidor_fake --mongo-real   # usa o MONGO_URL (ex.: mongod local)
+
+A carga vem toda de 127.0.0.1, então a admissão (app/admissao.py) fica
+desligada, a não ser que ADMISSAO_ATIVA venha no ambiente
+(bench/bench_admissao.py liga e desliga explicitamente).
+"""
+import argparse
+import os
+
+# antes de importar o app: app/admissao.py lê o ambiente no import
+os.environ.setdefault("ADMISSAO_ATIVA", "0")
+
+from bench import fakes  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--porta", type=int, default=8010)
+    parser.add_argument("--latencia-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    parser.add_argument("--mongo-real", action="store_true", help="não usa o Mongo em processo")
+    args = parser.parse_args()
+
+    fakes.instalar(args.latencia_ms, args.jitter_ms, args.taxa_erro, mongo=not args.mongo_real)
+
+    import uvicorn
+    from app.main import app
+
+    uvicorn.run(app, host="127.0.0.1", port=args.porta, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()